@@ -0,0 +1,3 @@
+"""
+Benchmarks for the TruSTAR Python SDK.
+"""
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+Benchmark encoding and decoding of large report and indicator payloads with each installed json codec.
+
+Run
+python -m benchmarks.bench_codec [--indicators 1000] [--report-kb 500] [--repeat 20]
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import string
+import timeit
+
+from trustar import Indicator, Page, Report, Tag
+from trustar.codec import CODECS, available_codecs
+
+
+def random_text(length):
+    return ''.join(random.choice(string.ascii_letters + '  \n') for _ in range(length))
+
+
+def make_indicator_page(count):
+    """
+    Builds the dictionary representation of a page of indicators with fat metadata.
+    """
+
+    indicators = [Indicator(value="%d.%d.%d.%d" % tuple(random.randint(0, 255) for _ in range(4)),
+                            type='IP',
+                            priority_level='HIGH',
+                            correlation_count=random.randint(0, 1000),
+                            whitelisted=False,
+                            first_seen=1500000000000 + i,
+                            last_seen=1600000000000 + i,
+                            sightings=random.randint(1, 100),
+                            source="benchmark",
+                            notes=random_text(300),
+                            tags=[Tag(name="tag_%d" % j, id="guid-%d" % j, enclave_id="enclave") for j in range(5)],
+                            enclave_ids=["enclave-1", "enclave-2"])
+                  for i in range(count)]
+    return Page(items=indicators, page_number=0, page_size=count, total_elements=count * 10, has_next=True).to_dict()
+
+
+def make_report(body_kb):
+    """
+    Builds the dictionary representation of a report with a large body, like one extracted from a PDF.
+    """
+
+    return Report(title="Benchmark report",
+                  body=random_text(body_kb * 1024),
+                  time_began=1500000000000,
+                  external_id="bench-1",
+                  enclave_ids=["enclave-1"]).to_dict()
+
+
+def bench(payloads, codec_names, repeat):
+    """
+    :return: A list of ``(payload name, codec name, operation, seconds per call)`` tuples.
+    """
+
+    results = []
+    for payload_name, payload in payloads:
+        encoded = CODECS['json']().dumps(payload)
+        for codec_name in codec_names:
+            codec = CODECS[codec_name]()
+            for op, func in [('encode', lambda: codec.dumps(payload)), ('decode', lambda: codec.loads(encoded))]:
+                seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+                results.append((payload_name, codec_name, op, seconds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the json codecs on large SDK payloads.")
+    parser.add_argument('--indicators', type=int, default=1000, help="number of indicators in the page")
+    parser.add_argument('--report-kb', type=int, default=500, help="size of the report body in KB")
+    parser.add_argument('--repeat', type=int, default=20, help="number of timed repetitions (best is reported)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    payloads = [
+        ("indicator page (%d)" % args.indicators, make_indicator_page(args.indicators)),
+        ("report (%d KB)" % args.report_kb, make_report(args.report_kb))
+    ]
+
+    print("%-24s %-10s %-8s %12s" % ("payload", "codec", "op", "ms"))
+    for payload_name, codec_name, op, seconds in bench(payloads, available_codecs(), args.repeat):
+        print("%-24s %-10s %-8s %12.3f" % (payload_name, codec_name, op, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Measure how long it takes a fresh interpreter to import the SDK, and fail if it exceeds a budget.  Short-lived
+processes (i.e. one per alert) pay this on every start.
+
+Run
+python -m benchmarks.bench_import [--repeat 10] [--budget-ms 50] [--client-budget-ms 250] [--profile]
+"""
+
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+
+STATEMENTS = [
+    ('import trustar', "import trustar"),
+    ('from trustar import TruStar', "from trustar import TruStar")
+]
+
+TIMING_SCRIPT = "import time; start = time.time(); %s; print(time.time() - start)"
+
+# modules that should only be imported when they are first needed
+DEFERRED_MODULES = ['yaml', 'dateutil', 'pytz', 'tzlocal', 'configparser', 'logging.config', 'requests',
+                    'future.standard_library']
+
+
+def time_statement(statement, repeat):
+    """
+    :return: The best time, in seconds, that ``statement`` took in a fresh interpreter.
+    """
+
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', TIMING_SCRIPT % statement])
+        times.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    return min(times)
+
+
+def get_eager_modules():
+    """
+    :return: The deferred modules that are nonetheless loaded by ``import trustar``.
+    """
+
+    script = "import sys, trustar; print(' '.join(m for m in %r if m in sys.modules))" % DEFERRED_MODULES
+    return subprocess.check_output([sys.executable, '-c', script]).decode('utf-8').split()
+
+
+def profile(statement, top):
+    """
+    Prints the modules with the highest cumulative import time, using ``python -X importtime``.
+    """
+
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', statement],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line[len('import time:'):].split('|')
+        if module.strip() == 'site':
+            # everything so far was imported by the interpreter's startup, not the statement
+            rows = []
+            continue
+        rows.append((int(cumulative_us), module.rstrip()))
+    print("\nslowest imports for '%s' (cumulative ms):" % statement)
+    for cumulative_us, module in sorted(rows, reverse=True)[:top]:
+        print("%10.1f %s" % (cumulative_us / 1000.0, module))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure SDK import time against a budget.")
+    parser.add_argument('--repeat', type=int, default=10, help="number of fresh interpreters (best is kept)")
+    parser.add_argument('--budget-ms', type=float, default=50, help="budget for 'import trustar'")
+    parser.add_argument('--client-budget-ms', type=float, default=250,
+                        help="budget for 'from trustar import TruStar'")
+    parser.add_argument('--profile', action='store_true', help="show the slowest imports")
+    args = parser.parse_args()
+
+    budgets = [args.budget_ms, args.client_budget_ms]
+    failures = []
+
+    for (name, statement), budget in zip(STATEMENTS, budgets):
+        ms = time_statement(statement, args.repeat) * 1000
+        over = ms > budget
+        print("%-30s %8.1f ms (budget %.0f ms) %s" % (name, ms, budget, "OVER BUDGET" if over else ""))
+        if over:
+            failures.append(name)
+        if args.profile:
+            profile(statement, top=15)
+
+    eager = get_eager_modules()
+    if eager:
+        print("modules imported eagerly by 'import trustar': %s" % ', '.join(eager))
+        failures.append('deferred modules')
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the SDK's hot paths against a local |FakeTruStarServer|: pagination throughput, report submission, model
+conversion, import time, and peak memory of a large export.  Results are written as json and compared against a
+stored baseline; the exit status is non-zero if any metric regressed by more than the tolerance.
+
+Run
+python -m benchmarks.bench_suite [--output results.json] [--baseline benchmarks/baseline.json] [--tolerance 0.25]
+
+To record a new baseline (baselines are machine-specific, so record one on the machine that runs the comparison)
+python -m benchmarks.bench_suite --save-baseline benchmarks/baseline.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from trustar import Indicator, Page, Report, Tag, TruStar
+from trustar.codec import get_codec
+from trustar.fake_server import DAY, FakeTruStarServer, now_millis
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+IMPORT_TIME_SCRIPT = "import time; start = time.time(); import trustar; print(time.time() - start)"
+
+
+class Metric(object):
+
+    def __init__(self, name, value, unit, higher_is_better):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def to_dict(self):
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better}
+
+
+def throughput(name, func, unit, repeat):
+    """
+    Times a function returning a number of items processed.
+
+    :return: A |Metric| of the best rate of items per second over ``repeat`` runs.
+    """
+
+    rates = []
+    for _ in range(repeat):
+        start = time.time()
+        count = func()
+        rates.append(count / (time.time() - start))
+    return Metric(name, max(rates), unit, higher_is_better=True)
+
+
+def bench_pagination(ts, server, repeat):
+    from_time = server.oldest
+    to_time = server.newest
+
+    return [
+        throughput('get_indicators', lambda: sum(1 for _ in ts.get_indicators(from_time=from_time, to_time=to_time,
+                                                                              page_size=1000)),
+                   'items/s', repeat),
+        throughput('get_reports', lambda: sum(1 for _ in ts.get_reports(is_enclave=True, from_time=from_time,
+                                                                        to_time=to_time)),
+                   'items/s', repeat),
+        throughput('search_reports', lambda: sum(1 for _ in ts.search_reports("Report")), 'items/s', repeat)
+    ]
+
+
+def bench_submit(ts, count, repeat):
+    def submit():
+        for i in range(count):
+            ts.submit_report(Report(title="Submitted %d" % i, body="Seen 10.0.%d.%d" % (i // 256, i % 256),
+                                    is_enclave=True))
+        return count
+
+    return [throughput('submit_report', submit, 'reports/s', repeat)]
+
+
+def bench_page_conversion(count, repeat):
+    indicators = [Indicator(value="10.0.%d.%d" % (i // 256, i % 256), type='IP', priority_level='HIGH',
+                            correlation_count=i, whitelisted=False, first_seen=1500000000000 + i,
+                            last_seen=1600000000000 + i, sightings=i, source="benchmark", notes="notes",
+                            tags=[Tag(name="tag", id="guid", enclave_id="enclave")], enclave_ids=["enclave"])
+                  for i in range(count)]
+    page = Page(items=indicators, page_number=0, page_size=count, total_elements=count, has_next=False)
+    page_dict = page.to_dict()
+
+    from_dict = min(timeit.repeat(lambda: Page.from_dict(page_dict, content_type=Indicator), number=1, repeat=repeat))
+    to_dict = min(timeit.repeat(page.to_dict, number=1, repeat=repeat))
+
+    return [
+        Metric('page_from_dict', from_dict / count * 1e6, 'us/item', higher_is_better=False),
+        Metric('page_to_dict', to_dict / count * 1e6, 'us/item', higher_is_better=False)
+    ]
+
+
+def bench_import_time(repeat):
+    """
+    Measures ``import trustar`` in fresh interpreters, so that nothing is already imported.
+    """
+
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_TIME_SCRIPT])
+        times.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    return [Metric('import_time', min(times) * 1000, 'ms', higher_is_better=False)]
+
+
+def bench_export_memory(ts, server):
+    """
+    Measures the peak memory allocated while exporting every indicator.  Since the server runs in the same process,
+    this includes the memory it uses to render each page.
+    """
+
+    if tracemalloc is None:
+        return []
+
+    tracemalloc.start()
+    try:
+        for _ in ts.get_indicators(from_time=server.oldest, to_time=server.newest, page_size=1000):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [Metric('export_peak_memory', peak / 1024.0 / 1024.0, 'MB', higher_is_better=False)]
+
+
+def run(args):
+    metrics = []
+
+    with FakeTruStarServer() as server:
+        server.generate(reports=args.reports, indicators_per_report=args.indicators_per_report, span=DAY)
+        ts = TruStar(config=server.config)
+
+        metrics.extend(bench_pagination(ts, server, args.repeat))
+        metrics.extend(bench_export_memory(ts, server))
+        metrics.extend(bench_submit(ts, args.submissions, args.repeat))
+
+    metrics.extend(bench_page_conversion(args.page_size, args.repeat))
+    metrics.extend(bench_import_time(args.repeat))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'codec': get_codec().name,
+            'timestamp': now_millis()
+        },
+        'parameters': {
+            'reports': args.reports,
+            'indicators_per_report': args.indicators_per_report,
+            'submissions': args.submissions,
+            'page_size': args.page_size
+        },
+        'metrics': dict((metric.name, metric.to_dict()) for metric in metrics)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: A list of ``(name, value, baseline value, change, regressed)`` tuples, where ``change`` is the relative
+        change, signed so that positive is an improvement.
+    """
+
+    comparison = []
+    for name, metric in sorted(results['metrics'].items()):
+        base = baseline.get('metrics', {}).get(name)
+        if base is None or not base['value']:
+            continue
+        change = (metric['value'] - base['value']) / float(base['value'])
+        if not metric['higher_is_better']:
+            change = -change
+        comparison.append((name, metric['value'], base['value'], change, change < -tolerance))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SDK against a local fake server.")
+    parser.add_argument('--reports', type=int, default=500, help="number of reports on the server")
+    parser.add_argument('--indicators-per-report', type=int, default=20, help="indicators in each report")
+    parser.add_argument('--submissions', type=int, default=100, help="number of reports to submit")
+    parser.add_argument('--page-size', type=int, default=1000, help="items in the page used for conversion costs")
+    parser.add_argument('--repeat', type=int, default=5, help="repetitions of each benchmark (best is kept)")
+    parser.add_argument('--output', help="file to write the results to")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline results to compare with")
+    parser.add_argument('--save-baseline', metavar='PATH', help="write the results as a new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="relative change beyond which a metric counts as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    print("%-20s %14s %14s %10s" % ("metric", "value", "baseline", "change"))
+
+    baseline = {}
+    if not args.save_baseline and args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    comparison = dict((c[0], c) for c in compare(results, baseline, args.tolerance))
+    regressions = []
+    for name, metric in sorted(results['metrics'].items()):
+        if name in comparison:
+            _, value, base, change, regressed = comparison[name]
+            print("%-20s %14.3f %14.3f %+9.1f%% %s %s" % (name, value, base, change * 100, metric['unit'],
+                                                         "REGRESSION" if regressed else ""))
+            if regressed:
+                regressions.append(name)
+        else:
+            print("%-20s %14.3f %14s %10s %s" % (name, metric['value'], "-", "-", metric['unit']))
+
+    if regressions:
+        print("\n%d metric(s) regressed by more than %d%%: %s"
+              % (len(regressions), args.tolerance * 100, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
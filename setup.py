@@ -29,7 +29,9 @@ setup(
                       'unicodecsv',
                       'tzlocal',
                       'PyYAML',
-                      'six'
+                      'six',
+                      'futures; python_version < "3"',
+                      'ipaddress; python_version < "3"'
                       ],
     include_package_data=True,
     scripts=glob('trustar/examples/**/*.py') + glob('trustar/examples/*.py'),
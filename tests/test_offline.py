@@ -0,0 +1,1558 @@
+"""
+Tests that exercise the SDK without contacting the TruSTAR API.
+"""
+
+import gzip
+import io
+import json
+import os
+import requests
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from trustar import *
+from trustar.cache import MemoryCacheStorage, ResponseCache, ValidatorCache
+from trustar.codec import available_codecs, create_codec
+from trustar.compression import TransferStats, get_body_size, gzip_compress
+from trustar.disk_cache import SQLiteCacheStorage
+from trustar.fake_server import FakeTruStarServer
+from trustar.hooks import Hooks, RequestEvent, SlowRequestLogger
+from trustar.batching import MicroBatcher
+from trustar.bloom import BloomFilter, IndicatorFilter
+from trustar.circuit_breaker import CircuitBreaker
+from trustar.concurrency import AdaptiveConcurrencyLimiter
+from trustar.deadline import CancellationToken, Cancelled, DeadlineExceeded
+from trustar.hedging import HedgeBudget, Hedger
+from trustar.metrics import Histogram, Metrics
+from trustar.rate_limit import (FileTokenBucket, PriorityScheduler, RateLimitCoordinator, RemoteTokenBucket,
+                                TokenBucket)
+from trustar.registry import ClientRegistry
+from trustar.whitelist import WhitelistMatcher
+from trustar.single_flight import SingleFlight
+from trustar.utils import get_endpoint_template, get_request_key
+from trustar.streaming import JsonStreamDecoder
+
+
+def chunked(data, size):
+    """
+    Splits a byte string into chunks of the given size.
+    """
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class FakeResponse(object):
+    """
+    Stands in for a ``requests`` response with a streamed body.
+    """
+
+    def __init__(self, body, chunk_size=7):
+        self.content = body
+        self.encoding = None
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size=1):
+        return iter(chunked(self.content, self.chunk_size))
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class JsonStreamDecoderTests(unittest.TestCase):
+
+    def test_decode_page(self):
+        page = {
+            'pageNumber': 3,
+            'items': [{'value': u'\u00e9vil.com', 'n': 12345}, {'value': '1.2.3.4', 'tags': [1, 2.5, None]}, 7],
+            'hasNext': False
+        }
+        body = json.dumps(page, ensure_ascii=False).encode('utf-8')
+
+        # chunk sizes of 1 split every number, string, and multi-byte character
+        for size in [1, 2, 5, 64, len(body)]:
+            decoder = JsonStreamDecoder(chunked(body, size))
+            self.assertEqual(list(decoder), page['items'])
+            self.assertTrue(decoder.finished)
+            self.assertEqual(decoder.fields, {'pageNumber': 3, 'hasNext': False})
+
+    def test_decode_top_level_array(self):
+        body = b' [ 1, {"a": [true, false]} , "x" ] '
+        self.assertEqual(list(JsonStreamDecoder(chunked(body, 3))), [1, {'a': [True, False]}, 'x'])
+
+    def test_decode_empty(self):
+        self.assertEqual(list(JsonStreamDecoder([b'{"items": [], "totalElements": 0}'])), [])
+        self.assertEqual(list(JsonStreamDecoder([b'{}'])), [])
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            list(JsonStreamDecoder([b'{"items": [1, 2}']))
+
+    def test_large_item(self):
+        item = {'body': 'x' * 1000000, 'n': 1}
+        body = json.dumps({'items': [item, 2]}).encode('utf-8')
+        decoder = JsonStreamDecoder(chunked(body, 8192))
+        attempts = []
+        raw_decode = decoder._json_decoder.raw_decode
+
+        def count(*args):
+            attempts.append(1)
+            return raw_decode(*args)
+
+        decoder._json_decoder.raw_decode = count
+        self.assertEqual(list(decoder), [item, 2])
+        # the item is parsed again as it doubles, not once per chunk
+        self.assertLess(len(attempts), 20)
+
+
+class StreamedPageTests(unittest.TestCase):
+
+    BODY = json.dumps({
+        'items': [{'value': 'a.com', 'indicatorType': 'URL'}, {'value': 'b.com', 'indicatorType': 'URL'}],
+        'pageNumber': 0,
+        'pageSize': 2,
+        'totalElements': 5,
+        'hasNext': True
+    }).encode('utf-8')
+
+    def test_iterate(self):
+        page = Page.from_response(FakeResponse(self.BODY), content_type=Indicator, stream=True)
+        self.assertEqual([i.value for i in page], ['a.com', 'b.com'])
+        self.assertTrue(page.has_more_pages())
+        self.assertEqual(page.get_last_item().value, 'b.com')
+        with self.assertRaises(ValueError):
+            list(page)
+
+    def test_metadata_before_iteration(self):
+        page = Page.from_response(FakeResponse(self.BODY), content_type=Indicator, stream=True)
+        self.assertEqual(page.total_elements, 5)
+        self.assertEqual(len(page), 2)
+        self.assertEqual(page[1].value, 'b.com')
+        self.assertEqual(page.to_dict(), Page.from_response(FakeResponse(self.BODY), Indicator).to_dict())
+
+
+class JsonCodecTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        obj = {'value': u'\u00e9vil.com', 'tags': [{'name': 'a'}], 'count': 3, 'score': 1.5, 'whitelisted': None}
+        for name in available_codecs():
+            codec = create_codec(name)
+            encoded = codec.dumps(obj)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(codec.loads(encoded), obj)
+            self.assertEqual(json.loads(codec.dumps_pretty(obj)), obj)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            create_codec('nope')
+
+
+class CompressionTests(unittest.TestCase):
+
+    def test_gzip_compress(self):
+        body = u'{"body": "\u00e9vil"}' * 100
+        compressed = gzip_compress(body)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), body.encode('utf-8'))
+        self.assertEqual(get_body_size(body), len(body.encode('utf-8')))
+        self.assertIsNone(get_body_size({'form': 'data'}))
+
+    def test_transfer_stats(self):
+        stats = TransferStats()
+        stats.record_request("POST reports", 1000, 200)
+        stats.record_response("POST reports", 50, None)
+        stats.record_response("POST reports", 3000, 600)
+        counters = stats.snapshot()["POST reports"]
+        self.assertEqual((counters['requests'], counters['responses']), (1, 2))
+        self.assertEqual(counters['request_bytes_saved'], 800)
+        self.assertEqual((counters['response_bytes'], counters['response_bytes_received']), (3050, 650))
+        self.assertEqual(counters['response_bytes_saved'], 2400)
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_request_compression(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, compress_requests=True, compression_threshold=1024))
+            body = "Nothing to see here. " * 500
+            report = ts.submit_report(Report(title="Large", body=body, enclave_ids=['enclave']))
+            ts.submit_report(Report(title="Small", body="Tiny", enclave_ids=['enclave']))
+
+            large, small = [r for r in server.requests if r.endpoint == "POST reports"]
+            self.assertEqual(large.headers.get('Content-Encoding'), 'gzip')
+            self.assertNotIn('Content-Encoding', small.headers)
+            self.assertEqual(ts.get_report_details(report.id).body, body)
+
+            counters = ts.metrics.snapshot()['transfer']["POST reports"]
+            self.assertEqual(counters['requests'], 2)
+            self.assertLess(counters['request_bytes_sent'], counters['request_bytes'] / 10)
+            self.assertEqual(counters['request_bytes_saved'], counters['request_bytes'] - counters['request_bytes_sent'])
+
+    def test_response_compression(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            for i in range(200):
+                server.add_indicator("10.0.%d.%d" % (i // 256, i % 256), indicator_type='IP')
+
+            # streamed pages are decoded as they arrive, and counted once consumed
+            self.assertEqual(len(list(ts.get_indicators(page_size=1000))), 200)
+            self.assertIn('gzip', server.requests[-1].headers['Accept-Encoding'])
+
+            counters = ts.metrics.snapshot()['transfer']["GET indicators"]
+            self.assertEqual(counters['responses'], 1)
+            self.assertLess(counters['response_bytes_received'], counters['response_bytes'])
+            self.assertEqual(counters['response_bytes_saved'],
+                             counters['response_bytes'] - counters['response_bytes_received'])
+
+            # small responses aren't compressed, so nothing is saved
+            ts.ping()
+            self.assertEqual(ts.metrics.snapshot()['transfer']["GET ping"]['response_bytes_saved'], 0)
+
+    def test_early_exit(self):
+        # uncompressed, so that the page takes several chunks
+        with FakeTruStarServer(compress_responses=False) as server:
+            ts = TruStar(config=server.config)
+            for i in range(1000):
+                server.add_indicator("10.0.%d.%d" % (i // 256, i % 256), indicator_type='IP')
+            responses = []
+            ts.hooks.register('post_response', lambda event: responses.append(event.response))
+
+            # a streamed page that isn't read to the end is closed, and what was read of it is counted
+            indicators = ts.get_indicators(page_size=1000)
+            next(indicators)
+            indicators.close()
+            self.assertTrue(responses[-1].raw.closed)
+            self.assertLess(responses[-1].raw.tell(), int(responses[-1].headers['Content-Length']))
+            self.assertEqual(ts.metrics.snapshot()['transfer']["GET indicators"]['responses'], 1)
+            self.assertEqual(len(list(ts.get_indicators(page_size=1000))), 1000)
+
+
+class RequestKeyTests(unittest.TestCase):
+
+    def test_endpoint_template(self):
+        self.assertEqual(get_endpoint_template("reports/abc/tags/def"), "reports/{id}/tags/{tag_id}")
+        self.assertEqual(get_endpoint_template("reports/search"), "reports/search")
+        self.assertEqual(get_endpoint_template("indicators/evil.com/tags"), "indicators/{id}/tags")
+
+    def test_request_key(self):
+        self.assertEqual(get_request_key("get", "/indicators/metadata", {'values': ['a', 'b'], 'types': None}),
+                         get_request_key("GET", "indicators/metadata", {'values': ['a', 'b']}))
+        self.assertNotEqual(get_request_key("GET", "indicators/metadata", {'values': ['a', 'b']}),
+                            get_request_key("GET", "indicators/metadata", {'values': ['b', 'a']}))
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def test_concurrent_calls_coalesce(self):
+        single_flight = SingleFlight()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', slow))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(single_flight.stats(), {'hits': 4, 'misses': 1, 'in_flight': 0})
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight()
+        with self.assertRaises(KeyError):
+            single_flight.do('key', lambda: {}['missing'])
+        self.assertEqual(single_flight.do('key', lambda: 1), 1)
+
+    def test_deadlines_are_not_shared(self):
+        single_flight = SingleFlight()
+        results = []
+
+        def cancelled():
+            time.sleep(0.2)
+            raise DeadlineExceeded("Deadline exceeded")
+
+        def slow():
+            time.sleep(0.5)
+            return 'result'
+
+        # a follower whose leader's deadline passed makes the call itself
+        leader = threading.Thread(target=lambda: self.assertRaises(DeadlineExceeded, single_flight.do, 'key', cancelled))
+        leader.start()
+        time.sleep(0.05)
+        self.assertEqual(single_flight.do('key', lambda: 'retried'), 'retried')
+        leader.join()
+
+        # a follower stops waiting by its own deadline
+        leader = threading.Thread(target=lambda: results.append(single_flight.do('key', slow)))
+        leader.start()
+        time.sleep(0.05)
+        start = time.time()
+        self.assertRaises(DeadlineExceeded, single_flight.do, 'key', slow, cancellation=CancellationToken(timeout=0.1))
+        self.assertLess(time.time() - start, 0.3)
+        leader.join()
+        self.assertEqual(results, ['result'])
+
+    def test_coalesced_deadline(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, coalesce_requests=True))
+            report_id = server.add_report("Report", "Seen 10.0.0.1")['id']
+            server.endpoint_latency["GET reports/{id}"] = 0.5
+
+            def leader():
+                with ts.deadline(0.2):
+                    self.assertRaises(DeadlineExceeded, ts.get_report_details, report_id)
+
+            thread = threading.Thread(target=leader)
+            thread.start()
+            time.sleep(0.05)
+            self.assertEqual(ts.get_report_details(report_id).id, report_id)
+            thread.join()
+
+
+def make_response(status_code=200, content=b'{}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = ResponseCache(storage=MemoryCacheStorage(max_size=2),
+                                   ttls={'reports/{id}': 60},
+                                   negative_ttl=10,
+                                   clock=lambda: self.now)
+
+    def key(self, path):
+        return get_request_key("GET", path)
+
+    def test_ttl(self):
+        self.cache.set(self.key("reports/a"), "reports/a", make_response(content=b'"a"'))
+        self.assertEqual(self.cache.get(self.key("reports/a")).content, b'"a"')
+        self.now += 61
+        self.assertIsNone(self.cache.get(self.key("reports/a")))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_uncacheable(self):
+        self.assertFalse(self.cache.is_cacheable("reports/search"))
+        self.cache.set(self.key("reports/a"), "reports/a", make_response(status_code=500))
+        self.assertIsNone(self.cache.get(self.key("reports/a")))
+
+    def test_negative_caching(self):
+        self.cache.set(self.key("reports/missing"), "reports/missing", make_response(status_code=404))
+        self.assertEqual(self.cache.get(self.key("reports/missing")).status_code, 404)
+        self.now += 11
+        self.assertIsNone(self.cache.get(self.key("reports/missing")))
+
+    def test_lru_eviction(self):
+        for path in ["reports/a", "reports/b"]:
+            self.cache.set(self.key(path), path, make_response())
+        self.cache.get(self.key("reports/a"))
+        self.cache.set(self.key("reports/c"), "reports/c", make_response())
+        self.assertIsNotNone(self.cache.get(self.key("reports/a")))
+        self.assertIsNone(self.cache.get(self.key("reports/b")))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        for path in ["reports/a", "reports/b"]:
+            self.cache.set(self.key(path), path, make_response())
+        self.cache.invalidate(path="reports/a")
+        self.assertIsNone(self.cache.get(self.key("reports/a")))
+        self.assertIsNotNone(self.cache.get(self.key("reports/b")))
+        self.cache.invalidate(template="reports/{id}")
+        self.assertIsNone(self.cache.get(self.key("reports/b")))
+
+
+class ConditionalRequestTests(unittest.TestCase):
+
+    def test_revalidate_any_get(self):
+        ts = TruStar(config={'user_api_key': 'key', 'user_api_secret': 'secret', 'conditional_requests': True})
+        sent_headers = []
+
+        def send(method, path, headers=None, **kwargs):
+            sent_headers.append(headers)
+            if headers and headers.get('If-None-Match') == '"v1"':
+                return make_response(status_code=304, content=b'')
+            return make_response(content=b'[{"name": "tag", "guid": "1"}]', headers={'ETag': '"v1"'})
+
+        ts._client._send = send
+        for _ in range(3):
+            self.assertEqual(ts.get_enclave_tags("report")[0].name, "tag")
+
+        self.assertEqual([h.get('If-None-Match') if h else None for h in sent_headers], [None, '"v1"', '"v1"'])
+        stats = ts._client.validator_cache.stats()
+        self.assertEqual(stats['revalidations'], 2)
+        self.assertEqual(stats['bytes_saved'], 2 * len(b'[{"name": "tag", "guid": "1"}]'))
+
+    def test_responses_without_validators_are_not_kept(self):
+        cache = ValidatorCache()
+        cache.set(get_request_key("GET", "reports/a"), "reports/a", make_response())
+        self.assertEqual(len(cache.storage), 0)
+
+
+class DiskCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'cache.sqlite')
+        self.now = 1000.0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, namespace='a:', **kwargs):
+        return ResponseCache(storage=SQLiteCacheStorage(self.path, **kwargs),
+                             ttls={'reports/{id}': 60},
+                             namespace=namespace,
+                             clock=lambda: self.now)
+
+    def test_shared_between_instances(self):
+        key = get_request_key("GET", "reports/a")
+        self.make_cache().set(key, "reports/a", make_response(content=b'"a"', headers={'ETag': '"v1"'}))
+
+        # another process with the same credentials sees the entry; one with other credentials doesn't
+        response = self.make_cache().get(key)
+        self.assertEqual(response.content, b'"a"')
+        self.assertEqual(response.headers['etag'], '"v1"')
+        self.assertIsNone(self.make_cache(namespace='b:').get(key))
+
+    def test_invalidate_namespace(self):
+        key = get_request_key("GET", "reports/a")
+        caches = [self.make_cache(namespace='a:'), self.make_cache(namespace='b:')]
+        for cache in caches:
+            cache.set(key, "reports/a", make_response(content=b'"a"'))
+
+        # clearing one client's cache leaves the entries of clients with other credentials
+        caches[0].invalidate()
+        self.assertIsNone(caches[0].get(key))
+        self.assertIsNotNone(caches[1].get(key))
+
+        cache = ResponseCache(ttls={'reports/{id}': 60}, namespace='a:')
+        other = ResponseCache(storage=cache.storage, ttls={'reports/{id}': 60}, namespace='b:')
+        for c in [cache, other]:
+            c.set(key, "reports/a", make_response())
+        cache.invalidate()
+        self.assertEqual(len(cache.storage), 1)
+        self.assertIsNotNone(other.get(key))
+
+    def test_size_limits(self):
+        cache = self.make_cache(max_size=2)
+        for path in ["reports/a", "reports/b", "reports/c"]:
+            cache.set(get_request_key("GET", path), path, make_response())
+        self.assertEqual(len(cache.storage), 2)
+        self.assertIsNone(cache.get(get_request_key("GET", "reports/a")))
+
+        # b and c are 2 bytes each, so only b must go to fit d under the limit
+        cache = self.make_cache(max_bytes=10)
+        cache.set(get_request_key("GET", "reports/d"), "reports/d", make_response(content=b'x' * 8))
+        self.assertIsNone(cache.get(get_request_key("GET", "reports/b")))
+        self.assertIsNotNone(cache.get(get_request_key("GET", "reports/c")))
+        self.assertIsNotNone(cache.get(get_request_key("GET", "reports/d")))
+
+    def test_totals(self):
+        cache = self.make_cache()
+        storage = cache.storage
+        for path in ["reports/a", "reports/b", "reports/a"]:
+            cache.set(get_request_key("GET", path), path, make_response(content=b'"%s"' % path[-1:].encode()))
+        storage.delete([cache.make_key(get_request_key("GET", "reports/b"))])
+
+        # the totals kept by triggers match the entries, and a fresh instance picks them up
+        connection = storage._connection()
+        self.assertEqual(connection.execute("SELECT count, size FROM totals").fetchone(), (1, 3))
+        self.assertEqual(len(SQLiteCacheStorage(self.path)), 1)
+
+        # a recently accessed entry is read without writing its access time
+        key = cache.make_key(get_request_key("GET", "reports/a"))
+        accessed = connection.execute("SELECT accessed FROM entries WHERE key = ?", (key,)).fetchone()[0]
+        self.assertIsNotNone(storage.get(key))
+        self.assertEqual(connection.execute("SELECT accessed FROM entries WHERE key = ?", (key,)).fetchone()[0],
+                         accessed)
+
+    def test_revalidate(self):
+        cache = self.make_cache()
+        key = get_request_key("GET", "reports/a")
+        cache.set(key, "reports/a", make_response(content=b'"a"', headers={'ETag': '"v1"'}))
+
+        self.now += 61
+        self.assertIsNone(cache.get(key))
+        stale = cache.get_stale(key)
+        self.assertEqual(stale.get_validators(), {'If-None-Match': '"v1"'})
+
+        response = cache.revalidate(key, stale, make_response(status_code=304, content=b'', headers={'ETag': '"v2"'}))
+        self.assertEqual(response.content, b'"a"')
+        self.assertEqual(cache.get(key).headers['ETag'], '"v2"')
+        self.assertEqual(cache.stats()['revalidations'], 1)
+
+
+class MetricsTests(unittest.TestCase):
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram([1, 2, 4])
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.5, 1.5, 1.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.snapshot()['buckets'][2], 3)
+
+    def test_snapshot(self):
+        metrics = Metrics()
+        metrics.record_call("GET reports/{id}", 200, 0.2, None)
+        metrics.record_call("GET reports/{id}", 429, 0.1, None)
+        metrics.record_retry("GET reports/{id}", 'rate_limited')
+        metrics.record_rate_limit_wait("GET reports/{id}", 2)
+        metrics.record_response_size("GET reports/{id}", 1000)
+        metrics.record_token_refresh()
+        metrics.register_source('other', lambda: {'x': 1})
+
+        snapshot = metrics.snapshot()
+        endpoint = snapshot['endpoints']["GET reports/{id}"]
+        self.assertEqual(endpoint['calls'], 2)
+        self.assertEqual(endpoint['errors'], 1)
+        self.assertEqual(endpoint['status_codes'], {200: 1, 429: 1})
+        self.assertEqual(endpoint['retries'], {'rate_limited': 1})
+        self.assertEqual(endpoint['rate_limit_wait_seconds'], 2)
+        self.assertEqual(endpoint['response_size']['sum'], 1000)
+        self.assertEqual(snapshot['token_refreshes'], 1)
+        self.assertEqual(snapshot['other'], {'x': 1})
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.record_call("GET reports/{id}", 200, 0.2, 10)
+        metrics.set_gauge('concurrency_limit', 4)
+        text = metrics.to_prometheus()
+        self.assertIn('trustar_requests_total{endpoint="reports/{id}",method="GET",status="200"} 1', text)
+        self.assertIn('trustar_request_duration_seconds_bucket{endpoint="reports/{id}",le="0.25",method="GET"} 1', text)
+        self.assertIn('trustar_request_duration_seconds_count{endpoint="reports/{id}",method="GET"} 1', text)
+        self.assertIn('trustar_concurrency_limit 4', text)
+        self.assertIn("GET reports/{id}: 1 calls", metrics.format_summary())
+
+
+class HooksTests(unittest.TestCase):
+
+    def test_dispatch(self):
+        hooks = Hooks()
+        events = []
+        hooks.register('post_response', events.append)
+        # a failing hook must not prevent others from running
+        hooks.register('post_response', lambda event: 1 / 0)
+        hooks.register('post_response', lambda event: events.append(event.trace_id))
+
+        event = RequestEvent("GET", "reports/1", "GET reports/{id}")
+        event.set_response(make_response(content=b'{}', headers={'Trace-Id': 'abc'}), 0.5)
+        hooks.dispatch('post_response', event)
+        self.assertEqual(events, [event, 'abc'])
+        self.assertEqual(event.response_size, 2)
+
+        hooks.unregister('post_response', events.append)
+        self.assertRaises(ValueError, hooks.register, 'unknown', events.append)
+
+    def test_slow_request_logger(self):
+        hook = SlowRequestLogger(threshold=1)
+        event = RequestEvent("GET", "reports/1", "GET reports/{id}")
+        with self.assertLogs('trustar.hooks', level='WARNING') as logs:
+            event.set_response(make_response(headers={'Trace-Id': 'abc'}), 2)
+            hook(event)
+            event.elapsed = 0.5
+            hook(event)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Trace-Id: abc", logs.output[0])
+
+
+class FakeServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTruStarServer().start()
+        self.server.generate(reports=60, indicators_per_report=3)
+        self.ts = TruStar(config=self.server.config)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_time_based_pagination(self):
+        reports = list(self.ts.get_reports(is_enclave=True, from_time=self.server.oldest, to_time=self.server.newest))
+        self.assertEqual(len(reports), 60)
+        self.assertEqual(len(set(report.id for report in reports)), 60)
+        # 25 reports per page
+        self.assertEqual(self.server.get_request_count("GET reports"), 3)
+
+    def test_response_latency(self):
+        # responses on a kept-alive connection aren't held back by the client's delayed acks
+        self.ts.ping()
+        start = time.time()
+        for _ in range(20):
+            self.ts.ping()
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_page_number_pagination(self):
+        report = self.ts.submit_report(Report(title="Phishing", body="From 10.1.2.3 and evil.com", is_enclave=True))
+        values = [indicator.value for indicator in self.ts.get_indicators_for_report(report.id)]
+        self.assertEqual(values, ['10.1.2.3', 'evil.com'])
+        self.assertEqual(len(list(self.ts.search_reports("Report"))), 60)
+
+    def test_rate_limit_and_token_expiry(self):
+        report_id = next(iter(self.server.reports))
+        self.ts.ping()
+        self.server.rate_limit(wait_time=10)
+        self.server.expire_tokens()
+        self.assertEqual(self.ts.get_report_details(report_id).id, report_id)
+
+        endpoint = self.ts.metrics.snapshot()['endpoints']["GET reports/{id}"]
+        self.assertEqual(endpoint['retries'], {'token_expired': 1, 'rate_limited': 1})
+        self.assertEqual(endpoint['status_codes'], {400: 1, 429: 1, 200: 1})
+
+    def test_server_error(self):
+        self.server.add_fault(503, endpoint="GET reports/{id}")
+        errors = []
+        self.ts.hooks.register('error', errors.append)
+        self.assertRaises(requests.HTTPError, self.ts.get_report_details, next(iter(self.server.reports)))
+        self.assertEqual(errors[0].status_code, 503)
+
+    def test_conditional_requests(self):
+        # opt-in, since it keeps the bodies of recent responses in memory
+        self.assertIsNone(self.ts._client.validator_cache)
+
+        ts = TruStar(config=dict(self.server.config, conditional_requests=True))
+        report_id = next(iter(self.server.reports))
+        ts.get_report_details(report_id)
+        ts.get_report_details(report_id)
+        self.assertEqual(ts._client.validator_cache.stats()['revalidations'], 1)
+
+
+class ClientRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTruStarServer().start()
+        self.server.generate(reports=5, indicators_per_report=1)
+        self.registry = ClientRegistry()
+
+    def tearDown(self):
+        self.registry.clear()
+        self.server.stop()
+
+    def test_shared_client(self):
+        first = self.registry.get_client(config=self.server.config)
+        second = self.registry.get_client(config=dict(self.server.config, enclave_ids=['other']))
+        self.assertIs(first._client, second._client)
+        self.assertEqual(second.enclave_ids, ['other'])
+
+        first.ping()
+        second.ping()
+        self.assertEqual(self.server.get_request_count("POST oauth/token"), 1)
+        self.assertEqual(first.metrics.snapshot()['endpoints']["GET ping"]['calls'], 2)
+
+        # different credentials get their own client
+        other = self.registry.get_client(config=dict(self.server.config, user_api_key='other'))
+        self.assertIsNot(other._client, first._client)
+        self.assertEqual(len(self.registry), 2)
+
+    def test_concurrent_token_refresh(self):
+        clients = [self.registry.get_client(config=self.server.config) for _ in range(8)]
+        clients[0].ping()
+        self.server.expire_tokens()
+
+        threads = [threading.Thread(target=ts.ping) for ts in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.get_request_count("POST oauth/token"), 2)
+
+    def test_config_file_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trustar.json')
+            with open(path, 'w') as f:
+                json.dump({'trustar': {'user_api_key': 'key', 'user_api_secret': 'secret'}}, f)
+
+            config = TruStar.config_from_file(path, 'trustar')
+            config['enclave_ids'].append('modified')
+            self.assertEqual(TruStar.config_from_file(path, 'trustar')['enclave_ids'], [])
+
+            # a modified file is read again
+            with open(path, 'w') as f:
+                json.dump({'trustar': {'user_api_key': 'new', 'user_api_secret': 'secret'}}, f)
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            self.assertEqual(TruStar.config_from_file(path, 'trustar')['user_api_key'], 'new')
+        finally:
+            shutil.rmtree(directory)
+
+
+class TruStarPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTruStarServer(credentials={'noisy': 'secret', 'quiet': 'secret'}, quota=(50, 1)).start()
+        self.server.generate(reports=5, indicators_per_report=1)
+        self.pool = TruStarPool(max_workers=4)
+
+    def tearDown(self):
+        self.pool.shutdown(cancel_pending=True)
+        self.server.stop()
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertAlmostEqual(bucket.get_wait_time(), 0.5)
+        now[0] = 10
+        self.assertEqual(bucket.tokens, 2)
+
+        bucket = TokenBucket.from_quota(RequestQuota(guid='quota', max_requests=100, used_requests=40,
+                                                     time_window=60000, last_reset_time=0, next_reset_time=60000))
+        self.assertAlmostEqual(bucket.rate, 100 / 60.0)
+        self.assertAlmostEqual(bucket.tokens, 60, places=1)
+
+    def test_quota_from_server(self):
+        self.pool.add_tenant('noisy', config=self.server.get_config('noisy'))
+        self.assertEqual(self.pool.get_stats()['noisy']['rate'], 50)
+
+    def test_fair_scheduling(self):
+        self.pool.add_tenant('noisy', config=self.server.get_config('noisy'), rate=20, capacity=1)
+        self.pool.add_tenant('quiet', config=self.server.get_config('quiet'), rate=20, capacity=1)
+        report_id = next(iter(self.server.reports))
+
+        noisy = [self.pool.submit('noisy', 'get_report_details', report_id) for _ in range(20)]
+        quiet = [self.pool.submit('quiet', 'get_report_details', report_id) for _ in range(5)]
+
+        # the quiet tenant's calls don't wait behind the noisy tenant's backlog
+        for future in quiet:
+            self.assertEqual(future.result(timeout=5).id, report_id)
+        self.assertTrue(any(not future.done() for future in noisy))
+
+        for future in noisy:
+            future.result(timeout=5)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['noisy']['completed'], 20)
+        self.assertEqual(stats['quiet']['completed'], 5)
+
+        # each tenant has its own token, but they share the connection pool
+        self.assertEqual(self.server.get_request_count("POST oauth/token"), 2)
+        self.assertIs(self.pool.get_client('noisy')._client.session, self.pool.get_client('quiet')._client.session)
+
+    def test_errors(self):
+        self.pool.add_tenant('quiet', config=self.server.get_config('quiet'), rate=100)
+        future = self.pool.submit('quiet', 'get_report_details', 'missing')
+        self.assertRaises(requests.HTTPError, future.result, 5)
+        self.assertEqual(self.pool.get_stats()['quiet']['failed'], 1)
+
+
+class ShardingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTruStarServer(credentials={'key-one': 'secret', 'key-two': 'secret'}, quota=(10, 60)).start()
+        self.server.generate(reports=5, indicators_per_report=1)
+        config = self.server.config
+        del config['user_api_key'], config['user_api_secret']
+        config['credentials'] = ['key-one:secret', {'user_api_key': 'key-two', 'user_api_secret': 'secret'}]
+        self.ts = TruStar(config=config)
+        self.report_id = next(iter(self.server.reports))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get_counts(self):
+        counts = {}
+        for request in self.server.requests:
+            if request.api_key is not None:
+                counts[request.api_key] = counts.get(request.api_key, 0) + 1
+        return counts
+
+    def test_spread_by_quota(self):
+        self.assertIsInstance(self.ts._client, ShardedApiClient)
+        for _ in range(16):
+            self.ts.ping()
+        # beyond either key's quota of 10, but within their sum
+        self.assertEqual(self.get_counts(), {'key-one': 9, 'key-two': 9})
+        self.assertEqual(self.server.get_request_count("POST oauth/token"), 2)
+        self.assertEqual(self.ts.metrics.snapshot()['endpoints']["GET ping"]['calls'], 16)
+
+    def test_rate_limited_key(self):
+        self.ts.ping()
+        self.server.rate_limit(wait_time=30000, endpoint="GET reports/{id}")
+        start = time.time()
+        self.assertEqual(self.ts.get_report_details(self.report_id).id, self.report_id)
+        self.assertLess(time.time() - start, 5)
+
+        shards = self.ts.metrics.snapshot()['shards']
+        self.assertEqual(sorted(shard['rate_limited'] for shard in shards.values()), [0, 1])
+        # the other key takes the following requests while the limited one cools down
+        counts = self.get_counts()
+        self.ts.ping()
+        self.ts.ping()
+        self.assertEqual(sum(self.get_counts().values()) - sum(counts.values()), 2)
+        self.assertEqual(sorted(shard['requests'] for shard in self.ts.metrics.snapshot()['shards'].values()),
+                         [1, 4])
+
+    def test_buckets_read_outside_lock(self):
+        client = self.ts._client
+        client._load_quotas()
+        reads = []
+
+        class SharedBucket(TokenBucket):
+            @property
+            def tokens(self):
+                # i.e. a file lock or a round trip to a coordinator
+                reads.append(client._lock.locked())
+                return super(SharedBucket, self).tokens
+
+        for shard in client.shards:
+            shard.bucket = SharedBucket(rate=1, capacity=10)
+        self.ts.ping()
+        client.get_shard_stats()
+        self.assertEqual(len(reads), 4)
+        self.assertFalse(any(reads))
+
+
+class SharedRateLimitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_file_bucket_across_processes(self):
+        path = os.path.join(self.directory, 'bucket')
+        script = ("import sys; from trustar.rate_limit import FileTokenBucket; "
+                  "bucket = FileTokenBucket(sys.argv[1], rate=0.001, capacity=5); "
+                  "print(sum(bucket.try_acquire() for _ in range(4)))")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        processes = [subprocess.Popen([sys.executable, '-c', script, path], stdout=subprocess.PIPE, env=env)
+                     for _ in range(3)]
+        taken = sum(int(process.communicate()[0]) for process in processes)
+        self.assertEqual(taken, 5)
+        self.assertLess(FileTokenBucket(path, rate=0.001, capacity=5).tokens, 1)
+
+    def test_coordinator(self):
+        for address in ['127.0.0.1:0', os.path.join(self.directory, 'coordinator.sock')]:
+            coordinator = RateLimitCoordinator(address).start()
+            try:
+                first = RemoteTokenBucket(coordinator.address, 'key', rate=0.001, capacity=3)
+                second = RemoteTokenBucket(coordinator.address, 'key', rate=0.001, capacity=3)
+                other = RemoteTokenBucket(coordinator.address, 'other-key', rate=0.001, capacity=3)
+                self.assertTrue(first.try_acquire())
+                self.assertTrue(second.try_acquire(2))
+                self.assertFalse(first.try_acquire())
+                self.assertGreater(second.get_wait_time(), 100)
+                self.assertFalse(second.acquire(timeout=0.1))
+                self.assertTrue(other.try_acquire())
+                first.close()
+                second.close()
+                other.close()
+            finally:
+                coordinator.stop()
+
+    def test_shared_by_clients(self):
+        with FakeTruStarServer(quota=(5, 60)) as server:
+            config = dict(server.config, rate_limit='file', rate_limit_path=self.directory)
+            first = TruStar(config=config)
+            second = TruStar(config=config)
+            first.ping()
+            second.ping()
+            limiter = first._client.rate_limiter.bucket
+            self.assertIsInstance(limiter, FileTokenBucket)
+            self.assertEqual(limiter.path, second._client.rate_limiter.bucket.path)
+            # the bucket started from the quota left after the first client's quota request, then both pings took one
+            self.assertAlmostEqual(limiter.tokens, 2, places=0)
+
+
+class PriorityTests(unittest.TestCase):
+
+    def test_reserved_quota(self):
+        scheduler = PriorityScheduler(TokenBucket(rate=0.001, capacity=10), reserved=0.2)
+        self.assertEqual(sum(scheduler.try_acquire(priority='bulk') for _ in range(10)), 8)
+        self.assertGreater(scheduler.get_wait_time(priority='bulk'), 100)
+        self.assertEqual(scheduler.get_wait_time(priority='interactive'), 0)
+        self.assertEqual(sum(scheduler.try_acquire(priority='interactive') for _ in range(10)), 2)
+
+    def test_small_quota(self):
+        # the reserve can't keep bulk requests from ever going through a bucket that holds a single request
+        scheduler = PriorityScheduler(TokenBucket(rate=5, capacity=1))
+        self.assertTrue(scheduler.acquire(timeout=2, priority='bulk'))
+        self.assertTrue(scheduler.acquire(timeout=2, priority='bulk'))
+        self.assertLess(scheduler.get_wait_time(priority='bulk'), 1)
+
+        # a reserve that fits is unchanged
+        scheduler = PriorityScheduler(TokenBucket(rate=0.001, capacity=3), reserved=0.5)
+        self.assertEqual(sum(scheduler.try_acquire(priority='bulk') for _ in range(3)), 1)
+
+    def test_interactive_first(self):
+        scheduler = PriorityScheduler(TokenBucket(rate=20, capacity=1, tokens=0), reserved=0)
+        granted = []
+
+        def acquire(priority):
+            scheduler.acquire(priority=priority)
+            granted.append(priority)
+
+        threads = [threading.Thread(target=acquire, args=('bulk',)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.02)
+        thread = threading.Thread(target=acquire, args=('interactive',))
+        thread.start()
+        threads.append(thread)
+        for thread in threads:
+            thread.join()
+        # the interactive request waits for at most one token, not for the bulk requests ahead of it
+        self.assertLessEqual(granted.index('interactive'), 1)
+
+    def test_client_priority(self):
+        with FakeTruStarServer(quota=(10, 60)) as server:
+            ts = TruStar(config=dict(server.config, rate_limit='memory'))
+            with ts.priority('bulk'):
+                for _ in range(7):
+                    ts.ping()
+                self.assertEqual(ts._client.get_priority(), 'bulk')
+                scheduler = ts._client.rate_limiter
+                self.assertGreater(scheduler.get_wait_time(), 1)
+            self.assertEqual(ts._client.get_priority(), 'interactive')
+
+            start = time.time()
+            ts.ping()
+            ts.ping()
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(scheduler.stats()['granted'], {'bulk': 7, 'interactive': 2})
+            self.assertRaises(ValueError, ts.priority('urgent').__enter__)
+
+    def test_concurrent_first_requests(self):
+        with FakeTruStarServer(quota=(10, 60)) as server:
+            ts = TruStar(config=dict(server.config, rate_limit='memory'))
+            other = threading.Thread(target=ts.ping)
+
+            def start_other(event):
+                # another thread's first request, while the quota is being fetched
+                if event.endpoint == "GET request-quotas":
+                    other.start()
+                    other.join(0.3)
+
+            ts.hooks.register('pre_request', start_other)
+            ts.ping()
+            other.join()
+            self.assertEqual(ts._client.rate_limiter.stats()['granted'], {'interactive': 2, 'bulk': 0})
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+
+    def test_aimd(self):
+        metrics = Metrics()
+        limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=4, metrics=metrics)
+
+        # grows by about one per limit's worth of healthy responses, while the limit is used
+        for _ in range(3):
+            slots = [limiter.acquire(), limiter.acquire()]
+            for slot in slots:
+                limiter.release(slot, "GET ping", 200, 0.01)
+        self.assertEqual(limiter.limit, 3)
+        limiter.release(limiter.acquire(), "GET ping", 200, 0.01)
+        self.assertEqual(limiter.limit, 3)
+
+        # requests sent before a cut don't cut again
+        slots = [limiter.acquire() for _ in range(3)]
+        time.sleep(0.01)
+        for slot in slots:
+            limiter.release(slot, "GET ping", 429, 0.01)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(metrics.snapshot()['gauges']['concurrency_limit'], 1)
+
+    def test_latency_spike(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=4)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), "GET reports", 200, 0.1)
+        limiter.release(limiter.acquire(), "GET ping", 200, 0.5)
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire(), "GET reports", 200, 0.5)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_bulk_operations(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, adaptive_concurrency=True, max_concurrency=8))
+            server.add_fault(503, endpoint="POST reports")
+            reports = [Report(title="Report %d" % i, body="Seen 10.0.0.%d" % i, is_enclave=True) for i in range(20)]
+            self.assertRaises(requests.HTTPError, ts.submit_reports, reports)
+
+            submitted = ts.submit_reports(reports[:10])
+            self.assertEqual([report.title for report in submitted], ["Report %d" % i for i in range(10)])
+            details = ts.get_reports_details([report.id for report in submitted])
+            self.assertEqual([report.title for report in details], ["Report %d" % i for i in range(10)])
+
+            stats = ts.metrics.snapshot()['concurrency']
+            self.assertGreaterEqual(stats['decreases'], 1)
+            self.assertGreater(stats['increases'], 0)
+            self.assertEqual(stats['in_flight'], 0)
+
+    def test_deadline(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1)
+        slot = limiter.acquire()
+        self.assertIsNone(limiter.acquire(timeout=0.05))
+        limiter.abandon(slot)
+        self.assertIsNotNone(limiter.acquire(timeout=0.05))
+
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            ts.ping()
+            ts._client.concurrency_limiter = limiter
+            start = time.time()
+            with ts.deadline(0.1):
+                self.assertRaises(DeadlineExceeded, ts.ping)
+            self.assertLess(time.time() - start, 0.5)
+            self.assertEqual(server.get_request_count("GET ping"), 1)
+
+    def test_unexpected_errors(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, adaptive_concurrency=True, circuit_breaker=True))
+            ts.ping()
+
+            def fail(*args, **kwargs):
+                raise RuntimeError("interrupted")
+
+            ts._client.session.request = fail
+            for _ in range(10):
+                self.assertRaises(RuntimeError, ts.ping)
+            # the slots are given up, without cutting the limit or counting as failures
+            self.assertEqual(ts._client.concurrency_limiter.stats()['in_flight'], 0)
+            self.assertEqual(ts._client.concurrency_limiter.stats()['decreases'], 0)
+            self.assertEqual(ts.metrics.snapshot()['circuit_breakers']['GET ping']['failure_rate'], 0)
+
+
+class HedgingTests(unittest.TestCase):
+
+    def test_budget(self):
+        budget = HedgeBudget(ratio=0.25, max_credits=2)
+        spent = 0
+        for _ in range(20):
+            budget.earn()
+            spent += budget.spend()
+        self.assertEqual(spent, 5)
+        for _ in range(20):
+            budget.earn()
+        self.assertEqual(sum(budget.spend() for _ in range(5)), 2)
+
+    def test_first_response_wins(self):
+        delays = [0.5, 0.01]
+        closed = []
+
+        class Response(object):
+            def __init__(self, delay):
+                self.delay = delay
+
+            def close(self):
+                closed.append(self.delay)
+
+        def send():
+            delay = delays.pop(0)
+            time.sleep(delay)
+            return Response(delay)
+
+        hedger = Hedger(Metrics(), delay=0.05, budget=1)
+        start = time.time()
+        self.assertEqual(hedger.send("GET ping", send).delay, 0.01)
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(hedger.stats(), {'requests': 1, 'hedged': 1, 'won': 1, 'over_budget': 0, 'saturated': 0})
+        time.sleep(0.6)
+        self.assertEqual(closed, [0.5])
+
+        # without a fixed delay, endpoints aren't hedged until their latency is known
+        hedger = Hedger(Metrics(), budget=1)
+        self.assertIsNone(hedger.get_delay("GET ping"))
+        self.assertFalse(hedger.is_hedgeable("POST", "reports"))
+        self.assertFalse(hedger.is_hedgeable("GET", "reports/1", stream=True))
+        hedger.close()
+
+    def test_concurrent_requests(self):
+        # requests aren't queued behind each other, whatever the number of hedges allowed
+        hedger = Hedger(Metrics(), delay=0.1, budget=1, max_hedges=2)
+        threads = [threading.Thread(target=hedger.send, args=("GET ping", lambda: time.sleep(0.06)))
+                   for _ in range(6)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(hedger.stats()['hedged'], 0)
+
+        # only max_hedges duplicates are in flight at once
+        threads = [threading.Thread(target=hedger.send, args=("GET ping", lambda: time.sleep(0.3)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(hedger.stats()['hedged'], 2)
+        self.assertEqual(hedger.stats()['saturated'], 1)
+
+        # no duplicate is sent after the deadline
+        token = CancellationToken(timeout=0.05)
+        hedger.send("GET ping", lambda: time.sleep(0.2), cancellation=token)
+        self.assertEqual(hedger.stats()['hedged'], 2)
+
+        # once closed, requests are sent without hedging
+        hedger.close()
+        hedger.send("GET ping", lambda: time.sleep(0.2))
+        self.assertEqual(hedger.stats()['hedged'], 2)
+
+    def test_client(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, hedge_requests=True, hedge_delay=0.05, hedge_budget=0.5,
+                                     hedge_endpoints="ping"))
+            server.endpoint_latency["GET ping"] = 0.2
+            server.endpoint_latency["GET version"] = 0.2
+            for _ in range(4):
+                ts.ping()
+            ts.get_version()
+            self.assertEqual(ts.metrics.snapshot()['hedging']['hedged'], 2)
+            self.assertEqual(server.get_request_count("GET ping"), 6)
+            self.assertEqual(server.get_request_count("GET version"), 1)
+            ts._client.close()
+
+
+class DeadlineTests(unittest.TestCase):
+
+    def test_token(self):
+        parent = CancellationToken(timeout=10)
+        token = CancellationToken.create(1, parent=parent)
+        self.assertLessEqual(token.remaining(), 1)
+        self.assertTrue(all(t <= 1 for t in token.get_timeout((10, 60))))
+        self.assertEqual(token.get_timeout(0.5), 0.5)
+        self.assertIs(CancellationToken.create(None, parent=parent), parent)
+        self.assertRaises(DeadlineExceeded, token.sleep, 5)
+
+        parent.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertRaises(Cancelled, token.check)
+
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.time()
+        self.assertRaises(Cancelled, token.sleep, 5)
+        self.assertLess(time.time() - start, 1)
+
+    def test_timeouts(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, timeouts={'search': 120, 'POST reports': [5, 90], 'ping': 0.1}))
+            self.assertEqual(ts._client.get_timeout("GET", "reports/search"), (10, 120))
+            self.assertEqual(ts._client.get_timeout("POST", "reports"), (5, 90))
+            self.assertEqual(ts._client.get_timeout("GET", "reports/abc"), (10, 60))
+
+            server.endpoint_latency["GET ping"] = 0.5
+            self.assertRaises(requests.Timeout, ts.ping)
+
+    def test_deadline(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            ts.ping()
+            server.endpoint_latency["GET version"] = 1
+            start = time.time()
+            with ts.deadline(0.2):
+                self.assertRaises(DeadlineExceeded, ts.get_version)
+            self.assertLess(time.time() - start, 0.8)
+            self.assertIsNone(ts._client.get_cancellation_token())
+
+            server.endpoint_latency["GET reports"] = 1
+            reports = ts.get_reports(deadline=0.2)
+            self.assertRaises(DeadlineExceeded, list, reports)
+
+    def test_bulk_deadline(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            report_ids = [server.add_report("Report %d" % i, "Seen 10.0.0.%d" % i)['id'] for i in range(20)]
+            server.endpoint_latency["GET reports/{id}"] = 0.2
+            start = time.time()
+            self.assertRaises(DeadlineExceeded, ts.get_reports_details, report_ids, max_workers=2, deadline=0.3)
+            self.assertLess(time.time() - start, 0.6)
+            time.sleep(0.3)
+            self.assertLess(server.get_request_count("GET reports/{id}"), 10)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_states(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, reset_timeout=10, clock=lambda: now[0])
+        for status in [200, 404, 429, 500, None]:
+            self.assertEqual(breaker.allow(), 0)
+            breaker.record(status)
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record(503)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.allow(), 10)
+
+        # one trial at a time while half-open; a failed trial opens the circuit again
+        now[0] = 10
+        self.assertEqual(breaker.allow(), 0)
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertGreater(breaker.allow(), 0)
+        breaker.record(502)
+        self.assertEqual(breaker.state, 'open')
+
+        now[0] = 20
+        self.assertEqual(breaker.allow(), 0)
+        breaker.record(200)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.stats(), {'state': 'closed', 'failure_rate': 0, 'opened': 2, 'rejected': 2})
+
+    def test_client(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, circuit_breaker=True, circuit_min_requests=4,
+                                     circuit_reset_timeout=0.2))
+            server.add_fault(503, count=4, endpoint="GET version")
+            for _ in range(4):
+                self.assertRaises(requests.HTTPError, ts.get_version)
+            self.assertRaises(CircuitOpenError, ts.get_version)
+            self.assertEqual(server.get_request_count("GET version"), 4)
+            ts.ping()
+
+            snapshot = ts.metrics.snapshot()
+            self.assertEqual(snapshot['circuit_breakers']['GET version']['state'], 'open')
+            self.assertEqual(snapshot['gauges']['open_circuits'], 1)
+
+            time.sleep(0.2)
+            ts.get_version()
+            self.assertEqual(ts.metrics.snapshot()['gauges']['open_circuits'], 0)
+
+    def test_deadlines_are_not_failures(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, circuit_breaker=True, circuit_min_requests=3,
+                                     adaptive_concurrency=True))
+            server.endpoint_latency["GET version"] = 0.3
+            for _ in range(3):
+                with ts.deadline(0.1):
+                    self.assertRaises(DeadlineExceeded, ts.get_version)
+            self.assertEqual(ts.metrics.snapshot()['circuit_breakers']['GET version']['failure_rate'], 0)
+            self.assertEqual(ts._client.concurrency_limiter.stats()['decreases'], 0)
+            ts.get_version()
+
+    def test_unsent_trial(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, circuit_breaker=True, circuit_min_requests=2,
+                                     circuit_reset_timeout=0.2, adaptive_concurrency=True))
+            server.add_fault(503, count=2, endpoint="GET version")
+            for _ in range(2):
+                self.assertRaises(requests.HTTPError, ts.get_version)
+            time.sleep(0.2)
+
+            # the trial times out waiting for a slot, so the next request is the trial instead
+            limiter = ts._client.concurrency_limiter
+            slots = []
+            while True:
+                slot = limiter.acquire(timeout=0)
+                if slot is None:
+                    break
+                slots.append(slot)
+            with ts.deadline(0.1):
+                self.assertRaises(DeadlineExceeded, ts.get_version)
+            for slot in slots:
+                limiter.abandon(slot)
+            ts.get_version()
+
+
+class ChunkedParamsTests(unittest.TestCase):
+
+    def test_split_params(self):
+        client = TruStar(config={'user_api_key': 'key', 'user_api_secret': 'secret', 'max_url_length': 200})._client
+        values = ["10.0.0.%d" % i for i in range(40)]
+        types = ['IP', None] * 20
+        chunks = client.split_params("indicators/metadata", {'values': values, 'types': types, 'enclaveIds': ['e']},
+                                     ['values', 'types'])
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual([v for chunk in chunks for v in chunk['values']], values)
+        self.assertEqual([t for chunk in chunks for t in chunk['types']], types)
+        for chunk in chunks:
+            url = requests.Request('GET', "%s/indicators/metadata" % client.base, params=chunk).prepare().url
+            self.assertLessEqual(len(url), 200)
+            self.assertEqual(chunk['enclaveIds'], ['e'])
+
+        self.assertEqual(client.split_params("reports/correlate", {'indicators': None}, ['indicators']),
+                         [{'indicators': None}])
+
+    def test_chunked_requests(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=dict(server.config, max_url_length=400))
+            values = ["evil-%d.example.com" % i for i in range(60)]
+            for value in values[::2]:
+                server.add_indicator(value, indicator_type='URL')
+            report = server.add_report("Report", " ".join(values[:5] + values[-5:]))
+
+            known = [value for value in values if value in server.indicators]
+            self.assertEqual(len(known), 35)
+
+            metadata = ts.get_indicators_metadata([Indicator(value=v) for v in reversed(values)])
+            self.assertEqual([i.value for i in metadata], list(reversed(known)))
+            self.assertGreater(server.get_request_count("GET indicators/metadata"), 3)
+
+            details = ts.get_indicator_details(values)
+            self.assertEqual([i.value for i in details], known)
+            self.assertEqual(ts.get_correlated_report_ids(values), [report['id']])
+
+
+class MicroBatchingTests(unittest.TestCase):
+
+    def test_batches(self):
+        calls = []
+
+        def double(items):
+            calls.append(list(items))
+            return [item * 2 for item in items]
+
+        with MicroBatcher(double, max_batch_size=8, max_delay=0.05) as batcher:
+            futures = [batcher.submit(i % 5) for i in range(10)]
+            self.assertEqual([f.result() for f in futures], [(i % 5) * 2 for i in range(10)])
+        # identical items in a batch are sent once
+        self.assertEqual(calls, [[0, 1, 2, 3, 4], [3, 4]])
+        self.assertRaises(RuntimeError, batcher.submit, 1)
+
+        def fail(items):
+            raise ValueError("failed")
+
+        with MicroBatcher(fail) as batcher:
+            self.assertRaises(ValueError, batcher.submit(1).result)
+
+    def test_cancelled_futures(self):
+        calls = []
+
+        def double(items):
+            calls.append(list(items))
+            return [item * 2 for item in items]
+
+        with MicroBatcher(double, max_delay=0.05) as batcher:
+            futures = [batcher.submit(i) for i in range(3)]
+            self.assertTrue(futures[0].cancel())
+            self.assertEqual(futures[1].result(timeout=2), 2)
+            self.assertEqual(futures[2].result(timeout=2), 4)
+        self.assertEqual(calls, [[1, 2]])
+
+        # a function returning too few results fails the whole batch, rather than leaving futures pending
+        with MicroBatcher(lambda items: items[:1], max_delay=0.05) as batcher:
+            futures = [batcher.submit(i) for i in range(3)]
+            for future in futures:
+                self.assertRaises(ValueError, future.result, timeout=2)
+
+    def test_indicator_metadata(self):
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            values = ["10.0.0.%d" % i for i in range(20)]
+            for value in values[:10]:
+                server.add_indicator(value, indicator_type='IP')
+
+            with ts.get_metadata_batcher(max_batch_size=50, max_delay=0.05) as batcher:
+                futures = []
+                threads = [threading.Thread(target=lambda v=v: futures.append((v, batcher.submit(v))))
+                           for v in values]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                typed = batcher.submit(Indicator(value=values[0], type='URL'))
+
+                for value, future in futures:
+                    indicator = future.result()
+                    if value in values[:10]:
+                        self.assertEqual(indicator.value, value)
+                    else:
+                        self.assertIsNone(indicator)
+                self.assertIsNone(typed.result())
+            self.assertLessEqual(server.get_request_count("GET indicators/metadata"), 2)
+
+
+class BloomFilterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_membership(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        values = ["evil-%d.example.com" % i for i in range(1000)]
+        bloom.update(values)
+        self.assertTrue(all(value in bloom for value in values))
+        self.assertIn("  EVIL-1.example.COM ", bloom)
+        false_positives = sum("good-%d.example.com" % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(bloom.error_rate, 0.01, delta=0.005)
+
+    def test_persistence(self):
+        path = os.path.join(self.directory, "indicators.bloom")
+        bloom = BloomFilter(capacity=100)
+        bloom.update(["a", "b"])
+        bloom.save(path, synced_to=1234)
+
+        for use_mmap in [True, False]:
+            loaded, synced_to = BloomFilter.load(path, use_mmap=use_mmap)
+            self.assertEqual(synced_to, 1234)
+            self.assertEqual((loaded.num_bits, loaded.num_hashes, len(loaded)), (bloom.num_bits, bloom.num_hashes, 2))
+            self.assertIn("a", loaded)
+            self.assertNotIn("c", loaded)
+
+            # additions to a mapped filter don't change the file until it is saved
+            loaded.add("c")
+            self.assertIn("c", loaded)
+            self.assertNotIn("c", BloomFilter.load(path)[0])
+
+        loaded.save(path)
+        self.assertIn("c", BloomFilter.load(path)[0])
+
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+        self.assertRaises(ValueError, BloomFilter.load, path)
+
+    def test_indicator_filter(self):
+        path = os.path.join(self.directory, "indicators.bloom")
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            now = get_current_time_millis()
+            known = ["10.0.0.%d" % i for i in range(10)]
+            for value in known:
+                server.add_indicator(value, indicator_type='IP', last_seen=now - 2 * 60 * 60 * 1000)
+            server.add_indicator("old.com", indicator_type='URL', last_seen=now - 365 * DAY)
+
+            # the first sync fetches every indicator, however old
+            prefilter = IndicatorFilter.open(path, capacity=1000)
+            self.assertEqual(prefilter.sync(ts, to_time=now - 30000), 11)
+            self.assertIn("old.com", prefilter)
+            prefilter.save()
+
+            # the next sync only fetches what changed since, including what was indexed late
+            server.add_indicator("evil.com", indicator_type='URL', last_seen=now - 60000)
+            prefilter = IndicatorFilter.open(path)
+            self.assertEqual(prefilter.sync(ts), 1)
+            self.assertIn("evil.com", prefilter)
+
+            unknown = [Indicator(value="192.168.0.%d" % i) for i in range(20)]
+            self.assertEqual(ts.get_indicators_metadata(unknown, prefilter=prefilter), [])
+            self.assertEqual(server.get_request_count("GET indicators/metadata"), 0)
+            metadata = ts.get_indicators_metadata(unknown + [Indicator(value=known[0])], prefilter=prefilter)
+            self.assertEqual([i.value for i in metadata], [known[0]])
+
+            with ts.get_metadata_batcher(prefilter=prefilter) as batcher:
+                self.assertIsNone(batcher.submit("192.168.0.1").result())
+            self.assertEqual(batcher.stats()['submitted'], 0)
+
+
+class WhitelistMatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matching(self):
+        whitelist = WhitelistMatcher([Indicator(value="Google.com", type='URL'),
+                                      Indicator(value="https://example.com/Path", type='URL'),
+                                      Indicator(value="10.0.0.0/8", type='CIDR_BLOCK'),
+                                      Indicator(value="192.168.1.1", type='IP'),
+                                      Indicator(value="2001:db8::/32", type='CIDR_BLOCK'),
+                                      Indicator(value="d41d8cd98f00b204e9800998ecf8427e", type='MD5')])
+
+        # exact, per type
+        self.assertIn("D41D8CD98F00B204E9800998ECF8427E", whitelist)
+        self.assertTrue(whitelist.matches("d41d8cd98f00b204e9800998ecf8427e", 'MD5'))
+        self.assertFalse(whitelist.matches("d41d8cd98f00b204e9800998ecf8427e", 'SHA1'))
+        self.assertIn("HTTPS://EXAMPLE.COM/Path", whitelist)
+        self.assertNotIn("https://example.com/path", whitelist)
+
+        # domains and their subdomains
+        for value in ["google.com", "mail.google.com", "https://docs.google.com/a?b", "http://user@google.com:80/"]:
+            self.assertIn(value, whitelist)
+        for value in ["notgoogle.com", "google.com.evil.net", "admin@google.com"]:
+            self.assertNotIn(value, whitelist)
+
+        # networks
+        for value in ["10.1.2.3", "10.2.0.0/16", "192.168.1.1", "2001:db8::1"]:
+            self.assertIn(value, whitelist)
+        for value in ["11.0.0.1", "10.0.0.0/7", "192.168.1.2", "2001:db9::1"]:
+            self.assertNotIn(value, whitelist)
+        self.assertFalse(whitelist.matches("10.1.2.3", 'URL'))
+
+        indicators = [Indicator(value="evil.com", type='URL'), Indicator(value="10.9.9.9", type='IP'), "mail.google.com"]
+        self.assertEqual(whitelist.filter(indicators), indicators[:1])
+
+        whitelist.remove([Indicator(value="10.0.0.0/8", type='CIDR_BLOCK')])
+        self.assertNotIn("10.1.2.3", whitelist)
+        self.assertEqual(len(whitelist), 5)
+
+    def test_remove_url(self):
+        whitelist = WhitelistMatcher([Indicator(value="google.com", type='URL'),
+                                      Indicator(value="https://google.com/foo", type='URL')])
+        whitelist.remove([Indicator(value="https://google.com/foo", type='URL')])
+        self.assertEqual(len(whitelist), 1)
+        self.assertTrue(whitelist.matches("mail.google.com", 'URL'))
+
+    def test_sync_and_snapshot(self):
+        path = os.path.join(self.directory, "whitelist.json")
+        with FakeTruStarServer() as server:
+            ts = TruStar(config=server.config)
+            ts.add_terms_to_whitelist(["trustar.co", "8.8.8.8"])
+
+            whitelist = ts.get_whitelist_matcher(path, max_age=3600)
+            self.assertIn("www.trustar.co", whitelist)
+            self.assertEqual(server.get_request_count("GET whitelist"), 1)
+
+            # a recent snapshot is used as is
+            whitelist = ts.get_whitelist_matcher(path, max_age=3600)
+            self.assertIn("8.8.8.8", whitelist)
+            self.assertEqual(server.get_request_count("GET whitelist"), 1)
+
+            # a sync applies only what changed
+            ts.delete_indicator_from_whitelist(Indicator(value="8.8.8.8", type='IP'))
+            ts.add_terms_to_whitelist(["google.com"])
+            self.assertEqual(whitelist.sync(ts), (1, 1))
+            self.assertNotIn("8.8.8.8", whitelist)
+            self.assertIn("mail.google.com", whitelist)
+
+            indicators = [Indicator(value="docs.google.com"), Indicator(value="1.2.3.4")]
+            ts.submit_indicators(indicators[:1], enclave_ids=[], whitelist=whitelist)
+            self.assertEqual(server.get_request_count("POST indicators"), 0)
+            ts.submit_indicators(indicators, enclave_ids=[], whitelist=whitelist)
+            request, = [r for r in server.requests if r.endpoint == "POST indicators"]
+            self.assertEqual([i['value'] for i in json.loads(request.body.decode('utf-8'))['content']], ["1.2.3.4"])
+
+        with open(path, 'wb') as f:
+            f.write(b'{}')
+        self.assertRaises(ValueError, WhitelistMatcher.open, path)
+
+
+class LazyImportTests(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        script = ("import sys, trustar; "
+                  "print(sys.excepthook is sys.__excepthook__); "
+                  "print(' '.join(m for m in ['yaml', 'dateutil', 'pytz', 'tzlocal', 'requests', 'logging.config'] "
+                  "if m in sys.modules))")
+        output = subprocess.check_output([sys.executable, '-c', script]).decode('utf-8').splitlines()
+        self.assertEqual(output[0], 'True')
+        self.assertEqual(output[1:], [''])
+
+    def test_lazy_attributes(self):
+        import trustar
+        self.assertIs(trustar.TruStar, TruStar)
+        self.assertIn('Report', dir(trustar))
+        self.assertRaises(AttributeError, getattr, trustar, 'missing')
+
+    def test_config_from_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'trustar.yml')
+        with open(path, 'w') as f:
+            f.write("trustar:\n  user_api_key: key\n  user_api_secret: secret\n  enclave_ids: a,b\n")
+        config = TruStar.config_from_file(path, 'trustar')
+        self.assertEqual(config['enclave_ids'], ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,94 @@
 from __future__ import absolute_import
 
-from .logger import configure_logging
-configure_logging()
+import sys
 
-from .trustar import TruStar
-from .models import *
-from .utils import *
+# python 2 backwards compatibility
+if sys.version_info[0] < 3:
+    from future import standard_library
+    standard_library.install_aliases()
 
 from .version import __version__, __api_version__
+
+# public names, and the modules they are imported from
+_EXPORTS = {
+    'TruStar': 'trustar.trustar',
+    'ClientRegistry': 'trustar.registry',
+    'get_client': 'trustar.registry',
+    'TruStarPool': 'trustar.pool',
+    'TokenBucket': 'trustar.rate_limit',
+    'FileTokenBucket': 'trustar.rate_limit',
+    'RemoteTokenBucket': 'trustar.rate_limit',
+    'RateLimitCoordinator': 'trustar.rate_limit',
+    'ShardedApiClient': 'trustar.sharding',
+    'AdaptiveConcurrencyLimiter': 'trustar.concurrency',
+    'CircuitOpenError': 'trustar.circuit_breaker',
+    'BloomFilter': 'trustar.bloom',
+    'IndicatorFilter': 'trustar.bloom',
+    'IndicatorMetadataBatcher': 'trustar.batching',
+    'MicroBatcher': 'trustar.batching',
+    'CancellationToken': 'trustar.deadline',
+    'Cancelled': 'trustar.deadline',
+    'DeadlineExceeded': 'trustar.deadline',
+    'WhitelistMatcher': 'trustar.whitelist',
+
+    'Enclave': 'trustar.models',
+    'EnclavePermissions': 'trustar.models',
+    'Indicator': 'trustar.models',
+    'Page': 'trustar.models',
+    'Report': 'trustar.models',
+    'Tag': 'trustar.models',
+    'RequestQuota': 'trustar.models',
+    'Enum': 'trustar.models',
+    'IndicatorType': 'trustar.models',
+    'PriorityLevel': 'trustar.models',
+    'IdType': 'trustar.models',
+    'DistributionType': 'trustar.models',
+    'EnclaveType': 'trustar.models',
+
+    'DAY': 'trustar.utils',
+    'normalize_timestamp': 'trustar.utils',
+    'get_current_time_millis': 'trustar.utils',
+    'datetime_to_millis': 'trustar.utils',
+    'get_logger': 'trustar.utils',
+    'get_time_based_page_generator': 'trustar.utils',
+    'get_endpoint_template': 'trustar.utils',
+    'get_request_key': 'trustar.utils',
+    'parse_boolean': 'trustar.utils',
+
+    'configure_logging': 'trustar.logger'
+}
+
+__all__ = sorted(_EXPORTS) + ['__version__', '__api_version__']
+
+if sys.version_info >= (3, 7):
+
+    # import the client, models and their dependencies only when first used (PEP 562), so that ``import trustar`` is
+    # fast for short-lived processes
+    def __getattr__(name):
+        module = _EXPORTS.get(name)
+        if module is None:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+        import importlib
+        value = getattr(importlib.import_module(module), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_EXPORTS))
+
+else:
+    from .logger import configure_logging
+    from .trustar import TruStar
+    from .registry import ClientRegistry, get_client
+    from .pool import TruStarPool
+    from .rate_limit import FileTokenBucket, RateLimitCoordinator, RemoteTokenBucket, TokenBucket
+    from .sharding import ShardedApiClient
+    from .concurrency import AdaptiveConcurrencyLimiter
+    from .batching import IndicatorMetadataBatcher, MicroBatcher
+    from .bloom import BloomFilter, IndicatorFilter
+    from .circuit_breaker import CircuitOpenError
+    from .deadline import CancellationToken, Cancelled, DeadlineExceeded
+    from .whitelist import WhitelistMatcher
+    from .models import *
+    from .utils import *
@@ -1,7 +1,7 @@
 from __future__ import print_function
 from builtins import object, str
-from future import standard_library
 from six import string_types
+from six.moves.urllib.parse import urlencode
 
 # external imports
 import requests
@@ -10,6 +10,88 @@ import time
 from math import ceil
 from requests import HTTPError
 import logging
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# package imports
+from .cache import (DEFAULT_CACHE_SIZE, DEFAULT_NEGATIVE_TTL, DEFAULT_VALIDATOR_CACHE_SIZE, MemoryCacheStorage,
+                    ResponseCache, ValidatorCache, parse_ttls)
+from .circuit_breaker import DEFAULT_FAILURE_RATE, DEFAULT_MIN_REQUESTS, DEFAULT_RESET_TIMEOUT, CircuitBreakers
+from .codec import get_codec
+from .deadline import CancellationToken, DeadlineExceeded
+from .disk_cache import DEFAULT_CACHE_PATH, SQLiteCacheStorage
+from .concurrency import DEFAULT_MAX_CONCURRENCY, AdaptiveConcurrencyLimiter
+from .compression import ACCEPT_ENCODING, TransferStats, get_body_size, get_wire_size, gzip_compress
+from .hedging import DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_QUANTILE, Hedger
+from .hooks import ERROR, POST_RESPONSE, PRE_REQUEST, RETRY, Hooks, RequestEvent, SlowRequestLogger
+from .metrics import Metrics, MetricsLogger
+from .models import RequestQuota
+from .rate_limit import DEFAULT_RESERVED_QUOTA, INTERACTIVE, PRIORITIES, PriorityScheduler, create_rate_limiter
+from .single_flight import SingleFlight
+from .utils import get_endpoint_template, get_request_key
+
+# size of the connection pool kept open to each host
+DEFAULT_MAX_CONNECTIONS = 10
+
+# the longest URL sent; multi-value query parameters are split across several requests to stay under it, since
+# servers and proxies commonly reject URLs over 8 KB
+DEFAULT_MAX_URL_LENGTH = 6000
+
+# seconds to wait for a connection, and between bytes of a response
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+def get_endpoint_class(method, template):
+    """
+    :param str method: The method of the request.
+    :param str template: The endpoint template, i.e. ``"reports/{id}"``.
+    :return: The class of the endpoint, for timeouts: ``"search"``, ``"read"`` or ``"write"``.
+    """
+
+    if 'search' in template.split('/'):
+        return 'search'
+    return 'read' if method in ["GET", "HEAD"] else 'write'
+
+
+def parse_timeouts(value):
+    """
+    Parse per-endpoint timeouts from config.
+
+    :param value: a dictionary mapping endpoints (i.e. ``"POST reports"``), endpoint templates (i.e.
+        ``"reports/{id}"``) or endpoint classes (``"search"``, ``"read"`` or ``"write"``) to a read timeout in seconds
+        or a ``[connect, read]`` pair, or a string of the form ``"search=120,POST reports=90"`` (as found in a .conf
+        file)
+    :return: the dictionary of timeouts, each a ``(connect, read)`` tuple, with ``None`` for the default
+    """
+
+    if value is None:
+        return {}
+    if isinstance(value, string_types):
+        value = dict(pair.split('=', 1) for pair in value.split(',') if pair.strip())
+
+    timeouts = {}
+    for key, timeout in value.items():
+        if isinstance(timeout, (list, tuple)):
+            connect, read = timeout
+            timeouts[key.strip()] = (None if connect is None else float(connect), None if read is None else float(read))
+        else:
+            timeouts[key.strip()] = (None, float(timeout))
+    return timeouts
+
+
+def create_session(max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    :param int max_connections: The number of connections kept open to each host.
+    :return: A ``requests.Session`` with a connection pool of the given size.
+    """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
 class ApiClient(object):
@@ -19,7 +101,7 @@ class ApiClient(object):
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, config=None):
+    def __init__(self, config=None, session=None):
         """
         Constructs and configures the instance.  Initially attempts to use ``config``; if it is ``None``,
         then attempts to use ``config_file`` instead.
@@ -56,8 +138,101 @@ class ApiClient(object):
         +-------------------------+--------------------------------------------------------+
         | ``https_proxy``         | https proxy being used - http(s)://user:pwd@{ip}:{port}|
         +-------------------------+--------------------------------------------------------+
+        | ``compress_requests``   | whether to gzip request bodies above the threshold     |
+        +-------------------------+--------------------------------------------------------+
+        | ``compression_threshold`` | minimum request body size to compress, in bytes      |
+        +-------------------------+--------------------------------------------------------+
+        | ``compression_level``   | gzip compression level for request bodies (1-9)        |
+        +-------------------------+--------------------------------------------------------+
+        | ``coalesce_requests``   | whether identical concurrent GETs share one request    |
+        +-------------------------+--------------------------------------------------------+
+        | ``cache``               | whether to cache responses from read endpoints; either |
+        |                         | ``"memory"`` (or ``True``) or ``"disk"``               |
+        +-------------------------+--------------------------------------------------------+
+        | ``cache_size``          | maximum number of cached responses                     |
+        +-------------------------+--------------------------------------------------------+
+        | ``cache_path``          | path of the SQLite database used by the disk cache     |
+        +-------------------------+--------------------------------------------------------+
+        | ``cache_max_bytes``     | maximum total size of responses in the disk cache      |
+        +-------------------------+--------------------------------------------------------+
+        | ``cache_ttls``          | TTLs in seconds per endpoint template, i.e.            |
+        |                         | ``{"reports/{id}": 60}``                               |
+        +-------------------------+--------------------------------------------------------+
+        | ``negative_cache_ttl``  | how long to cache 404 responses, in seconds            |
+        +-------------------------+--------------------------------------------------------+
+        | ``conditional_requests``| whether to revalidate repeated GETs using the ETag or  |
+        |                         | Last-Modified of the previous response                 |
+        +-------------------------+--------------------------------------------------------+
+        | ``conditional_cache_size`` | number of responses remembered for revalidation     |
+        +-------------------------+--------------------------------------------------------+
+        | ``metrics_log_interval``| seconds between metrics summaries logged at INFO; off  |
+        |                         | if unset                                               |
+        +-------------------------+--------------------------------------------------------+
+        | ``slow_request_threshold`` | log a warning for requests slower than this, in     |
+        |                         | seconds; off if unset                                  |
+        +-------------------------+--------------------------------------------------------+
+        | ``max_connections``     | number of connections kept open to each host           |
+        +-------------------------+--------------------------------------------------------+
+        | ``max_url_length``      | longest URL to send; longer lists of values are split  |
+        |                         | across several requests                                |
+        +-------------------------+--------------------------------------------------------+
+        | ``connect_timeout``     | seconds to wait for a connection                       |
+        +-------------------------+--------------------------------------------------------+
+        | ``read_timeout``        | seconds to wait between bytes of a response            |
+        +-------------------------+--------------------------------------------------------+
+        | ``timeouts``            | read timeouts, or ``[connect, read]`` pairs, per       |
+        |                         | endpoint, endpoint template or endpoint class          |
+        |                         | (``"search"``, ``"read"`` or ``"write"``)              |
+        +-------------------------+--------------------------------------------------------+
+        | ``rate_limit``          | throttle requests to the key's quota: ``"memory"``,    |
+        |                         | ``"file"`` (shared by processes on the host) or        |
+        |                         | ``"coordinator"``; off if unset                        |
+        +-------------------------+--------------------------------------------------------+
+        | ``rate_limit_path``     | directory of the ``"file"`` rate limiter's state       |
+        +-------------------------+--------------------------------------------------------+
+        | ``rate_limit_address``  | address of the |RateLimitCoordinator|, i.e.            |
+        |                         | ``"host:port"`` or the path of a Unix socket           |
+        +-------------------------+--------------------------------------------------------+
+        | ``default_priority``    | priority of requests outside of a |priority| block:    |
+        |                         | ``"interactive"`` or ``"bulk"``                        |
+        +-------------------------+--------------------------------------------------------+
+        | ``reserved_quota``      | fraction of the quota that bulk requests leave for     |
+        |                         | interactive ones                                       |
+        +-------------------------+--------------------------------------------------------+
+        | ``adaptive_concurrency``| whether to limit requests in flight, adjusting the     |
+        |                         | limit to 429s, errors and latency                      |
+        +-------------------------+--------------------------------------------------------+
+        | ``max_concurrency``     | the most requests the adaptive limit allows in flight  |
+        +-------------------------+--------------------------------------------------------+
+        | ``circuit_breaker``     | whether to fail requests to endpoints that keep        |
+        |                         | failing right away, until they recover                 |
+        +-------------------------+--------------------------------------------------------+
+        | ``circuit_failure_rate``| fraction of recent requests to an endpoint that must   |
+        |                         | fail (5xx or no response) to open its circuit          |
+        +-------------------------+--------------------------------------------------------+
+        | ``circuit_min_requests``| recent requests needed before a circuit can open       |
+        +-------------------------+--------------------------------------------------------+
+        | ``circuit_reset_timeout`` | seconds an open circuit waits before a trial        |
+        |                         | request                                                |
+        +-------------------------+--------------------------------------------------------+
+        | ``hedge_requests``      | whether to send a duplicate of slow GETs, using the    |
+        |                         | first response                                         |
+        +-------------------------+--------------------------------------------------------+
+        | ``hedge_delay``         | seconds to wait before hedging; by default, the        |
+        |                         | endpoint's ``hedge_quantile`` latency                  |
+        +-------------------------+--------------------------------------------------------+
+        | ``hedge_quantile``      | latency quantile used as the default ``hedge_delay``   |
+        +-------------------------+--------------------------------------------------------+
+        | ``hedge_budget``        | the most requests that may be hedged, as a fraction of |
+        |                         | all requests                                           |
+        +-------------------------+--------------------------------------------------------+
+        | ``hedge_endpoints``     | endpoint templates to hedge, i.e. ``"reports/{id}"``;  |
+        |                         | all GETs if unset                                      |
+        +-------------------------+--------------------------------------------------------+
 
         :param dict config: A dictionary of configuration options.
+        :param session: A ``requests.Session`` to send requests with, i.e. one shared with other clients (see
+            |TruStarPool|).  By default, the client creates its own, with a pool of ``max_connections`` connections.
         """
 
         # set properties
@@ -71,6 +246,10 @@ class ApiClient(object):
         self.verify = config.get('verify')
         self.retry = config.get('retry')
         self.max_wait_time = config.get('max_wait_time')
+        self.compress_requests = config.get('compress_requests')
+        self.compression_threshold = config.get('compression_threshold')
+        self.compression_level = config.get('compression_level')
+        self.coalesce_requests = config.get('coalesce_requests')
 
         # To support proxy
         self.proxies = dict()
@@ -79,8 +258,124 @@ class ApiClient(object):
         if config.get('https_proxy'):
             self.proxies['https'] = config.get('https_proxy')
 
-        # initialize token property
+        # initialize token property; the lock ensures concurrent requests sharing this client only refresh it once
         self.token = None
+        self._token_lock = threading.Lock()
+
+        # reuse connections (and their TLS sessions) across requests
+        self.max_connections = config.get('max_connections') or DEFAULT_MAX_CONNECTIONS
+        self._owns_session = session is None
+        self.session = session if session is not None else create_session(self.max_connections)
+
+        self.max_url_length = config.get('max_url_length') or DEFAULT_MAX_URL_LENGTH
+        self.connect_timeout = config.get('connect_timeout') or DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = config.get('read_timeout') or DEFAULT_READ_TIMEOUT
+        self.timeouts = parse_timeouts(config.get('timeouts'))
+
+        # the cancellation token of the work the current thread is doing, if any; see |deadline|
+        self._cancellation = threading.local()
+
+        # if set, an object whose ``acquire()`` method blocks until the next request is allowed, i.e. a |TokenBucket|
+        self.rate_limiter = None
+
+        # if configured, the rate limiter is created from the key's quota before the first request
+        self.rate_limit = config.get('rate_limit')
+        self.rate_limit_path = config.get('rate_limit_path')
+        self.rate_limit_address = config.get('rate_limit_address')
+        self._rate_limit_loaded = False
+        self._rate_limit_lock = threading.Lock()
+
+        # the priority of requests: interactive requests go before bulk ones, and can use the quota's reserve
+        self.default_priority = config.get('default_priority') or INTERACTIVE
+        if self.default_priority not in PRIORITIES:
+            raise ValueError("Unknown priority: %s" % self.default_priority)
+        reserved_quota = config.get('reserved_quota')
+        self.reserved_quota = DEFAULT_RESERVED_QUOTA if reserved_quota is None else reserved_quota
+        self._priority = threading.local()
+
+        # whether to wait and retry when rate limited; if not, 429 responses are returned to the caller
+        self.wait_on_rate_limit = True
+
+        # bytes sent and received per endpoint
+        self.transfer_stats = TransferStats()
+
+        # coalesces identical concurrent GETs
+        self.single_flight = SingleFlight()
+
+        # the disk cache (and rate limiter) might be shared with clients using other credentials
+        self.key_id = hashlib.sha256(("%s %s" % (self.base, self.api_key)).encode('utf-8')).hexdigest()[:16]
+        namespace = self.key_id + ':'
+
+        # caches responses from read endpoints
+        self.cache = None
+        if config.get('cache'):
+            cache_size = config.get('cache_size') or DEFAULT_CACHE_SIZE
+            if config.get('cache') == 'disk':
+                storage = SQLiteCacheStorage(path=config.get('cache_path') or DEFAULT_CACHE_PATH,
+                                             max_size=cache_size,
+                                             max_bytes=config.get('cache_max_bytes'))
+            else:
+                storage = MemoryCacheStorage(max_size=cache_size)
+
+            negative_ttl = config.get('negative_cache_ttl')
+            self.cache = ResponseCache(storage=storage,
+                                       ttls=parse_ttls(config.get('cache_ttls')),
+                                       negative_ttl=DEFAULT_NEGATIVE_TTL if negative_ttl is None else negative_ttl,
+                                       namespace=namespace)
+
+        # remembers validators (and bodies) of recent responses, for conditional requests to any endpoint
+        self.validator_cache = None
+        if config.get('conditional_requests'):
+            storage = MemoryCacheStorage(max_size=config.get('conditional_cache_size') or DEFAULT_VALIDATOR_CACHE_SIZE)
+            self.validator_cache = ValidatorCache(storage=storage, namespace=namespace)
+
+        # per-endpoint latency, size, status and retry metrics
+        self.metrics = Metrics()
+        self.metrics.register_source('transfer', self.transfer_stats.snapshot)
+        self.metrics.register_source('single_flight', self.single_flight.stats)
+        if self.cache is not None:
+            self.metrics.register_source('cache', self.cache.stats)
+        if self.validator_cache is not None:
+            self.metrics.register_source('validator_cache', self.validator_cache.stats)
+
+        # limits requests in flight, i.e. from bulk operations and concurrent pagination
+        self.concurrency_limiter = None
+        if config.get('adaptive_concurrency'):
+            self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+                max_limit=config.get('max_concurrency') or DEFAULT_MAX_CONCURRENCY, metrics=self.metrics)
+            self.metrics.register_source('concurrency', self.concurrency_limiter.stats)
+
+        # fails requests to endpoints that keep failing, until they recover
+        self.circuit_breakers = None
+        if config.get('circuit_breaker'):
+            self.circuit_breakers = CircuitBreakers(
+                metrics=self.metrics,
+                failure_rate=config.get('circuit_failure_rate') or DEFAULT_FAILURE_RATE,
+                min_requests=config.get('circuit_min_requests') or DEFAULT_MIN_REQUESTS,
+                reset_timeout=config.get('circuit_reset_timeout') or DEFAULT_RESET_TIMEOUT)
+            self.metrics.register_source('circuit_breakers', self.circuit_breakers.stats)
+
+        # sends a duplicate of slow GETs, to cut tail latency
+        self.hedger = None
+        if config.get('hedge_requests'):
+            hedge_quantile = config.get('hedge_quantile')
+            hedge_budget = config.get('hedge_budget')
+            self.hedger = Hedger(self.metrics,
+                                 delay=config.get('hedge_delay'),
+                                 quantile=DEFAULT_HEDGE_QUANTILE if hedge_quantile is None else hedge_quantile,
+                                 budget=DEFAULT_HEDGE_BUDGET if hedge_budget is None else hedge_budget,
+                                 templates=config.get('hedge_endpoints'),
+                                 max_hedges=self.max_connections)
+            self.metrics.register_source('hedging', self.hedger.stats)
+
+        self.metrics_logger = None
+        if config.get('metrics_log_interval'):
+            self.metrics_logger = MetricsLogger(self.metrics, interval=config.get('metrics_log_interval')).start()
+
+        # functions called before and after each request, i.e. for tracing and profiling
+        self.hooks = Hooks()
+        if config.get('slow_request_threshold'):
+            self.hooks.register(POST_RESPONSE, SlowRequestLogger(threshold=config.get('slow_request_threshold')))
 
     def _get_token(self):
         """
@@ -92,11 +387,24 @@ class ApiClient(object):
             self._refresh_token()
         return self.token
 
-    def _refresh_token(self):
+    def _refresh_token(self, expired_token=None):
         """
         Retrieves the OAuth2 token generated by the user's API key and API secret.
         Sets the instance property 'token' to this new token.
         If the current token is still live, the server will simply return that.
+
+        :param expired_token: The token that was rejected, if any.  If another thread has already replaced it (or
+            obtained the first token) while this one waited for the lock, the token is not requested again.
+        """
+
+        with self._token_lock:
+            if self.token is not None and self.token != expired_token:
+                return
+            self._request_token()
+
+    def _request_token(self):
+        """
+        Requests a new token.  Must be called while holding the token lock; see |_refresh_token|.
         """
 
         # use basic auth with API key and secret
@@ -104,7 +412,7 @@ class ApiClient(object):
 
         # make request
         post_data = {"grant_type": "client_credentials"}
-        response = requests.post(self.auth, auth=client_auth, data=post_data, proxies=self.proxies)
+        response = self.session.post(self.auth, auth=client_auth, data=post_data, proxies=self.proxies)
 
         # raise exception if status code indicates an error
         if 400 <= response.status_code < 600:
@@ -114,7 +422,156 @@ class ApiClient(object):
             raise HTTPError(message, response=response)
 
         # set token property to the received token
-        self.token = response.json()["access_token"]
+        self.token = get_codec().loads(response.content)["access_token"]
+        self.metrics.record_token_refresh()
+
+    def get_priority(self):
+        """
+        :return: The priority of requests made by the current thread; see |priority|.
+        """
+
+        return getattr(self._priority, 'value', None) or self.default_priority
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Sets the priority of the requests made by the current thread within a ``with`` block.
+
+        :param str priority: ``"interactive"`` or ``"bulk"``.
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError("Unknown priority: %s" % priority)
+        previous = getattr(self._priority, 'value', None)
+        self._priority.value = priority
+        try:
+            yield
+        finally:
+            self._priority.value = previous
+
+    def get_cancellation_token(self):
+        """
+        :return: The |CancellationToken| of the requests made by the current thread, if any; see |deadline|.
+        """
+
+        return getattr(self._cancellation, 'value', None)
+
+    @contextmanager
+    def deadline(self, deadline):
+        """
+        Stops the requests made by the current thread within a ``with`` block once a deadline has passed or a token
+        has been cancelled, raising |DeadlineExceeded| or |Cancelled|.  Blocks can be nested; the earliest deadline
+        applies.
+
+        :param deadline: A number of seconds, a |CancellationToken|, or ``None`` to keep the current one.
+        :return: The token, as the target of the ``with`` statement.
+        """
+
+        previous = self.get_cancellation_token()
+        self._cancellation.value = CancellationToken.create(deadline, parent=previous)
+        try:
+            yield self._cancellation.value
+        finally:
+            self._cancellation.value = previous
+
+    def iterate(self, iterable, deadline=None):
+        """
+        Iterates with a deadline: each item (and any page it requires) must be fetched before the deadline, or
+        |DeadlineExceeded| is raised.  The clock starts when this method is called, not when iteration starts.
+
+        :param iterable: The items, i.e. a generator of results from a paginated endpoint.
+        :param deadline: A number of seconds, a |CancellationToken|, or ``None``.
+        :return: A generator of the items.
+        """
+
+        cancellation = CancellationToken.create(deadline)
+        if cancellation is None:
+            return iter(iterable)
+
+        def generate(iterator):
+            while True:
+                with self.deadline(cancellation) as token:
+                    token.check()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+
+        return generate(iter(iterable))
+
+    def get_timeout(self, method, path):
+        """
+        :param str method: The method of the request.
+        :param str path: The path of the request.
+        :return: The ``(connect, read)`` timeout for the request, from the ``timeouts`` of its endpoint, endpoint
+            template or endpoint class, or else the ``connect_timeout`` and ``read_timeout``.
+        """
+
+        template = get_endpoint_template(path)
+        connect, read = None, None
+        for key in ["%s %s" % (method, template), template, get_endpoint_class(method, template)]:
+            if key in self.timeouts:
+                connect, read = self.timeouts[key]
+                break
+        return (self.connect_timeout if connect is None else connect,
+                self.read_timeout if read is None else read)
+
+    def _sleep(self, seconds):
+        """
+        Sleeps, unless the current thread's deadline would pass first; see |CancellationToken.sleep|.
+        """
+
+        cancellation = self.get_cancellation_token()
+        if cancellation is not None:
+            cancellation.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def get_request_quota(self):
+        """
+        Gets the quota of this client's API key.  The request is not rate limited.
+
+        :return: The most restrictive |RequestQuota|, or ``None`` if there is none or it can't be fetched.
+        """
+
+        try:
+            response = self._send("GET", "request-quotas", rate_limited=False)
+        except requests.RequestException as e:
+            self.logger.warning("Failed to get request quotas: %s", e)
+            return None
+        if response.status_code != 200:
+            self.logger.warning("Failed to get request quotas: %s", response.status_code)
+            return None
+
+        quotas = [RequestQuota.from_dict(quota) for quota in get_codec().loads(response.content)]
+        quotas = [quota for quota in quotas if quota.max_requests and quota.time_window]
+        if not quotas:
+            return None
+        return min(quotas, key=lambda quota: quota.max_requests / float(quota.time_window))
+
+    def _load_rate_limiter(self):
+        """
+        Creates the rate limiter configured with ``rate_limit`` from the key's quota.  Requests from other threads wait
+        until it is ready.
+        """
+
+        with self._rate_limit_lock:
+            if self._rate_limit_loaded:
+                return
+
+            if self.rate_limiter is None:
+                quota = self.get_request_quota()
+                if quota is None:
+                    self.logger.warning("No request quota found; requests will not be rate limited.")
+                else:
+                    bucket = create_rate_limiter(self.rate_limit, quota, name=self.key_id,
+                                                 path=self.rate_limit_path, address=self.rate_limit_address)
+                    self.rate_limiter = PriorityScheduler(bucket, reserved=self.reserved_quota,
+                                                          get_priority=self.get_priority)
+
+            # only once the limiter exists, so that other threads don't send unthrottled in the meantime
+            self._rate_limit_loaded = True
 
     def _get_headers(self, is_json=False):
         """
@@ -124,7 +581,8 @@ class ApiClient(object):
         :return: The headers dictionary.
         """
 
-        headers = {"Authorization": "Bearer " + self._get_token()}
+        headers = {"Authorization": "Bearer " + self._get_token(),
+                   "Accept-Encoding": ACCEPT_ENCODING}
 
         if self.client_type is not None:
             headers["Client-Type"] = self.client_type
@@ -154,61 +612,240 @@ class ApiClient(object):
 
         if response.status_code == 400:
             try:
-                body = response.json()
+                body = get_codec().loads(response.content)
                 if str(body.get('error_description')) in [EXPIRED_MESSAGE, INVALID_MESSAGE]:
                     return True
             except:
                 pass
         return False
 
-    def request(self, method, path, headers=None, params=None, data=None, **kwargs):
+    def request(self, method, path, headers=None, params=None, data=None, json=None, **kwargs):
         """
         A wrapper around ``requests.request`` that handles boilerplate code specific to TruStar's API.
 
         :param str method: The method of the request (``GET``, ``PUT``, ``POST``, or ``DELETE``)
         :param str path: The path of the request, i.e. the piece of the URL after the base URL
         :param dict headers: A dictionary of headers that will be merged with the base headers for the SDK
+        :param json: An object to send as the json body of the request.  It is encoded once, up front, with the
+            SDK's |JsonCodec|; pass either this or ``data``, not both.
         :param kwargs: Any extra keyword arguments.  These will be forwarded to the call to ``requests.request``.
         :return: The response object.
         """
 
+        # encode json body to bytes once, so it is not re-encoded on every retry
+        if json is not None:
+            data = get_codec().dumps(json)
+
+        # streamed bodies can only be read once, so they can't be shared or cached
+        shareable = method == "GET" and not kwargs.get('stream')
+        request_key = get_request_key(method, path, params, headers) if shareable else None
+
+        # responses from read endpoints are cached outright; others can still be revalidated with conditional requests
+        cache = None
+        if shareable and self.cache is not None and self.cache.is_cacheable(path):
+            cache = self.cache
+        elif shareable and self.validator_cache is not None:
+            cache = self.validator_cache
+
+        def fetch():
+            # if an expired response can be revalidated, make a conditional request
+            stale = cache.get_stale(request_key) if cache is not None else None
+            request_headers = headers
+            if stale is not None:
+                request_headers = dict(headers or {})
+                request_headers.update(stale.get_validators())
+
+            response = self._send(method, path, headers=request_headers, params=params, data=data, **kwargs)
+
+            if stale is not None:
+                response = cache.revalidate(request_key, stale, response)
+            elif cache is not None:
+                cache.set(request_key, path, response)
+
+            return response
+
+        response = None
+        if cache is not None:
+            response = cache.get(request_key)
+
+        if response is None:
+            # identical concurrent GETs share a single request
+            if shareable and self.coalesce_requests:
+                response = self.single_flight.do(request_key, fetch, cancellation=self.get_cancellation_token())
+            else:
+                response = fetch()
+
+        try:
+            self._raise_for_status(response)
+        except HTTPError as e:
+            if ERROR in self.hooks:
+                event = RequestEvent(method, path, "%s %s" % (method, get_endpoint_template(path)), params=params)
+                event.set_response(response, None)
+                event.error = e
+                self.hooks.dispatch(ERROR, event)
+            raise
+
+        return response
+
+    def _send(self, method, path, headers=None, params=None, data=None, rate_limited=True, **kwargs):
+        """
+        Sends a request, refreshing the token and retrying as necessary.  This method is intended for internal use;
+        see |request|.
+
+        :param boolean rate_limited: Whether to wait for the rate limiter; ``False`` for the request for the quota
+            that the rate limiter is created from.
+        :return: The response object, which might have an error status code.
+        """
+
+        if rate_limited and self.rate_limit and not self._rate_limit_loaded:
+            self._load_rate_limiter()
+
+        endpoint = "%s %s" % (method, get_endpoint_template(path))
+
+        # compress large bodies once, up front
+        body_size = get_body_size(data)
+        sent_size = body_size
+        if self.compress_requests and body_size is not None and body_size >= self.compression_threshold:
+            data = gzip_compress(data, level=self.compression_level)
+            sent_size = len(data)
+            headers = dict(headers or {})
+            headers['Content-Encoding'] = 'gzip'
+
+        # an explicit timeout overrides the configured ones
+        timeout = kwargs.pop('timeout') if 'timeout' in kwargs else self.get_timeout(method, path)
+        cancellation = self.get_cancellation_token()
+
         retry = self.retry
-        attempted = False
-        while not attempted or retry:
-
-            # get headers and merge with headers from method parameter if it exists
-            base_headers = self._get_headers(is_json=method in ["POST", "PUT"])
-            if headers is not None:
-                base_headers.update(headers)
-
-            url = "{}/{}".format(self.base, path)
-
-            # make request
-            response = requests.request(method=method,
-                                        url=url,
-                                        headers=base_headers,
-                                        verify=self.verify,
-                                        params=params,
-                                        data=data,
-                                        proxies=self.proxies,
-                                        **kwargs)
-            attempted = True
+        attempt = 0
+        while attempt == 0 or retry:
+            attempt += 1
+
+            if cancellation is not None:
+                cancellation.check()
+
+            # fail right away, without using quota, if the endpoint is failing
+            breakers = self.circuit_breakers
+            if breakers is not None:
+                breakers.check(endpoint)
+
+            try:
+                # wait until the rate limiter, if any, allows another request
+                if rate_limited and self.rate_limiter is not None:
+                    if cancellation is None:
+                        self.rate_limiter.acquire()
+                    elif not self.rate_limiter.acquire(timeout=cancellation.remaining()):
+                        raise DeadlineExceeded("Deadline exceeded waiting for the rate limit")
+
+                # get headers and merge with headers from method parameter if it exists
+                base_headers = self._get_headers(is_json=method in ["POST", "PUT"])
+                token = self.token
+                if headers is not None:
+                    base_headers.update(headers)
+
+                url = "{}/{}".format(self.base, path)
+
+                # wait for a slot, if the number of requests in flight is limited
+                limiter = self.concurrency_limiter
+                slot = None
+                if limiter is not None:
+                    slot = limiter.acquire(self.get_priority(),
+                                           timeout=cancellation.remaining() if cancellation is not None else None)
+                    if slot is None:
+                        raise DeadlineExceeded("Deadline exceeded waiting for a concurrency slot")
+            except BaseException:
+                # the request was never sent, so if it was a half-open circuit's trial, let the next one be instead
+                if breakers is not None:
+                    breakers.cancel(endpoint)
+                raise
+
+            # requests in flight can't be interrupted, so they must time out by the deadline
+            # make request; the slot (and the half-open trial, if any) is given up on any error
+            try:
+                request_timeout = timeout if cancellation is None else cancellation.get_timeout(timeout)
+
+                event = RequestEvent(method, path, endpoint, url=url, params=params, attempt=attempt,
+                                     request_size=body_size, sent_size=sent_size, start=time.time())
+                self.hooks.dispatch(PRE_REQUEST, event)
+
+                def send():
+                    return self.session.request(method=method,
+                                                url=url,
+                                                headers=base_headers,
+                                                verify=self.verify,
+                                                params=params,
+                                                data=data,
+                                                proxies=self.proxies,
+                                                timeout=request_timeout,
+                                                **kwargs)
+
+                hedger = self.hedger
+                if hedger is not None and hedger.is_hedgeable(method, path, stream=kwargs.get('stream')):
+                    response = hedger.send(endpoint, send, can_hedge=self._try_acquire_rate_limit,
+                                           cancellation=cancellation)
+                else:
+                    response = send()
+            except requests.RequestException as e:
+                event.elapsed = time.time() - event.start
+                event.error = e
+
+                # a timeout cut short by the caller's deadline says nothing about the endpoint's health
+                if isinstance(e, requests.Timeout) and cancellation is not None and cancellation.expired:
+                    if limiter is not None:
+                        limiter.abandon(slot)
+                    if breakers is not None:
+                        breakers.cancel(endpoint)
+                    self.metrics.record_call(endpoint, None, event.elapsed, sent_size)
+                    self.hooks.dispatch(ERROR, event)
+                    raise DeadlineExceeded("Deadline exceeded waiting for %s" % endpoint)
+
+                if limiter is not None:
+                    limiter.release(slot, endpoint, None, event.elapsed)
+                if breakers is not None:
+                    breakers.record(endpoint, None)
+                self.metrics.record_call(endpoint, None, event.elapsed, sent_size)
+                self.hooks.dispatch(ERROR, event)
+                raise
+            except BaseException:
+                # i.e. an interrupt: not an outcome of the request, so it shouldn't shrink the limit or open the circuit
+                if limiter is not None:
+                    limiter.abandon(slot)
+                if breakers is not None:
+                    breakers.cancel(endpoint)
+                raise
+
+            event.set_response(response, time.time() - event.start)
+            if limiter is not None:
+                limiter.release(slot, endpoint, response.status_code, event.elapsed)
+            if breakers is not None:
+                breakers.record(endpoint, response.status_code)
+            self.metrics.record_call(endpoint, response.status_code, event.elapsed, sent_size)
+            self._record_transfer(endpoint, response, body_size, sent_size, stream=kwargs.get('stream'))
+            self.hooks.dispatch(POST_RESPONSE, event)
 
             # log request
-            self.logger.debug("%s %s. Trace-Id: %s. Params: %s", method, url, response.headers.get('Trace-Id'), params)
+            self.logger.debug("%s %s. Trace-Id: %s. Params: %s", method, url, event.trace_id, params)
 
             # refresh token if expired
             if self._is_expired_token_response(response):
-                self._refresh_token()
+                self._refresh_token(expired_token=token)
+                if retry:
+                    event.reason = 'token_expired'
+                    self.metrics.record_retry(endpoint, event.reason)
+                    self.hooks.dispatch(RETRY, event)
 
             # if "too many requests" status code received, wait until next request will be allowed and retry
-            elif retry and response.status_code == 429:
-                wait_time = ceil(response.json().get('waitTime') / 1000)
+            elif retry and self.wait_on_rate_limit and response.status_code == 429:
+                wait_time = ceil(get_codec().loads(response.content).get('waitTime') / 1000)
                 self.logger.debug("Waiting %d seconds until next request allowed." % wait_time)
 
                 # if wait time exceeds max wait time, allow the exception to be thrown
                 if wait_time <= self.max_wait_time:
-                    time.sleep(wait_time)
+                    event.reason = 'rate_limited'
+                    event.wait_time = wait_time
+                    self.metrics.record_retry(endpoint, event.reason)
+                    self.metrics.record_rate_limit_wait(endpoint, wait_time)
+                    self.hooks.dispatch(RETRY, event)
+                    self._sleep(wait_time)
                 else:
                     retry = False
 
@@ -216,13 +853,22 @@ class ApiClient(object):
             else:
                 retry = False
 
-        # raise exception if status code indicates an error
+        return response
+
+    @staticmethod
+    def _raise_for_status(response):
+        """
+        Raises an ``HTTPError`` if the status code of a response indicates an error.
+
+        :param response: The response object.
+        """
+
         if 400 <= response.status_code < 600:
 
             # get response json body, if one exists
             resp_json = None
             try:
-                resp_json = response.json()
+                resp_json = get_codec().loads(response.content)
             except:
                 pass
 
@@ -239,7 +885,119 @@ class ApiClient(object):
             # raise HTTPError
             raise HTTPError(message, response=response)
 
-        return response
+    def invalidate_cache(self, path=None, template=None):
+        """
+        Removes cached responses, if caching is enabled.  With no arguments, the entire cache is cleared.
+
+        :param str path: Remove responses to requests whose path starts with this, i.e. ``"reports/<id>"``.
+        :param str template: Remove responses from this endpoint template, i.e. ``"reports/{id}"``.
+        """
+
+        if self.cache is not None:
+            self.cache.invalidate(path=path, template=template)
+
+    def _try_acquire_rate_limit(self):
+        """
+        Takes a request from the rate limiter without waiting, for requests that are only worth sending right away
+        (i.e. hedges).
+
+        :return: Whether a request may be sent.
+        """
+
+        if self.rate_limiter is None:
+            return True
+        return self.rate_limiter.try_acquire()
+
+    def close(self):
+        """
+        Closes the pooled connections (unless the session was passed in) and stops the periodic metrics logger, if
+        any.  The client can still be used afterwards, but will have to open new connections.
+        """
+
+        if self._owns_session:
+            self.session.close()
+        if self.metrics_logger is not None:
+            self.metrics_logger.stop()
+        if self.hedger is not None:
+            self.hedger.close()
+
+    def _record_transfer(self, endpoint, response, body_size, sent_size, stream=False):
+        """
+        Records the number of bytes sent and received for a request.  For a successful streamed response, the body
+        has not been read yet, so the response is recorded once it has been consumed.
+
+        :param str endpoint: The endpoint, i.e. ``"GET indicators"``.
+        :param response: The response object.
+        :param int body_size: The size of the request body before compression.
+        :param int sent_size: The size of the request body that was sent.
+        :param boolean stream: Whether the response was requested with ``stream=True``.
+        """
+
+        self.transfer_stats.record_request(endpoint, body_size, sent_size)
+
+        if stream and response.status_code < 400:
+            def on_body_consumed(size):
+                self.transfer_stats.record_response(endpoint, size, get_wire_size(response))
+                self.metrics.record_response_size(endpoint, size)
+            response.on_body_consumed = on_body_consumed
+        else:
+            self.transfer_stats.record_response(endpoint, len(response.content), get_wire_size(response))
+            self.metrics.record_response_size(endpoint, len(response.content))
+
+    def split_params(self, path, params, keys):
+        """
+        Splits the values of multi-value query parameters across several sets of parameters, so that the URL of each
+        request fits in ``max_url_length``.
+
+        Example:
+
+        >>> client.split_params("indicators/metadata", {'values': values, 'types': types}, ['values', 'types'])
+
+        :param str path: The path of the request.
+        :param dict params: The query parameters.
+        :param list keys: The parameters whose values are split.  They are split in step, so that the values at the
+            same position (i.e. an indicator value and its type) stay together; a parameter may also be ``None``.
+        :return: A list of query parameters, one for each request, with the values in their original order.
+        """
+
+        def encoded_length(key, value):
+            # requests leaves out None values, and joins parameters with '&'
+            if value is None:
+                return 0
+            return len(urlencode([(key, value)])) + 1
+
+        fixed = dict((k, v) for k, v in params.items() if k not in keys)
+        fixed_length = sum(encoded_length(k, x) for k, v in fixed.items()
+                           for x in (v if isinstance(v, (list, tuple)) else [v]))
+        budget = self.max_url_length - len("{}/{}?".format(self.base, path)) - fixed_length
+
+        lists = dict((k, [params[k]] if isinstance(params[k], string_types) else list(params[k]))
+                     for k in keys if params.get(k) is not None)
+        count = max([len(v) for v in lists.values()] or [0])
+
+        chunks = []
+        chunk = []
+        length = 0
+        for i in range(count):
+            item_length = sum(encoded_length(k, v[i]) for k, v in lists.items() if i < len(v))
+            # a single value too long for the URL gets a request to itself, and fails there
+            if chunk and length + item_length > budget:
+                chunks.append(chunk)
+                chunk = []
+                length = 0
+            chunk.append(i)
+            length += item_length
+        if chunk or not chunks:
+            chunks.append(chunk)
+
+        result = []
+        for chunk in chunks:
+            chunk_params = dict(fixed)
+            for key in keys:
+                values = lists.get(key)
+                chunk_params[key] = None if values is None else [values[i] for i in chunk if i < len(values)]
+            result.append(chunk_params)
+        return result
 
     def get(self, path, params=None, **kwargs):
         """
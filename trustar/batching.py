@@ -0,0 +1,212 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+from six import string_types
+
+# external imports
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# package imports
+from .models import Indicator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 100
+
+# how long the first item of a batch waits for others to join it, in seconds
+DEFAULT_MAX_DELAY = 0.005
+
+
+class MicroBatcher(object):
+    """
+    Collects items submitted one at a time, i.e. by many threads, into batches, so that a function accepting a list
+    is called once per batch instead of once per item.  A batch is sent when it has ``max_batch_size`` items, or when
+    its first item has waited ``max_delay`` seconds.  Batches are sent by a pool of threads, so a slow batch doesn't
+    hold up the next.
+
+    Identical items in a batch are only sent once.  All methods are thread-safe.
+    """
+
+    def __init__(self, func, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY, max_workers=4):
+        """
+        :param func: A function taking a list of items, and returning a list of results, one for each item.
+        :param int max_batch_size: The most items in a batch.
+        :param float max_delay: The most seconds an item waits for a batch to fill.
+        :param int max_workers: The number of batches sent at once.
+        """
+
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._queue = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._collect, name="micro-batcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.submitted = 0
+        self.batches = 0
+
+    def get_key(self, item):
+        """
+        :return: The key identifying identical items.
+        """
+
+        return item
+
+    def submit(self, item):
+        """
+        Adds an item to the next batch.
+
+        :return: A ``Future`` of the item's result.
+        """
+
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed batcher")
+            self._queue.append((time.time(), item, future))
+            self.submitted += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch_size:
+                self._condition.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+
+                # let the batch fill until its first item has waited long enough
+                send_at = self._queue[0][0] + self.max_delay
+                while len(self._queue) < self.max_batch_size and not self._closed:
+                    remaining = send_at - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                self.batches += 1
+
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        futures = OrderedDict()
+        for _, item, future in batch:
+            # futures cancelled by their callers are skipped; the rest can't be cancelled from now on
+            if future.set_running_or_notify_cancel():
+                futures.setdefault(self.get_key(item), (item, []))[1].append(future)
+        if not futures:
+            return
+
+        items = [item for item, _ in futures.values()]
+        try:
+            results = list(self.func(items))
+            if len(results) != len(items):
+                raise ValueError("Batch function returned %d results for %d items" % (len(results), len(items)))
+        except Exception as e:
+            for _, item_futures in futures.values():
+                for future in item_futures:
+                    future.set_exception(e)
+            return
+
+        for (_, item_futures), result in zip(futures.values(), results):
+            for future in item_futures:
+                future.set_result(result)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'submitted': self.submitted,
+                'batches': self.batches,
+                'queued': len(self._queue)
+            }
+
+    def close(self, wait=True):
+        """
+        Sends the items already submitted, and stops accepting more.
+
+        :param boolean wait: Whether to wait until every batch has been sent, or only until it has been started.
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class IndicatorMetadataBatcher(MicroBatcher):
+    """
+    Batches single-indicator lookups into calls to |get_indicators_metadata|, so that a stream processor asking about
+    one indicator at a time, from many threads, makes a handful of requests instead of one per indicator.
+
+    Example:
+
+    >>> with ts.get_metadata_batcher() as batcher:
+    >>>     future = batcher.submit("evil.com")
+    >>>     indicator = future.result()
+
+    Each future's result is an |Indicator| with its metadata, or ``None`` if the indicator isn't known (or is known
+    with another type than the one submitted).
+    """
+
+    def __init__(self, client, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY, max_workers=4,
+                 prefilter=None):
+        """
+        :param client: The |TruStar| instance to request metadata with.
+        :param prefilter: An |IndicatorFilter| of the known indicators.  Lookups it rules out resolve to ``None``
+            without joining a batch.
+        """
+
+        self.client = client
+        self.prefilter = prefilter
+        super(IndicatorMetadataBatcher, self).__init__(self._get_metadata, max_batch_size=max_batch_size,
+                                                       max_delay=max_delay, max_workers=max_workers)
+
+    def get_key(self, indicator):
+        return indicator.value, indicator.type
+
+    def submit(self, indicator):
+        """
+        :param indicator: An indicator value, or an |Indicator| with a value and, optionally, a type.
+        :return: A ``Future`` of the |Indicator| with its metadata, or of ``None``.
+        """
+
+        if isinstance(indicator, string_types):
+            indicator = Indicator(value=indicator)
+
+        if self.prefilter is not None and not self.prefilter.might_exist(indicator):
+            future = Future()
+            future.set_result(None)
+            return future
+
+        return super(IndicatorMetadataBatcher, self).submit(indicator)
+
+    def _get_metadata(self, indicators):
+        # the API only returns the indicators it knows, so results are matched to requests by value and type
+        found = {}
+        for result in self.client.get_indicators_metadata(indicators):
+            found.setdefault(result.value, []).append(result)
+
+        results = []
+        for indicator in indicators:
+            matches = [r for r in found.get(indicator.value, []) if indicator.type in (None, r.type)]
+            results.append(matches[0] if matches else None)
+        return results
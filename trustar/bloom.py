@@ -0,0 +1,284 @@
+# python 2 backwards compatibility
+from __future__ import division, print_function
+from builtins import object
+from six import text_type
+
+# external imports
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+
+# package imports
+from .models import Indicator
+from .utils import _write_atomically, get_current_time_millis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.01
+
+# how far back each sync reaches before the end of the last one, in milliseconds, to pick up indicators that were
+# indexed after it ran
+DEFAULT_SYNC_OVERLAP = 60 * 60 * 1000
+
+# file format: magic, version, number of bits, number of hashes, number of values added, and the time the filter was
+# last synced to (-1 if never), followed by the bits
+_MAGIC = b'TSBF'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBQIQq')
+
+
+def normalize(value):
+    """
+    Normalizes an indicator value for the filter.  Values are lowercased, so the filter can't tell apart values that
+    only differ in case (i.e. URL paths); that only adds false positives, never false negatives.
+    """
+
+    if not isinstance(value, text_type):
+        value = value.decode('utf-8') if isinstance(value, bytes) else text_type(value)
+    return value.strip().lower()
+
+
+class BloomFilter(object):
+    """
+    A set that can answer "definitely not present" or "possibly present", in a fixed amount of memory: about 1.2 bytes
+    per value for a 1% false positive rate.  Values can be added, but not removed.
+
+    The bits can be saved to a file and memory-mapped back, so that a large filter is ready without reading it in
+    (pages are loaded as lookups touch them).  A mapped filter can still be added to; the additions stay in memory
+    until it is saved again.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, num_bits=None, num_hashes=None,
+                 bits=None, count=0):
+        """
+        :param int capacity: The number of values the filter is sized for.
+        :param float error_rate: The false positive rate once ``capacity`` values have been added.
+        """
+
+        if num_bits is None:
+            num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            num_bits = (num_bits + 7) // 8 * 8
+        if num_hashes is None:
+            num_hashes = max(int(round(num_bits / capacity * math.log(2))), 1)
+
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.capacity = capacity
+        self.count = count
+        self._bits = bits if bits is not None else bytearray(num_bits // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, value):
+        # double hashing: k positions from two 64-bit hashes
+        digest = hashlib.sha256(normalize(value).encode('utf-8')).digest()
+        h1, h2 = struct.unpack('<QQ', digest[:16])
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        positions = self._positions(value)
+        with self._lock:
+            for position in positions:
+                index = position >> 3
+                self._bits[index] = _byte(self._bits[index]) | (1 << (position & 7))
+            self.count += 1
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        bits = self._bits
+        return all(_byte(bits[position >> 3]) & (1 << (position & 7)) for position in self._positions(value))
+
+    def __len__(self):
+        """
+        The number of values added, counting duplicates.
+        """
+
+        return self.count
+
+    @property
+    def error_rate(self):
+        """
+        The estimated false positive rate, given the number of values added.
+        """
+
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path, synced_to=None):
+        """
+        Writes the filter to a file, replacing it atomically.
+
+        :param str path: The path of the file.
+        :param int synced_to: A timestamp (in milliseconds) to store with the filter; see |IndicatorFilter|.
+        """
+
+        header = _HEADER.pack(_MAGIC, _VERSION, self.num_bits, self.num_hashes, self.count,
+                              -1 if synced_to is None else synced_to)
+        with self._lock:
+            bits = bytes(bytearray(self._bits[:]))
+        _write_atomically(path, header + bits)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Reads a filter written by |save|.
+
+        :param str path: The path of the file.
+        :param boolean use_mmap: Whether to map the file into memory rather than read it.
+        :return: A tuple of the filter and the timestamp stored with it (or ``None``).
+        """
+
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError("Not a Bloom filter: %s" % path)
+            magic, version, num_bits, num_hashes, count, synced_to = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError("Not a Bloom filter: %s" % path)
+
+            if use_mmap:
+                # copy-on-write, so that values can be added without changing the file
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+                bits = memoryview(mapped)[_HEADER.size:]
+            else:
+                bits = bytearray(f.read())
+            if len(bits) * 8 != num_bits:
+                raise ValueError("Truncated Bloom filter: %s" % path)
+
+        capacity = max(int(round(num_bits * math.log(2) / num_hashes)), 1)
+        bloom = cls(capacity=capacity, num_bits=num_bits, num_hashes=num_hashes, bits=bits, count=count)
+        return bloom, None if synced_to < 0 else synced_to
+
+
+def _byte(value):
+    # indexing bytes gives a str of length 1 in python 2
+    return value if isinstance(value, int) else ord(value)
+
+
+class IndicatorFilter(object):
+    """
+    A prefilter for indicator enrichment: a |BloomFilter| of the indicators known to the user's enclaves, so that
+    lookups of indicators that are definitely unknown (usually most of them) can skip the request.  It can be filled
+    from a local mirror with |add|, or from the API with |sync|, which only fetches the indicators updated since the
+    last sync.
+
+    Example:
+
+    >>> prefilter = IndicatorFilter.open("indicators.bloom", capacity=5000000)
+    >>> prefilter.sync(ts, enclave_ids=enclave_ids)
+    >>> prefilter.save()
+    >>> metadata = ts.get_indicators_metadata(indicators, prefilter=prefilter)
+
+    Indicators are removed from TruSTAR rarely enough that a filter is never cleared; rebuild it now and then to drop
+    them, and whenever it grows well past its capacity (see |error_rate|).
+    """
+
+    def __init__(self, bloom=None, path=None, synced_to=None):
+        """
+        :param bloom: The |BloomFilter|; by default, an empty one of the default size.
+        :param str path: The file |save| writes to.
+        :param int synced_to: The time (in milliseconds) up to which indicators have been synced.
+        """
+
+        self.bloom = bloom if bloom is not None else BloomFilter()
+        self.path = path
+        self.synced_to = synced_to
+
+    @classmethod
+    def open(cls, path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, use_mmap=True):
+        """
+        Loads the filter saved at a path, or creates an empty one that will be saved there.
+
+        :param str path: The path of the file.
+        :param int capacity: The number of indicators a new filter is sized for.
+        :param float error_rate: The false positive rate of a new filter.
+        :param boolean use_mmap: Whether to map an existing file into memory rather than read it.
+        :return: The |IndicatorFilter|.
+        """
+
+        if os.path.exists(path):
+            bloom, synced_to = BloomFilter.load(path, use_mmap=use_mmap)
+            return cls(bloom, path=path, synced_to=synced_to)
+        return cls(BloomFilter(capacity=capacity, error_rate=error_rate), path=path)
+
+    def add(self, indicators):
+        """
+        :param indicators: Indicator values, or |Indicator| objects.
+        """
+
+        for indicator in indicators:
+            self.bloom.add(indicator.value if isinstance(indicator, Indicator) else indicator)
+
+    def sync(self, client, enclave_ids=None, from_time=None, to_time=None, page_size=1000,
+             overlap=DEFAULT_SYNC_OVERLAP):
+        """
+        Adds the indicators updated in the user's enclaves since the last sync, using |get_indicators|.  The first
+        sync of a filter fetches every indicator, so that none are ruled out.
+
+        :param client: The |TruStar| instance to fetch indicators with.
+        :param list(str) enclave_ids: The enclaves to fetch indicators from; by default, all of the user's.
+        :param int from_time: Start of the time window, in milliseconds since epoch; by default, the end of the last
+            sync less ``overlap`` (or, on the first sync, the beginning of time).
+        :param int to_time: End of the time window, in milliseconds since epoch; by default, now.
+        :param int page_size: The number of indicators per request.
+        :param int overlap: How far back before the end of the last sync to start, in milliseconds, so that indicators
+            indexed after it ran aren't missed.
+        :return: The number of indicators fetched, counting those already in the filter.
+        """
+
+        if from_time is None:
+            from_time = 0 if self.synced_to is None else max(self.synced_to - overlap, 0)
+        to_time = get_current_time_millis() if to_time is None else to_time
+
+        added = 0
+        for indicator in client.get_indicators(from_time=from_time, to_time=to_time, enclave_ids=enclave_ids,
+                                               page_size=page_size):
+            self.bloom.add(indicator.value)
+            added += 1
+
+        self.synced_to = to_time
+        if len(self.bloom) > self.bloom.capacity:
+            logger.warning("Indicator filter holds %d values, more than the %d it was sized for; its false positive "
+                           "rate is about %.1f%%.", len(self.bloom), self.bloom.capacity, self.bloom.error_rate * 100)
+        return added
+
+    def might_exist(self, indicator):
+        """
+        :param indicator: An indicator value, or an |Indicator|.
+        :return: ``False`` if the indicator is definitely unknown; ``True`` if it might be known.
+        """
+
+        return (indicator.value if isinstance(indicator, Indicator) else indicator) in self.bloom
+
+    __contains__ = might_exist
+
+    def filter(self, indicators):
+        """
+        :param indicators: Indicator values, or |Indicator| objects.
+        :return: The indicators that might be known, in the same order.
+        """
+
+        return [indicator for indicator in indicators if self.might_exist(indicator)]
+
+    @property
+    def error_rate(self):
+        return self.bloom.error_rate
+
+    def save(self, path=None):
+        """
+        Writes the filter, and the time it was synced to, to a file.
+
+        :param str path: The path of the file; by default, the one it was opened from.
+        """
+
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the indicator filter to")
+        self.bloom.save(path, synced_to=self.synced_to)
+        self.path = path
@@ -0,0 +1,413 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str, super
+from six import string_types
+
+# external imports
+from collections import OrderedDict
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# package imports
+from .utils import get_endpoint_template
+
+logger = logging.getLogger(__name__)
+
+# how long (in seconds) successful responses from each cacheable endpoint are kept; other endpoints are never cached
+DEFAULT_CACHE_TTLS = {
+    'enclaves': 300,
+    'reports/tags': 300,
+    'indicators/tags': 300,
+    'indicators/community-trending': 600,
+    'reports/{id}': 60,
+    'indicators/metadata': 60
+}
+
+# how long (in seconds) a 404 from a cacheable endpoint is remembered
+DEFAULT_NEGATIVE_TTL = 30
+
+DEFAULT_CACHE_SIZE = 1000
+
+# how many responses are remembered for conditional requests
+DEFAULT_VALIDATOR_CACHE_SIZE = 100
+
+
+def parse_ttls(value):
+    """
+    Parse per-endpoint TTLs from config.
+
+    :param value: a dictionary mapping endpoint templates to TTLs in seconds, or a string of the form
+        ``"enclaves=300,reports/{id}=60"`` (as found in a .conf file)
+    :return: the dictionary of TTLs
+    """
+
+    if value is None:
+        return {}
+    if isinstance(value, string_types):
+        value = dict(pair.split('=', 1) for pair in value.split(',') if pair.strip())
+    return dict((k.strip(), float(v)) for k, v in value.items())
+
+
+class CacheEntry(object):
+    """
+    A cached response, stored as plain data so that it can be kept in memory or serialized to disk.
+    """
+
+    def __init__(self, key, path, template, status_code, headers, content, url=None, encoding=None, reason=None,
+                 created=None, expires=None):
+
+        self.key = key
+        self.path = path
+        self.template = template
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+        self.encoding = encoding
+        self.reason = reason
+        self.created = created
+        self.expires = expires
+
+    @classmethod
+    def from_response(cls, key, path, response, created, expires):
+        """
+        :param str key: The cache key.
+        :param str path: The path of the request.
+        :param response: The ``requests`` response object.  Its body must already have been read.
+        :param float created: The time the entry was created, in seconds since epoch.
+        :param float expires: The time the entry expires, in seconds since epoch.
+        :return: The entry.
+        """
+
+        return cls(key=key,
+                   path=path.strip('/'),
+                   template=get_endpoint_template(path),
+                   status_code=response.status_code,
+                   headers=dict(response.headers),
+                   content=response.content,
+                   url=response.url,
+                   encoding=response.encoding,
+                   reason=response.reason,
+                   created=created,
+                   expires=expires)
+
+    def to_response(self):
+        """
+        :return: A new ``requests`` response object equivalent to the cached one, with ``from_cache`` set to
+            ``True``.
+        """
+
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.url = self.url
+        response.encoding = self.encoding
+        response.reason = self.reason
+        response.from_cache = True
+        return response
+
+    def is_expired(self, now):
+        return self.expires is not None and now >= self.expires
+
+    def get_validators(self):
+        """
+        :return: The headers to send to revalidate this entry with a conditional request, i.e. ``If-None-Match``.
+            Empty if the server did not provide an ``ETag`` or ``Last-Modified`` header.
+        """
+
+        headers = CaseInsensitiveDict(self.headers)
+        validators = {}
+        if headers.get('ETag') is not None:
+            validators['If-None-Match'] = headers['ETag']
+        if headers.get('Last-Modified') is not None:
+            validators['If-Modified-Since'] = headers['Last-Modified']
+        return validators
+
+
+class MemoryCacheStorage(object):
+    """
+    Stores cache entries in memory, evicting the least recently used entry once ``max_size`` is reached.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # mark as most recently used
+                del self._entries[key]
+                self._entries[key] = entry
+            return entry
+
+    def set(self, entry):
+        with self._lock:
+            self._entries.pop(entry.key, None)
+            self._entries[entry.key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def find(self, path=None, template=None):
+        """
+        :return: The keys of the entries whose path starts with ``path`` and whose endpoint template is ``template``
+            (either can be ``None`` to match anything).
+        """
+
+        with self._lock:
+            return [key for key, entry in self._entries.items()
+                    if (path is None or entry.path.startswith(path)) and (template is None or
+                                                                         entry.template == template)]
+
+    def clear(self, prefix=''):
+        """
+        Removes the entries whose key starts with ``prefix``; by default, all of them.
+        """
+
+        with self._lock:
+            if not prefix:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache(object):
+    """
+    Caches responses to ``GET`` requests to read endpoints that change rarely, each for its own TTL.  404 responses are
+    cached too (for ``negative_ttl`` seconds), so repeated lookups of something that doesn't exist are also free.
+
+    :ivar ttls: A dictionary mapping endpoint templates (see |get_endpoint_template|) to TTLs in seconds.  Responses
+        from endpoints not in this dictionary are never cached.
+    :ivar negative_ttl: How long 404 responses are cached, in seconds.
+    :ivar storage: Where entries are kept, i.e. a |MemoryCacheStorage| or |SQLiteCacheStorage|.
+    :ivar namespace: A prefix for the keys of this cache's entries, so that storage shared by clients with different
+        credentials (and so different permissions) never serves one client's responses to another.
+    """
+
+    def __init__(self, storage=None, ttls=None, negative_ttl=DEFAULT_NEGATIVE_TTL, namespace='', clock=time.time):
+        """
+        :param storage: Where entries are kept.  Defaults to a |MemoryCacheStorage| of the default size.
+        :param dict ttls: TTLs for endpoint templates, overriding or adding to |DEFAULT_CACHE_TTLS|.
+        :param float negative_ttl: How long 404 responses are cached, in seconds.
+        :param str namespace: A prefix for the keys of this cache's entries.
+        :param clock: A function returning the current time in seconds.
+        """
+
+        self.storage = storage if storage is not None else MemoryCacheStorage()
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        self.ttls.update(ttls or {})
+        self.negative_ttl = negative_ttl
+        self.namespace = namespace
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.revalidations = 0
+        self.bytes_saved = 0
+
+    def make_key(self, request_key):
+        """
+        :param request_key: A key from |get_request_key|.
+        :return: The string form of the key, used to index the storage.
+        """
+
+        return self.namespace + json.dumps(request_key, separators=(',', ':'))
+
+    def get_ttl(self, path, status_code=200):
+        """
+        :return: How long a response with the given status code from the endpoint of ``path`` should be cached, or
+            ``None`` if it should not be cached.
+        """
+
+        ttl = self.ttls.get(get_endpoint_template(path))
+        if ttl is None or ttl <= 0:
+            return None
+        if status_code == 404:
+            return self.negative_ttl or None
+        if 200 <= status_code < 300:
+            return ttl
+        return None
+
+    def is_cacheable(self, path):
+        return self.get_ttl(path) is not None
+
+    def get(self, request_key):
+        """
+        :param request_key: A key from |get_request_key|.
+        :return: A fresh copy of the cached response, or ``None`` if there is no unexpired entry.
+        """
+
+        entry = self.storage.get(self.make_key(request_key))
+        if entry is not None and entry.is_expired(self.clock()):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if entry.status_code == 404:
+                self.negative_hits += 1
+
+        return entry.to_response()
+
+    def get_stale(self, request_key):
+        """
+        Finds an expired entry that can be revalidated with a conditional request, rather than fetched again.
+
+        :param request_key: A key from |get_request_key|.
+        :return: The |CacheEntry|, or ``None`` if there is no entry or it has no validators.
+        """
+
+        entry = self.storage.get(self.make_key(request_key))
+        if entry is None or entry.status_code != 200 or not entry.get_validators():
+            return None
+        return entry
+
+    def revalidate(self, request_key, entry, response):
+        """
+        Handles the response to a conditional request made to revalidate a stale entry.  If the server responded with
+        ``304 Not Modified``, the entry is still valid, so its expiration is extended and the cached response is
+        returned.  Otherwise, the new response replaces the entry.
+
+        :param request_key: A key from |get_request_key|.
+        :param entry: The stale |CacheEntry| from |get_stale|.
+        :param response: The response to the conditional request.
+        :return: The response to use.
+        """
+
+        if response.status_code != 304:
+            self.set(request_key, entry.path, response)
+            return response
+
+        with self._lock:
+            self.revalidations += 1
+            self.bytes_saved += len(entry.content or b'')
+
+        # the 304 might carry updated headers, i.e. a new ETag
+        for header in ['ETag', 'Last-Modified', 'Date', 'Cache-Control', 'Expires']:
+            if header in response.headers:
+                entry.headers[header] = response.headers[header]
+
+        ttl = self.get_ttl(entry.path)
+        if ttl is not None:
+            now = self.clock()
+            entry.created = now
+            entry.expires = now + ttl
+            self.storage.set(entry)
+
+        return entry.to_response()
+
+    def set(self, request_key, path, response):
+        """
+        Caches a response, if its endpoint and status code are cacheable.
+
+        :param request_key: A key from |get_request_key|.
+        :param str path: The path of the request.
+        :param response: The response object.
+        """
+
+        ttl = self.get_ttl(path, response.status_code)
+        if ttl is None:
+            return
+
+        now = self.clock()
+        self.storage.set(CacheEntry.from_response(self.make_key(request_key), path, response,
+                                                  created=now, expires=now + ttl))
+
+    def invalidate(self, path=None, template=None):
+        """
+        Removes entries from the cache.  With no arguments, the cache is cleared (only of this cache's entries, if the
+        storage is shared with other namespaces).
+
+        :param str path: Remove entries whose request path starts with this, i.e. ``"reports/<id>"``.
+        :param str template: Remove entries for this endpoint template, i.e. ``"reports/{id}"``.
+        """
+
+        if path is None and template is None:
+            self.storage.clear(prefix=self.namespace)
+            return
+
+        if path is not None:
+            path = path.strip('/')
+        self.storage.delete(key for key in self.storage.find(path=path, template=template)
+                            if key.startswith(self.namespace))
+
+    def stats(self):
+        """
+        :return: A dictionary of cache statistics, including the hit rate.
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'revalidations': self.revalidations,
+                'bytes_saved': self.bytes_saved,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'size': len(self.storage),
+                'evictions': self.storage.evictions
+            }
+
+
+class ValidatorCache(ResponseCache):
+    """
+    Remembers the most recent response to each ``GET`` request that carried an ``ETag`` or ``Last-Modified`` header,
+    so that the next identical request can be made conditional.  Unlike a |ResponseCache|, entries are never served
+    without first being revalidated with the server; a ``304 Not Modified`` then costs a round trip, but not the
+    transfer of the body.
+    """
+
+    def __init__(self, storage=None, namespace='', clock=time.time):
+        """
+        :param storage: Where entries are kept.  Defaults to a |MemoryCacheStorage| of size
+            |DEFAULT_VALIDATOR_CACHE_SIZE|.
+        :param str namespace: A prefix for the keys of this cache's entries.
+        :param clock: A function returning the current time in seconds.
+        """
+
+        if storage is None:
+            storage = MemoryCacheStorage(max_size=DEFAULT_VALIDATOR_CACHE_SIZE)
+        super().__init__(storage=storage, ttls={}, negative_ttl=None, namespace=namespace, clock=clock)
+
+    def get_ttl(self, path, status_code=200):
+        # entries expire immediately, so they are only ever used for revalidation
+        return 0 if status_code == 200 else None
+
+    def is_cacheable(self, path):
+        return True
+
+    def get(self, request_key):
+        return None
+
+    def set(self, request_key, path, response):
+        if response.status_code != 200:
+            return
+
+        entry = CacheEntry.from_response(self.make_key(request_key), path, response, created=self.clock(),
+                                         expires=self.clock())
+        if entry.get_validators():
+            self.storage.set(entry)
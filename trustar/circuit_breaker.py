@@ -0,0 +1,217 @@
+# python 2 backwards compatibility
+from __future__ import division, print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+import time
+from collections import deque
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# the fraction of recent requests to an endpoint that must fail for its circuit to open
+DEFAULT_FAILURE_RATE = 0.5
+
+# the number of recent requests needed before the failure rate is trusted
+DEFAULT_MIN_REQUESTS = 10
+
+# the number of recent requests the failure rate is computed over
+DEFAULT_WINDOW = 20
+
+# seconds a circuit stays open before trial requests are let through
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised instead of sending a request to an endpoint whose circuit is open.  It is a ``requests.ConnectionError``,
+    so code that handles an unreachable API handles it too.
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super(CircuitOpenError, self).__init__("Circuit open for %s; retry in %.1f seconds" % (endpoint, retry_after))
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def is_failure(status_code):
+    """
+    :param int status_code: The status code of a response; ``None`` if the request failed without one.
+    :return: Whether the response counts against the endpoint's health.  Rate limiting (429) and client errors don't:
+        they say nothing about whether the API is degraded.
+    """
+
+    return status_code is None or status_code >= 500
+
+
+class CircuitBreaker(object):
+    """
+    The circuit of one endpoint.  While closed, requests are sent and their outcomes kept; once at least
+    ``min_requests`` of the last ``window`` requests were sent and ``failure_rate`` of them failed, it opens, and
+    requests fail right away.  After ``reset_timeout`` seconds it is half-open: a single trial request is let through,
+    and closes the circuit if it succeeds, or opens it again if it fails.
+    """
+
+    def __init__(self, failure_rate=DEFAULT_FAILURE_RATE, min_requests=DEFAULT_MIN_REQUESTS, window=DEFAULT_WINDOW,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, clock=time.time):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=max(window, min_requests))
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """
+        :return: ``0`` if a request may be sent, otherwise the number of seconds until one may be.
+        """
+
+        with self._lock:
+            now = self.clock()
+            if self.state == OPEN:
+                retry_after = self._opened_at + self.reset_timeout - now
+                if retry_after > 0:
+                    self.rejected += 1
+                    return retry_after
+                self.state = HALF_OPEN
+
+            if self.state == HALF_OPEN:
+                # a trial that never reported back (i.e. it was cancelled before it was sent) is replaced
+                if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                    self.rejected += 1
+                    return self._trial_started + self.reset_timeout - now
+                self._trial_started = now
+
+            return 0
+
+    def record(self, status_code):
+        """
+        Records the outcome of a request.
+
+        :param int status_code: The status code of the response; ``None`` if there was none.
+        """
+
+        failed = is_failure(status_code)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_started = None
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_requests:
+                if sum(self._outcomes) >= self.failure_rate * len(self._outcomes):
+                    self._open()
+
+    def cancel(self):
+        """
+        Records that a request was stopped by its caller, without an outcome.  If it was the trial of a half-open
+        circuit, the next request is let through as the trial instead.
+        """
+
+        with self._lock:
+            self._trial_started = None
+
+    def _open(self):
+        """
+        Opens the circuit.  Must be called while holding the lock.
+        """
+
+        self.state = OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'state': self.state,
+                'failure_rate': sum(outcomes) / len(outcomes) if outcomes else 0,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+
+
+class CircuitBreakers(object):
+    """
+    A |CircuitBreaker| per endpoint (i.e. ``"GET reports/{id}"``), so that a failing endpoint stops getting requests
+    while the rest of the API is still used.  The number of open circuits is reported as the ``open_circuits`` gauge of
+    the given |Metrics|.
+    """
+
+    def __init__(self, metrics=None, **kwargs):
+        """
+        :param metrics: The |Metrics| to report to.
+        :param kwargs: The parameters of each |CircuitBreaker|.
+        """
+
+        self.metrics = metrics
+        self.kwargs = kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(**self.kwargs)
+            return breaker
+
+    def check(self, endpoint):
+        """
+        :raises CircuitOpenError: If the endpoint's circuit is open.
+        """
+
+        retry_after = self.get(endpoint).allow()
+        if retry_after:
+            raise CircuitOpenError(endpoint, retry_after)
+
+    def record(self, endpoint, status_code):
+        breaker = self.get(endpoint)
+        state = breaker.state
+        breaker.record(status_code)
+        if breaker.state != state:
+            if breaker.state == OPEN:
+                logger.warning("Circuit for %s opened; failing its requests for %d seconds.", endpoint,
+                               breaker.reset_timeout)
+            else:
+                logger.info("Circuit for %s %s.", endpoint, breaker.state)
+            self._report()
+
+    def cancel(self, endpoint):
+        self.get(endpoint).cancel()
+
+    def _report(self):
+        if self.metrics is not None:
+            with self._lock:
+                breakers = list(self._breakers.values())
+            self.metrics.set_gauge('open_circuits', sum(1 for breaker in breakers if breaker.state != CLOSED))
+
+    def stats(self):
+        """
+        :return: A dictionary mapping each endpoint to its state, recent failure rate, number of times it was opened,
+            and number of requests rejected.
+        """
+
+        with self._lock:
+            breakers = dict(self._breakers)
+        return dict((endpoint, breaker.stats()) for endpoint, breaker in breakers.items())
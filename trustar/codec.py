@@ -0,0 +1,233 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str
+
+# external imports
+from collections import OrderedDict
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec(object):
+    """
+    Base class for the json backends used by the SDK to encode request bodies and decode response bodies.
+
+    :cvar name: The name the codec is registered under.
+    :cvar module: The name of the module that must be importable for the codec to be available.
+    """
+
+    name = None
+    module = None
+
+    @classmethod
+    def is_available(cls):
+        """
+        :return: ``True`` if the backing module is installed.
+        """
+
+        try:
+            __import__(cls.module)
+            return True
+        except ImportError:
+            return False
+
+    def dumps(self, obj):
+        """
+        Encodes an object as compact, utf-8 encoded json.
+
+        :param obj: The object to encode.
+        :return: The json as ``bytes``, ready to be sent as a request body.
+        """
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """
+        Decodes json.
+
+        :param data: The json, as ``bytes`` or ``str``.
+        :return: The decoded object.
+        """
+        raise NotImplementedError()
+
+    def dumps_pretty(self, obj):
+        """
+        Encodes an object as human-readable json, indented by 2 spaces.
+
+        :param obj: The object to encode.
+        :return: The json as a ``str``.
+        """
+
+        return json.dumps(obj, indent=2)
+
+    def __repr__(self):
+        return "<%s '%s'>" % (self.__class__.__name__, self.name)
+
+
+class StdlibJsonCodec(JsonCodec):
+    """
+    Uses the ``json`` module from the standard library.  Always available.
+    """
+
+    name = 'json'
+    module = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Uses `orjson <https://github.com/ijl/orjson>`_, which encodes directly to ``bytes``.
+    """
+
+    name = 'orjson'
+    module = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        try:
+            return self._orjson.dumps(obj)
+        except TypeError:
+            # orjson is stricter than the standard library, i.e. about non-string keys and very large integers
+            return _STDLIB.dumps(obj)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps_pretty(self, obj):
+        try:
+            return self._orjson.dumps(obj, option=self._orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            return _STDLIB.dumps_pretty(obj)
+
+
+class UjsonCodec(JsonCodec):
+    """
+    Uses `ujson <https://github.com/ultrajson/ultrajson>`_.
+    """
+
+    name = 'ujson'
+    module = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj):
+        return self._ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+    def dumps_pretty(self, obj):
+        return self._ujson.dumps(obj, indent=2, escape_forward_slashes=False)
+
+
+class SimdjsonCodec(JsonCodec):
+    """
+    Uses `pysimdjson <https://github.com/TkTech/pysimdjson>`_ for decoding.  simdjson is a parser only, so encoding
+    falls back to the standard library.
+    """
+
+    name = 'simdjson'
+    module = 'simdjson'
+
+    def __init__(self):
+        import simdjson
+        self._simdjson = simdjson
+
+    def dumps(self, obj):
+        return _STDLIB.dumps(obj)
+
+    def loads(self, data):
+        return self._simdjson.loads(data)
+
+
+_STDLIB = StdlibJsonCodec()
+
+# all known codecs, in order of preference
+CODECS = OrderedDict((codec.name, codec) for codec in [OrjsonCodec, UjsonCodec, SimdjsonCodec, StdlibJsonCodec])
+
+_codec = None
+
+
+def available_codecs():
+    """
+    :return: The names of the codecs whose backing modules are installed, in order of preference.
+    """
+
+    return [name for name, codec in CODECS.items() if codec.is_available()]
+
+
+def create_codec(name=None):
+    """
+    Constructs a codec.
+
+    :param str name: The name of the codec, i.e. "orjson".  If ``None``, the environment variable
+        TRUSTAR_JSON_CODEC will be used.  If that is not defined either, the fastest installed codec is selected.
+    :return: The |JsonCodec|.
+    """
+
+    if name is None:
+        name = os.environ.get('TRUSTAR_JSON_CODEC')
+
+    if name is None:
+        name = available_codecs()[0]
+
+    if name not in CODECS:
+        raise ValueError("Unknown json codec '%s'.  Must be one of: %s" % (name, ', '.join(CODECS)))
+
+    return CODECS[name]()
+
+
+def get_codec():
+    """
+    :return: The |JsonCodec| currently used by the SDK.
+    """
+
+    global _codec
+    if _codec is None:
+        _codec = create_codec()
+        logger.debug("Using json codec '%s'.", _codec.name)
+    return _codec
+
+
+def set_codec(codec):
+    """
+    Sets the |JsonCodec| used by the SDK.
+
+    :param codec: A |JsonCodec| instance, the name of a codec, or ``None`` to reselect automatically.
+    """
+
+    global _codec
+    if codec is None or isinstance(codec, JsonCodec):
+        _codec = codec
+    else:
+        _codec = create_codec(codec)
+
+
+def dumps(obj):
+    """
+    Encodes an object as json ``bytes`` using the current codec.
+    """
+
+    return get_codec().dumps(obj)
+
+
+def loads(data):
+    """
+    Decodes json using the current codec.
+    """
+
+    return get_codec().loads(data)
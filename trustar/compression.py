@@ -0,0 +1,134 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str
+
+# external imports
+from collections import defaultdict
+import gzip
+import io
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# the response encodings the SDK asks for; both are decoded transparently (and incrementally, when streaming)
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# request bodies smaller than this are not worth compressing
+DEFAULT_COMPRESSION_THRESHOLD = 16 * 1024
+
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+def gzip_compress(data, level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Compresses a request body with gzip.
+
+    :param data: The body, as ``bytes`` or ``str``.  Strings are encoded as utf-8.
+    :param int level: The compression level, from 1 (fastest) to 9 (smallest).
+    :return: The compressed ``bytes``.
+    """
+
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def get_body_size(data):
+    """
+    :param data: A request body.
+    :return: The size of the body in bytes, or ``None`` if it is not a ``bytes`` or ``str`` body (i.e. form data).
+    """
+
+    if isinstance(data, bytes):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return None
+
+
+def get_wire_size(response):
+    """
+    Determines the number of bytes of a response body that were actually transferred, i.e. before decompression.
+    Should be called after the body has been read.
+
+    :param response: The ``requests`` response object.
+    :return: The number of bytes, or ``None`` if it cannot be determined.
+    """
+
+    raw = getattr(response, 'raw', None)
+    try:
+        # urllib3 counts the raw bytes pulled off the socket
+        size = raw.tell()
+        if size:
+            return size
+    except Exception:
+        pass
+
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and content_length.isdigit():
+        return int(content_length)
+    return None
+
+
+class TransferStats(object):
+    """
+    Thread-safe counters of the bytes sent and received per endpoint, before and after compression.
+    """
+
+    FIELDS = ['requests', 'request_bytes', 'request_bytes_sent', 'responses', 'response_bytes',
+              'response_bytes_received']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: dict((field, 0) for field in self.FIELDS))
+
+    def record_request(self, endpoint, size, sent_size):
+        """
+        :param str endpoint: The endpoint, i.e. ``"POST reports"``.
+        :param int size: The size of the request body before compression.
+        :param int sent_size: The size of the request body that was sent.
+        """
+
+        with self._lock:
+            counters = self._counters[endpoint]
+            counters['requests'] += 1
+            counters['request_bytes'] += size or 0
+            counters['request_bytes_sent'] += sent_size or 0
+
+    def record_response(self, endpoint, size, received_size):
+        """
+        :param str endpoint: The endpoint, i.e. ``"GET indicators"``.
+        :param int size: The size of the decompressed response body.
+        :param int received_size: The size of the response body that was received.  If unknown, it is assumed to
+            be uncompressed.
+        """
+
+        with self._lock:
+            counters = self._counters[endpoint]
+            counters['responses'] += 1
+            counters['response_bytes'] += size or 0
+            counters['response_bytes_received'] += received_size if received_size is not None else size or 0
+
+    def snapshot(self):
+        """
+        :return: A dictionary mapping each endpoint to its counters, including the number of bytes saved by
+            compression in each direction.
+        """
+
+        with self._lock:
+            result = {}
+            for endpoint, counters in self._counters.items():
+                counters = dict(counters)
+                counters['request_bytes_saved'] = counters['request_bytes'] - counters['request_bytes_sent']
+                counters['response_bytes_saved'] = counters['response_bytes'] - counters['response_bytes_received']
+                result[endpoint] = counters
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
@@ -0,0 +1,239 @@
+# python 2 backwards compatibility
+from __future__ import division, print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# package imports
+from .rate_limit import BULK, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 32
+
+# a response is a latency spike if it is this many times slower than the endpoint's usual latency
+DEFAULT_LATENCY_TOLERANCE = 3.0
+
+# number of responses from an endpoint before its latency is trusted as a baseline
+MIN_LATENCY_SAMPLES = 5
+
+# weight of each new response in an endpoint's average latency
+LATENCY_SMOOTHING = 0.1
+
+# the number of workers used by bulk operations when concurrency isn't adaptive
+DEFAULT_BULK_WORKERS = 8
+
+# how often a bulk operation checks whether it was cancelled, in seconds
+CANCELLATION_POLL_INTERVAL = 0.1
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """
+    Limits the number of requests in flight, adjusting the limit with AIMD (additive increase, multiplicative
+    decrease), like TCP congestion control: while at least half the limit is in use and responses are healthy, it grows
+    by about one per ``limit`` responses; when a response is rate limited (429), fails (5xx, or a connection error), or
+    is much slower than usual for its endpoint, it is cut by ``backoff``.  Only one cut is made per round trip:
+    responses to requests sent before the last cut don't cut it again.
+
+    Interactive requests waiting for a slot are let in before bulk ones.  The current limit is reported as the
+    ``concurrency_limit`` gauge of the given |Metrics|.  All methods are thread-safe.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, min_limit=1, max_limit=DEFAULT_MAX_CONCURRENCY,
+                 backoff=0.5, latency_tolerance=DEFAULT_LATENCY_TOLERANCE, metrics=None):
+        """
+        :param int initial: The initial limit.
+        :param int min_limit: The lowest the limit can be cut to.
+        :param int max_limit: The highest the limit can grow to.
+        :param float backoff: The factor the limit is multiplied by when cut.
+        :param float latency_tolerance: How many times slower than usual a response must be to count as a spike;
+            ``None`` to ignore latency.
+        :param metrics: The |Metrics| to report the limit to.
+        """
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.metrics = metrics
+
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._last_cut = 0
+        self._latencies = {}
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self._condition = threading.Condition()
+
+        self.increases = 0
+        self.decreases = 0
+        self._report()
+
+    @property
+    def limit(self):
+        """
+        The current number of requests allowed in flight.
+        """
+
+        with self._condition:
+            return int(self._limit)
+
+    @property
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """
+        Waits until another request is allowed in flight.
+
+        :param str priority: The priority of the request; ``"interactive"`` or ``"bulk"``.
+        :param float timeout: The most seconds to wait; by default, there is no limit.
+        :return: The time the request was allowed, to pass to |release|; ``None`` if the timeout passed first.
+        """
+
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while self._in_flight >= int(self._limit) or (priority == BULK and self._waiting[INTERACTIVE]):
+                    remaining = None if end is None else end - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
+                self._in_flight += 1
+                return time.time()
+            finally:
+                self._waiting[priority] -= 1
+                if priority == INTERACTIVE:
+                    self._condition.notify_all()
+
+    def release(self, start, endpoint=None, status_code=None, latency=None):
+        """
+        Records the outcome of a request, and allows another one in flight.
+
+        :param float start: The time returned by |acquire|.
+        :param str endpoint: The endpoint template of the request, i.e. ``"GET reports/{id}"``.
+        :param int status_code: The status code of the response; ``None`` if there was none.
+        :param float latency: The response time, in seconds.
+        """
+
+        with self._condition:
+            # don't grow a limit that isn't being used
+            saturated = self._in_flight * 2 >= self._limit
+            self._in_flight -= 1
+
+            if status_code is None or status_code == 429 or status_code >= 500:
+                self._cut(start, "status %s" % status_code)
+            elif self._is_spike(endpoint, latency):
+                self._cut(start, "%.2fs latency for %s" % (latency, endpoint))
+            elif saturated and self._limit < self.max_limit:
+                self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+                self.increases += 1
+                self._report()
+
+            self._condition.notify_all()
+
+    def abandon(self, start):
+        """
+        Allows another request in flight without recording an outcome, for a request its caller stopped waiting for
+        (i.e. because of a deadline), which says nothing about the API's health.
+
+        :param float start: The time returned by |acquire|.
+        """
+
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _is_spike(self, endpoint, latency):
+        """
+        Compares a latency to the endpoint's average, then updates the average.  Must be called while holding the
+        condition.
+        """
+
+        if latency is None or self.latency_tolerance is None:
+            return False
+
+        count, average = self._latencies.get(endpoint, (0, latency))
+        spike = count >= MIN_LATENCY_SAMPLES and latency > average * self.latency_tolerance
+        if not spike:
+            # spikes are left out of the average, so that it stays a baseline
+            average += (latency - average) * (1 / (count + 1) if count < MIN_LATENCY_SAMPLES else LATENCY_SMOOTHING)
+            self._latencies[endpoint] = (count + 1, average)
+        return spike
+
+    def _cut(self, start, reason):
+        """
+        Cuts the limit, unless it was already cut after the request started.  Must be called while holding the
+        condition.
+        """
+
+        if start < self._last_cut:
+            return
+        self._last_cut = time.time()
+        self._limit = max(self._limit * self.backoff, self.min_limit)
+        self.decreases += 1
+        logger.debug("Concurrency limit cut to %d (%s).", self._limit, reason)
+        self._report()
+
+    def _report(self):
+        if self.metrics is not None:
+            self.metrics.set_gauge('concurrency_limit', int(self._limit))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'increases': self.increases,
+                'decreases': self.decreases
+            }
+
+
+def map_concurrently(func, items, max_workers=DEFAULT_BULK_WORKERS, cancellation=None):
+    """
+    Calls a function on each item using a pool of threads.
+
+    :param func: A function taking one item.
+    :param items: The items.
+    :param int max_workers: The number of threads.
+    :param cancellation: A |CancellationToken|.  Once it is cancelled or its deadline passes, the calls that haven't
+        started are skipped, and |Cancelled| or |DeadlineExceeded| is raised without waiting for those in progress.
+    :return: A list of the results, in the order of the items.  If any call raises an exception, the first (in order
+        of the items) is raised once all the calls have finished.
+    """
+
+    items = list(items)
+    if not items:
+        return []
+    if cancellation is None:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def call(item):
+        cancellation.check()
+        return func(item)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    futures = [executor.submit(call, item) for item in items]
+    try:
+        pending = futures
+        while pending:
+            remaining = cancellation.remaining()
+            interval = CANCELLATION_POLL_INTERVAL if remaining is None else min(remaining, CANCELLATION_POLL_INTERVAL)
+            done, pending = wait(pending, timeout=interval)
+            if pending:
+                cancellation.check()
+        return [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        # calls in progress check the token too, so they won't outlive the deadline by much
+        executor.shutdown(wait=False)
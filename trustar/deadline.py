@@ -0,0 +1,143 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Cancelled(Exception):
+    """
+    Raised when work is stopped by a |CancellationToken|.
+    """
+    pass
+
+
+class DeadlineExceeded(Cancelled):
+    """
+    Raised when work is stopped because the deadline of its |CancellationToken| has passed.
+    """
+    pass
+
+
+class CancellationToken(object):
+    """
+    Stops work, either when |cancel| is called (i.e. from another thread), or once its deadline has passed.  Work
+    checks the token before each request, page and item, so it stops promptly: requests in flight can't be
+    interrupted, but their timeouts are cut so that they end by the deadline, and waits for the rate limit end early.
+
+    A token may have parents, i.e. the token of an enclosing |deadline| block; it is cancelled when any of them is,
+    and its deadline is the earliest of theirs.
+    """
+
+    def __init__(self, timeout=None, parents=None):
+        """
+        :param float timeout: The number of seconds until the deadline; no deadline if ``None``.
+        :param list parents: Tokens that also cancel this one.
+        """
+
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.parents = [parent for parent in parents or [] if parent is not None]
+        self._event = threading.Event()
+
+    @classmethod
+    def create(cls, deadline=None, parent=None):
+        """
+        Gets the token for a ``deadline`` argument.
+
+        :param deadline: A number of seconds, a |CancellationToken|, or ``None``.
+        :param parent: The token of the enclosing work, if any.
+        :return: The token, or ``None`` if there is neither a deadline nor a parent.
+        """
+
+        if deadline is None or deadline is parent:
+            return parent
+        if isinstance(deadline, CancellationToken):
+            return deadline if parent is None else cls(parents=[deadline, parent])
+        return cls(timeout=float(deadline), parents=[parent])
+
+    def cancel(self):
+        """
+        Stops the work using this token, and any token it is a parent of.
+        """
+
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set() or any(parent.cancelled for parent in self.parents)
+
+    def get_deadline(self):
+        """
+        :return: The earliest deadline of this token and its parents, as a timestamp; ``None`` if there is none.
+        """
+
+        deadlines = [d for d in [self.deadline] + [p.get_deadline() for p in self.parents] if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def remaining(self):
+        """
+        :return: The number of seconds until the deadline (at least 0); ``None`` if there is none.
+        """
+
+        deadline = self.get_deadline()
+        return None if deadline is None else max(deadline - time.time(), 0)
+
+    @property
+    def expired(self):
+        return self.remaining() == 0
+
+    def check(self):
+        """
+        :raises DeadlineExceeded: If the deadline has passed.
+        :raises Cancelled: If the token was cancelled.
+        """
+
+        if self.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+        if self.cancelled:
+            raise Cancelled("Cancelled")
+
+    def get_timeout(self, timeout):
+        """
+        Cuts a timeout so that it ends by the deadline.
+
+        :param timeout: A number of seconds, a ``(connect, read)`` tuple, or ``None``.
+        :return: The timeout.
+        """
+
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        # requests treats a timeout of 0 as no timeout at all
+        remaining = max(remaining, 0.001)
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def sleep(self, seconds):
+        """
+        Sleeps, unless the deadline would pass first.
+
+        :raises DeadlineExceeded: Right away, if the deadline is less than ``seconds`` away.
+        :raises Cancelled: If the token is cancelled while sleeping.
+        """
+
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            raise DeadlineExceeded("Deadline exceeded: %.1f seconds left, but %.1f seconds to wait"
+                                   % (remaining, seconds))
+
+        # wake up now and then to notice a parent being cancelled
+        end = time.time() + seconds
+        while not self.cancelled:
+            left = end - time.time()
+            if left <= 0:
+                return
+            self._event.wait(min(left, 0.1) if self.parents else left)
+        self.check()
@@ -0,0 +1,260 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str
+
+# external imports
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# package imports
+from .cache import CacheEntry, DEFAULT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.trustar', 'cache.sqlite')
+
+# how long to wait for another process to release a lock on the database, in seconds
+DEFAULT_LOCK_TIMEOUT = 30
+
+# how stale an entry's access time may get before a read updates it, in seconds; this keeps most reads from taking
+# the database's write lock, at the cost of a coarser least recently used order
+ACCESS_TIME_RESOLUTION = 60
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        template TEXT NOT NULL,
+        status_code INTEGER NOT NULL,
+        headers TEXT NOT NULL,
+        content BLOB,
+        url TEXT,
+        encoding TEXT,
+        reason TEXT,
+        created REAL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)",
+    "CREATE INDEX IF NOT EXISTS entries_path ON entries (path)",
+    "CREATE INDEX IF NOT EXISTS entries_template ON entries (template)",
+    # the number and total size of the entries, kept up to date by triggers, so that checking the size limits doesn't
+    # read every row
+    """CREATE TABLE IF NOT EXISTS totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        count INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries",
+    """CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+        UPDATE totals SET count = count + 1, size = size + new.size WHERE id = 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+        UPDATE totals SET count = count - 1, size = size - old.size WHERE id = 0;
+    END"""
+]
+
+COLUMNS = ['key', 'path', 'template', 'status_code', 'headers', 'content', 'url', 'encoding', 'reason', 'created',
+           'expires']
+
+
+class SQLiteCacheStorage(object):
+    """
+    Stores cache entries in a SQLite database on disk, so that they outlive the process and can be shared by every
+    process on the host that points at the same file.  SQLite's locking makes concurrent access from multiple threads
+    and processes safe.  Entries are evicted least recently used first once there are more than ``max_size`` of
+    them, or their bodies take up more than ``max_bytes``.
+
+    Errors accessing the database (i.e. a lock that could not be acquired within the timeout) are logged and treated
+    as cache misses, so that a problem with the cache never fails a request.
+
+    :ivar path: The path to the database file.
+    :ivar evictions: The number of entries evicted by this process.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_CACHE_SIZE, max_bytes=None,
+                 timeout=DEFAULT_LOCK_TIMEOUT):
+        """
+        :param str path: The path to the database file.  Its directory is created if necessary.
+        :param int max_size: The maximum number of entries.
+        :param int max_bytes: The maximum total size of the cached bodies, in bytes (optional).
+        :param float timeout: How long to wait for a lock held by another process, in seconds.
+        """
+
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.evictions = 0
+
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # another process might have created it in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+        # in one transaction, so that the totals count every entry written by other processes meanwhile
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _connection(self):
+        """
+        :return: This thread's connection to the database (SQLite connections cannot be shared between threads).
+        """
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            try:
+                # write-ahead logging lets readers proceed while another process writes
+                connection.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError:
+                pass
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql, args=(), default=None, write=False):
+        """
+        Executes a statement, logging (rather than raising) database errors.
+
+        :return: The rows returned by the statement, or ``default`` if it failed.
+        """
+
+        try:
+            connection = self._connection()
+            if not write:
+                return connection.execute(sql, args).fetchall()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(sql, args).fetchall()
+                connection.execute("COMMIT")
+                return rows
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Error accessing cache at %s: %s", self.path, e)
+            return default
+
+    def get(self, key):
+        rows = self._execute("SELECT %s, accessed FROM entries WHERE key = ?" % ', '.join(COLUMNS), (key,),
+                             default=[])
+        if not rows:
+            return None
+
+        now = time.time()
+        if now - rows[0][-1] >= ACCESS_TIME_RESOLUTION:
+            self._execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key), write=True)
+
+        values = dict(zip(COLUMNS, rows[0]))
+        values['headers'] = json.loads(values['headers'])
+        if values['content'] is not None:
+            values['content'] = bytes(values['content'])
+        return CacheEntry(**values)
+
+    def set(self, entry):
+        content = entry.content
+        size = len(content) if content is not None else 0
+        values = [getattr(entry, column) for column in COLUMNS]
+        values[COLUMNS.index('headers')] = json.dumps(entry.headers)
+        values[COLUMNS.index('content')] = sqlite3.Binary(content) if content is not None else None
+
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # not INSERT OR REPLACE, which doesn't fire the delete trigger
+                connection.execute("DELETE FROM entries WHERE key = ?", (entry.key,))
+                connection.execute("INSERT INTO entries (%s, accessed, size) VALUES (%s)"
+                                   % (', '.join(COLUMNS), ', '.join(['?'] * (len(COLUMNS) + 2))),
+                                   values + [time.time(), size])
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Error writing to cache at %s: %s", self.path, e)
+
+    def _evict(self, connection):
+        """
+        Removes the least recently used entries until the size limits are satisfied.  Must be called within a
+        transaction.
+        """
+
+        count, total = connection.execute("SELECT count, size FROM totals WHERE id = 0").fetchone()
+
+        excess = max(0, count - self.max_size) if self.max_size is not None else 0
+        if self.max_bytes is not None and total > self.max_bytes:
+            # walk the least recently used entries, by index, only as far as needed to get under the byte limit
+            excess_bytes = 0
+            cursor = connection.execute("SELECT size FROM entries ORDER BY accessed")
+            for i, (size,) in enumerate(cursor):
+                if total - excess_bytes <= self.max_bytes:
+                    excess = max(excess, i)
+                    break
+                excess_bytes += size
+            else:
+                excess = count
+            cursor.close()
+
+        if excess > 0:
+            connection.execute("DELETE FROM entries WHERE key IN "
+                               "(SELECT key FROM entries ORDER BY accessed LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def delete(self, keys):
+        keys = list(keys)
+        # stay under SQLite's limit on the number of parameters
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            self._execute("DELETE FROM entries WHERE key IN (%s)" % ', '.join(['?'] * len(batch)), batch,
+                          write=True)
+
+    def find(self, path=None, template=None):
+        conditions = []
+        args = []
+        if path is not None:
+            # match on a prefix; escape LIKE wildcards that might appear in the path
+            conditions.append("path LIKE ? ESCAPE '\\'")
+            args.append(path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if template is not None:
+            conditions.append("template = ?")
+            args.append(template)
+
+        sql = "SELECT key FROM entries"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return [row[0] for row in self._execute(sql, args, default=[])]
+
+    def clear(self, prefix=''):
+        """
+        Removes the entries whose key starts with ``prefix``; by default, all of them.
+        """
+
+        if not prefix:
+            self._execute("DELETE FROM entries", write=True)
+        else:
+            # LIKE is case-insensitive, so compare the prefix itself
+            self._execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix), write=True)
+
+    def __len__(self):
+        rows = self._execute("SELECT count FROM totals WHERE id = 0", default=[(0,)])
+        return rows[0][0]
@@ -0,0 +1,1000 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str, super
+from six import string_types
+
+# external imports
+from collections import OrderedDict, defaultdict, namedtuple
+import base64
+import bisect
+import gzip
+import hashlib
+import io
+import json
+import logging
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+# package imports
+from .utils import get_endpoint_template
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/1.3/'
+AUTH_PATH = '/oauth/token'
+
+DAY = 24 * 60 * 60 * 1000
+
+# the reports endpoint returns at most 2 weeks of reports, and at most this many per page
+MAX_REPORTS_WINDOW = 14 * DAY
+DEFAULT_REPORTS_PAGE_SIZE = 25
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 1000
+
+# responses larger than this are compressed, if the client accepts gzip
+COMPRESSION_THRESHOLD = 1024
+
+EXPIRED_TOKEN_MESSAGE = "Expired oauth2 access token"
+INVALID_TOKEN_MESSAGE = "Invalid oauth2 access token"
+
+# patterns used to "extract" indicators from report bodies, most specific first
+INDICATOR_PATTERNS = [
+    ('URL', re.compile(r'\bhttps?://[^\s"<>]+')),
+    ('EMAIL_ADDRESS', re.compile(r'\b[\w.+-]+@[\w-]+\.[\w.-]+\b')),
+    ('CIDR_BLOCK', re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}/\d{1,2}\b')),
+    ('IP', re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')),
+    ('SHA256', re.compile(r'\b[0-9a-fA-F]{64}\b')),
+    ('SHA1', re.compile(r'\b[0-9a-fA-F]{40}\b')),
+    ('MD5', re.compile(r'\b[0-9a-fA-F]{32}\b')),
+    ('CVE', re.compile(r'\bCVE-\d{4}-\d{4,}\b', re.IGNORECASE)),
+    ('URL', re.compile(r'\b(?:[a-zA-Z0-9-]+\.)+(?:com|net|org|io|ru|cn|info|biz|co)\b'))
+]
+
+RecordedRequest = namedtuple('RecordedRequest', ['method', 'path', 'endpoint', 'params', 'headers', 'body',
+                                                 'api_key'])
+
+
+class ApiError(Exception):
+    """
+    Raised by request handlers to respond with an error status.
+    """
+
+    def __init__(self, status, message, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body if body is not None else {'message': message}
+
+
+def now_millis():
+    return int(time.time() * 1000)
+
+
+def extract_indicators(text):
+    """
+    A crude stand-in for TruSTAR's indicator extraction.
+
+    :param str text: The text, i.e. a report body.
+    :return: A list of ``(type, value)`` tuples, without duplicates, in order of appearance.
+    """
+
+    found = OrderedDict()
+    consumed = []
+    for indicator_type, pattern in INDICATOR_PATTERNS:
+        # the matches of a single pattern never overlap, so only those of the (more specific) patterns before it need
+        # checking; sort them by start, with the furthest end of any match starting at or before each
+        consumed.sort()
+        starts = [start for start, _ in consumed]
+        max_ends = []
+        for _, end in consumed:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+
+        matches = []
+        for match in pattern.finditer(text or ''):
+            # skip matches inside a more specific match, i.e. the domain of a URL
+            i = bisect.bisect_right(starts, match.start())
+            if i and match.end() <= max_ends[i - 1]:
+                continue
+            matches.append((match.start(), match.end()))
+            found.setdefault(match.group(0), indicator_type)
+        consumed.extend(matches)
+    return [(indicator_type, value) for value, indicator_type in found.items()]
+
+
+class Fault(object):
+    """
+    An error that the server responds with instead of handling a request.
+    """
+
+    def __init__(self, status, count=1, endpoint=None, wait_time=None, body=None):
+        self.status = status
+        self.remaining = count
+        self.endpoint = endpoint
+        self.wait_time = wait_time
+        self.body = body
+
+    def matches(self, endpoint):
+        return self.remaining != 0 and (self.endpoint is None or self.endpoint == endpoint)
+
+
+class FakeTruStarServer(object):
+    """
+    A local stand-in for the TruSTAR API, for testing and benchmarking the SDK offline.  It implements (in memory) the
+    endpoints used by the SDK, with the same pagination and time-window rules as the real API, and can be told to
+    add latency, rate limit, fail, or expire tokens, so that client behavior can be measured deterministically.
+
+    Example:
+
+    >>> with FakeTruStarServer() as server:
+    >>>     server.generate(reports=100)
+    >>>     ts = TruStar(config=server.config)
+    >>>     print(len(list(ts.get_reports(is_enclave=True, from_time=server.oldest, to_time=server.newest))))
+    100
+
+    :ivar latency: Seconds added to the handling of every API request.
+    :ivar endpoint_latency: A dictionary mapping endpoints (i.e. ``"GET reports/{id}"``) to seconds of latency added
+        to their requests, on top of ``latency``.
+    :ivar token_lifetime: Seconds after which tokens expire, or ``None`` if they never do.
+    :ivar quota: Either ``None``, or a tuple ``(max_requests, window)``: each API key may make at most ``max_requests``
+        requests per ``window`` seconds, after which it receives 429 responses with a ``waitTime``.
+    :ivar requests: Every request received, as |RecordedRequest| tuples.
+    """
+
+    def __init__(self, credentials=None, host='127.0.0.1', port=0, latency=0, token_lifetime=None, quota=None,
+                 reports_page_size=DEFAULT_REPORTS_PAGE_SIZE, compress_responses=True, etags=True):
+        """
+        :param dict credentials: A dictionary mapping API keys to secrets.  Defaults to a single key, ``"key"``, with
+            secret ``"secret"``.
+        :param str host: The interface to listen on.
+        :param int port: The port to listen on; by default, any free port.
+        :param float latency: Seconds added to the handling of every API request.
+        :param float token_lifetime: Seconds after which tokens expire.
+        :param tuple quota: ``(max_requests, window)`` allowed for each API key.
+        :param int reports_page_size: The maximum number of reports returned by each call to ``GET reports``.
+        :param boolean compress_responses: Whether to gzip large responses to clients that accept it.
+        :param boolean etags: Whether to send ``ETag`` headers and honor ``If-None-Match``.
+        """
+
+        self.credentials = credentials if credentials is not None else {'key': 'secret'}
+        self.latency = latency
+        self.endpoint_latency = {}
+        self.token_lifetime = token_lifetime
+        self.quota = quota
+        self.reports_page_size = reports_page_size
+        self.compress_responses = compress_responses
+        self.etags = etags
+
+        self.requests = []
+        self.lock = threading.RLock()
+
+        self.enclaves = [{'id': str(uuid.uuid4()), 'name': 'Enclave %d' % i, 'type': 'CLOSED',
+                          'read': True, 'create': True, 'update': True} for i in range(2)]
+        self.reports = OrderedDict()
+        self.report_tags = defaultdict(list)
+        self.report_indicators = defaultdict(list)
+        self.indicators = OrderedDict()
+        self.whitelist = OrderedDict()
+
+        self._tokens = {}
+        self._faults = []
+        self._usage = {}
+
+        self._httpd = None
+        self._thread = None
+        self._host = host
+        self._port = port
+
+    def start(self):
+        """
+        Starts serving on a background thread.
+
+        :return: The server.
+        """
+
+        server = self
+
+        class Handler(RequestHandler):
+            fake_server = server
+
+        self._httpd = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-trustar-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def config(self):
+        """
+        :return: A config dictionary for a |TruStar| client using the first API key.
+        """
+
+        api_key = sorted(self.credentials)[0]
+        return self.get_config(api_key)
+
+    def get_config(self, api_key):
+        """
+        :return: A config dictionary for a |TruStar| client using the given API key.
+        """
+
+        return {
+            'user_api_key': api_key,
+            'user_api_secret': self.credentials[api_key],
+            'auth_endpoint': self.url + AUTH_PATH,
+            'api_endpoint': self.url + API_PREFIX.rstrip('/'),
+            'enclave_ids': [self.enclaves[0]['id']],
+            'verify': False
+        }
+
+    def add_fault(self, status, count=1, endpoint=None, wait_time=None, body=None):
+        """
+        Makes the server respond to the next ``count`` matching requests with an error instead of handling them.
+
+        :param int status: The status code, i.e. ``429`` or ``503``.
+        :param int count: How many requests to fail; ``-1`` for all of them.
+        :param str endpoint: Only fail requests to this endpoint, i.e. ``"GET reports/{id}"``.
+        :param int wait_time: For 429s, the ``waitTime`` in the body, in milliseconds.
+        :param dict body: The json body to respond with.
+        """
+
+        if body is None:
+            body = {'message': "Injected fault"}
+            if wait_time is not None:
+                body['waitTime'] = wait_time
+        with self.lock:
+            self._faults.append(Fault(status, count=count, endpoint=endpoint, wait_time=wait_time, body=body))
+
+    def rate_limit(self, wait_time=1000, count=1, endpoint=None):
+        """
+        Makes the server respond to the next ``count`` matching requests with 429s.
+        """
+
+        self.add_fault(429, count=count, endpoint=endpoint, wait_time=wait_time,
+                       body={'message': "Too many requests", 'waitTime': wait_time})
+
+    def clear_faults(self):
+        with self.lock:
+            self._faults = []
+
+    def expire_tokens(self):
+        """
+        Expires every token that has been issued, so that the next request with each fails with an expired token
+        response.
+        """
+
+        with self.lock:
+            for token in self._tokens.values():
+                token['expired'] = True
+
+    def get_request_count(self, endpoint=None):
+        """
+        :param str endpoint: Only count requests to this endpoint, i.e. ``"GET reports"``.
+        :return: The number of requests received.
+        """
+
+        with self.lock:
+            return sum(1 for r in self.requests if endpoint is None or r.endpoint == endpoint)
+
+    def add_report(self, title, body, enclave_ids=None, distribution_type='ENCLAVE', time_began=None, updated=None,
+                   external_id=None, external_url=None, report_id=None):
+        """
+        Stores a report and extracts its indicators.
+
+        :return: The report dictionary, as returned by the API.
+        """
+
+        updated = updated if updated is not None else now_millis()
+        report = {
+            'id': report_id or str(uuid.uuid4()),
+            'title': title,
+            'reportBody': body,
+            'timeBegan': time_began if time_began is not None else updated,
+            'externalTrackingId': external_id,
+            'externalUrl': external_url,
+            'distributionType': distribution_type,
+            'enclaveIds': enclave_ids if enclave_ids is not None else [self.enclaves[0]['id']],
+            'created': updated,
+            'updated': updated
+        }
+
+        with self.lock:
+            self.reports[report['id']] = report
+            self._extract(report)
+        return report
+
+    def add_indicator(self, value, indicator_type=None, enclave_ids=None, last_seen=None, sightings=1, tags=None):
+        """
+        Stores an indicator, or updates it if it already exists.
+
+        :return: The indicator dictionary, as returned by the API.
+        """
+
+        last_seen = last_seen if last_seen is not None else now_millis()
+        with self.lock:
+            indicator = self.indicators.get(value)
+            if indicator is None:
+                indicator = {
+                    'value': value,
+                    'indicatorType': indicator_type or self._guess_type(value),
+                    'priorityLevel': 'LOW',
+                    'correlationCount': 0,
+                    'whitelisted': False,
+                    'firstSeen': last_seen,
+                    'lastSeen': last_seen,
+                    'sightings': 0,
+                    'notes': None,
+                    'source': None,
+                    'tags': [],
+                    'enclaveIds': []
+                }
+                self.indicators[value] = indicator
+
+            indicator['lastSeen'] = max(indicator['lastSeen'], last_seen)
+            indicator['sightings'] += sightings
+            for enclave_id in enclave_ids or []:
+                if enclave_id not in indicator['enclaveIds']:
+                    indicator['enclaveIds'].append(enclave_id)
+            for tag in tags or []:
+                if not any(t['name'] == tag['name'] and t['enclaveId'] == tag['enclaveId'] for t in indicator['tags']):
+                    indicator['tags'].append({'guid': tag.get('guid') or str(uuid.uuid4()), 'name': tag['name'],
+                                              'enclaveId': tag['enclaveId']})
+            return indicator
+
+    def generate(self, reports=100, indicators_per_report=5, span=DAY, seed=0, body_size=500):
+        """
+        Populates the server with random reports and indicators, with ``updated`` times spread evenly over the
+        ``span`` milliseconds before now.
+
+        :param int reports: The number of reports.
+        :param int indicators_per_report: The number of indicators in each report body.
+        :param int span: The time span of the reports, in milliseconds.
+        :param int seed: The random seed, so that the data is reproducible.
+        :param int body_size: The approximate length of each report body, in characters.
+        """
+
+        rng = random.Random(seed)
+        end = now_millis()
+        for i in range(reports):
+            values = []
+            for _ in range(indicators_per_report):
+                if rng.random() < 0.5:
+                    values.append('.'.join(str(rng.randint(1, 254)) for _ in range(4)))
+                else:
+                    values.append('%032x' % rng.getrandbits(128))
+            filler = ' '.join('lorem' for _ in range(max(0, body_size // 6)))
+            self.add_report(title="Report %d" % i,
+                            body="Observed %s. %s" % (', '.join(values), filler),
+                            updated=end - int(span * (i + 1) / float(reports)),
+                            report_id=str(uuid.UUID(int=rng.getrandbits(128))))
+
+    @property
+    def oldest(self):
+        with self.lock:
+            return min(r['updated'] for r in self.reports.values()) if self.reports else now_millis()
+
+    @property
+    def newest(self):
+        with self.lock:
+            return max(r['updated'] for r in self.reports.values()) if self.reports else now_millis()
+
+    def _guess_type(self, value):
+        for indicator_type, pattern in INDICATOR_PATTERNS:
+            match = pattern.match(value)
+            if match is not None and match.group(0) == value:
+                return indicator_type
+        return 'MALWARE'
+
+    def _extract(self, report):
+        values = []
+        for indicator_type, value in extract_indicators("%s %s" % (report['title'] or '', report['reportBody'] or '')):
+            indicator = self.add_indicator(value, indicator_type, enclave_ids=report['enclaveIds'],
+                                           last_seen=report['updated'])
+            indicator['correlationCount'] += 1
+            values.append(value)
+        self.report_indicators[report['id']] = values
+
+    def handle(self, method, raw_path, headers, body):
+        """
+        Handles a request.
+
+        :return: A tuple ``(status, headers, body)``, where body is bytes.
+        """
+
+        url = urlparse(raw_path)
+        params = parse_qs(url.query, keep_blank_values=True)
+
+        if headers.get('Content-Encoding') == 'gzip' and body:
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+
+        if url.path == AUTH_PATH:
+            path = url.path.strip('/')
+            endpoint = "%s %s" % (method, path)
+        elif url.path.startswith(API_PREFIX):
+            path = unquote(url.path[len(API_PREFIX):]).strip('/')
+            endpoint = "%s %s" % (method, get_endpoint_template(path))
+        else:
+            return self._respond(404, {'message': "Not found"}, headers)
+
+        api_key = None
+        try:
+            if url.path == AUTH_PATH:
+                self._record(method, path, endpoint, params, headers, body, None)
+                return self._respond(200, self._issue_token(headers), headers)
+
+            api_key = self._authenticate(headers)
+            self._record(method, path, endpoint, params, headers, body, api_key)
+
+            delay = self.latency + self.endpoint_latency.get(endpoint, 0)
+            if delay:
+                time.sleep(delay)
+
+            self._check_faults(endpoint)
+            self._check_quota(api_key)
+
+            handler = ROUTES.get(endpoint)
+            if handler is None:
+                raise ApiError(404, "No such endpoint: %s" % endpoint)
+
+            result = handler(self, Request(path.split('/'), params, body, api_key))
+            return self._respond(200, result, headers, etag=method == 'GET')
+
+        except ApiError as e:
+            return self._respond(e.status, e.body, headers)
+
+    def _record(self, method, path, endpoint, params, headers, body, api_key):
+        with self.lock:
+            self.requests.append(RecordedRequest(method, path, endpoint, params, dict(headers), body, api_key))
+
+    def _issue_token(self, headers):
+        authorization = headers.get('Authorization') or ''
+        if not authorization.startswith('Basic '):
+            raise ApiError(401, "Missing credentials", {'error': 'unauthorized'})
+        api_key, _, secret = base64.b64decode(authorization[6:]).decode('utf-8').partition(':')
+        if self.credentials.get(api_key) != secret:
+            raise ApiError(401, "Bad credentials", {'error': 'unauthorized'})
+
+        with self.lock:
+            # like the real server, return the current token if it is still live
+            for token, info in self._tokens.items():
+                if info['api_key'] == api_key and not self._is_expired(info):
+                    return {'access_token': token, 'token_type': 'bearer'}
+
+            token = uuid.uuid4().hex
+            self._tokens[token] = {'api_key': api_key, 'issued': time.time(), 'expired': False}
+            return {'access_token': token, 'token_type': 'bearer', 'expires_in': self.token_lifetime}
+
+    def _is_expired(self, info):
+        return info['expired'] or (self.token_lifetime is not None and
+                                   time.time() - info['issued'] >= self.token_lifetime)
+
+    def _authenticate(self, headers):
+        authorization = headers.get('Authorization') or ''
+        token = authorization[7:] if authorization.startswith('Bearer ') else None
+        with self.lock:
+            info = self._tokens.get(token)
+            if info is None:
+                raise ApiError(400, INVALID_TOKEN_MESSAGE,
+                               {'error': 'invalid_token', 'error_description': INVALID_TOKEN_MESSAGE})
+            if self._is_expired(info):
+                raise ApiError(400, EXPIRED_TOKEN_MESSAGE,
+                               {'error': 'invalid_token', 'error_description': EXPIRED_TOKEN_MESSAGE})
+            return info['api_key']
+
+    def _check_faults(self, endpoint):
+        with self.lock:
+            for fault in self._faults:
+                if fault.matches(endpoint):
+                    fault.remaining -= 1
+                    raise ApiError(fault.status, fault.body.get('message'), fault.body)
+
+    def _check_quota(self, api_key):
+        if self.quota is None:
+            return
+
+        max_requests, window = self.quota
+        now = time.time()
+        with self.lock:
+            start, used = self._usage.get(api_key, (now, 0))
+            if now - start >= window:
+                start, used = now, 0
+            if used >= max_requests:
+                wait_time = max(1, int((start + window - now) * 1000 + 0.999))
+                raise ApiError(429, "Too many requests", {'message': "Too many requests", 'waitTime': wait_time})
+            self._usage[api_key] = (start, used + 1)
+
+    def _respond(self, status, result, request_headers, etag=False):
+        headers = {'Trace-Id': uuid.uuid4().hex[:16]}
+
+        if isinstance(result, bytes):
+            body = result
+            headers['Content-Type'] = 'text/plain'
+        elif isinstance(result, string_types):
+            body = result.encode('utf-8')
+            headers['Content-Type'] = 'text/plain'
+        else:
+            body = json.dumps(result).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        if etag and status == 200 and self.etags:
+            headers['ETag'] = '"%s"' % hashlib.md5(body).hexdigest()
+            if request_headers.get('If-None-Match') == headers['ETag']:
+                return 304, headers, b''
+
+        if (self.compress_responses and len(body) >= COMPRESSION_THRESHOLD and
+                'gzip' in (request_headers.get('Accept-Encoding') or '')):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+
+        return status, headers, body
+
+    def _find_report(self, request, report_id):
+        if request.get('idType') == 'external':
+            for report in self.reports.values():
+                if report['externalTrackingId'] == report_id:
+                    return report
+        elif report_id in self.reports:
+            return self.reports[report_id]
+        raise ApiError(404, "Report not found")
+
+    def _visible_report(self, report, enclave_ids=None, distribution_type=None):
+        if distribution_type is not None and report['distributionType'] != distribution_type:
+            return False
+        if enclave_ids and report['distributionType'] == 'ENCLAVE':
+            return bool(set(enclave_ids) & set(report['enclaveIds'] or []))
+        return True
+
+    def _report_page(self, reports, request, strip_body=False):
+        items = reports
+        if strip_body:
+            items = [dict(r, reportBody=None) for r in reports]
+        return paginate(items, request)
+
+    def ping(self, request):
+        return "pong\n"
+
+    def version(self, request):
+        return API_PREFIX.strip('/').split('/')[-1] + "\n"
+
+    def get_enclaves(self, request):
+        return self.enclaves
+
+    def get_request_quotas(self, request):
+        if self.quota is None:
+            return []
+        max_requests, window = self.quota
+        with self.lock:
+            start, used = self._usage.get(request.api_key, (time.time(), 0))
+        return [{'guid': 'quota', 'maxRequests': max_requests, 'usedRequests': used,
+                 'timeWindow': int(window * 1000), 'lastResetTime': int(start * 1000),
+                 'nextResetTime': int((start + window) * 1000)}]
+
+    def get_reports(self, request):
+        to_time = request.get_int('to', now_millis())
+        from_time = request.get_int('from', to_time - DAY)
+        from_time = max(from_time, to_time - MAX_REPORTS_WINDOW)
+        tags = set(request.get_list('tags'))
+        excluded_tags = set(request.get_list('excludedTags'))
+
+        with self.lock:
+            reports = []
+            for report in self.reports.values():
+                if not from_time <= report['updated'] <= to_time:
+                    continue
+                if not self._visible_report(report, request.get_list('enclaveIds'), request.get('distributionType')):
+                    continue
+                names = set(t['name'] for t in self.report_tags[report['id']])
+                if not tags <= names or excluded_tags & names:
+                    continue
+                reports.append(report)
+
+        # most recently updated first; the client pages backwards by moving "to" before the last report
+        reports.sort(key=lambda r: r['updated'], reverse=True)
+        page = reports[:self.reports_page_size]
+        return {'items': page, 'pageSize': len(page), 'pageNumber': 0, 'totalElements': len(page),
+                'hasNext': len(reports) > len(page)}
+
+    def submit_report(self, request):
+        body = request.json()
+        report = self.add_report(title=body.get('title'), body=body.get('reportBody'),
+                                 enclave_ids=body.get('enclaveIds'),
+                                 distribution_type=body.get('distributionType') or 'ENCLAVE',
+                                 time_began=body.get('timeBegan'), external_id=body.get('externalTrackingId'),
+                                 external_url=body.get('externalUrl'))
+        return report['id']
+
+    def get_report(self, request):
+        with self.lock:
+            return self._find_report(request, request.segments[1])
+
+    def update_report(self, request):
+        body = request.json()
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            for key in ['title', 'reportBody', 'timeBegan', 'externalTrackingId', 'externalUrl', 'distributionType',
+                        'enclaveIds']:
+                if body.get(key) is not None:
+                    report[key] = body[key]
+            report['updated'] = now_millis()
+            self._extract(report)
+            return report
+
+    def delete_report(self, request):
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            del self.reports[report['id']]
+            self.report_tags.pop(report['id'], None)
+            self.report_indicators.pop(report['id'], None)
+        return ""
+
+    def search_reports(self, request):
+        term = (request.get('searchTerm') or '').lower()
+        if len(term) < 3:
+            raise ApiError(400, "Search term must be at least 3 characters")
+        with self.lock:
+            reports = [r for r in self.reports.values()
+                       if (term in (r['title'] or '').lower() or term in (r['reportBody'] or '').lower()) and
+                       self._visible_report(r, request.get_list('enclaveIds'))]
+        return self._report_page(reports, request, strip_body=True)
+
+    def _correlated_reports(self, request):
+        values = set(request.get_list('indicators'))
+        with self.lock:
+            return [r for r in self.reports.values()
+                    if values & set(self.report_indicators[r['id']]) and
+                    self._visible_report(r, request.get_list('enclaveIds'), request.get('distributionType'))]
+
+    def correlate(self, request):
+        return [r['id'] for r in self._correlated_reports(request)]
+
+    def get_correlated_reports(self, request):
+        return self._report_page(self._correlated_reports(request), request)
+
+    def get_report_indicators(self, request):
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            indicators = [self.indicators[v] for v in self.report_indicators[report['id']] if v in self.indicators]
+        return paginate(indicators, request)
+
+    def get_report_tags(self, request):
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            return list(self.report_tags[report['id']])
+
+    def add_report_tag(self, request):
+        name = request.get('name')
+        enclave_id = request.get('enclaveId')
+        if not name or not enclave_id:
+            raise ApiError(400, "name and enclaveId are required")
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            tags = self.report_tags[report['id']]
+            for tag in tags:
+                if tag['name'] == name and tag['enclaveId'] == enclave_id:
+                    return tag['guid']
+            tag = {'guid': str(uuid.uuid4()), 'name': name, 'enclaveId': enclave_id}
+            tags.append(tag)
+            return tag['guid']
+
+    def delete_report_tag(self, request):
+        with self.lock:
+            report = self._find_report(request, request.segments[1])
+            tags = self.report_tags[report['id']]
+            remaining = [t for t in tags if t['guid'] != request.segments[3]]
+            if len(remaining) == len(tags):
+                raise ApiError(404, "Tag not found")
+            self.report_tags[report['id']] = remaining
+        return ""
+
+    def get_all_report_tags(self, request):
+        enclave_ids = set(request.get_list('enclaveIds'))
+        with self.lock:
+            tags = OrderedDict()
+            for report_tags in self.report_tags.values():
+                for tag in report_tags:
+                    if not enclave_ids or tag['enclaveId'] in enclave_ids:
+                        tags[(tag['name'], tag['enclaveId'])] = tag
+        return list(tags.values())
+
+    def get_indicators(self, request):
+        to_time = request.get_int('to', now_millis())
+        from_time = request.get_int('from', to_time - 7 * DAY)
+        enclave_ids = set(request.get_list('enclaveIds'))
+        tag_ids = set(request.get_list('tagIds'))
+        excluded_tag_ids = set(request.get_list('excludedTagIds'))
+
+        with self.lock:
+            indicators = []
+            for indicator in self.indicators.values():
+                if not from_time <= indicator['lastSeen'] <= to_time:
+                    continue
+                if enclave_ids and not enclave_ids & set(indicator['enclaveIds']):
+                    continue
+                guids = set(t['guid'] for t in indicator['tags'])
+                if not tag_ids <= guids or excluded_tag_ids & guids:
+                    continue
+                indicators.append(indicator)
+
+        indicators.sort(key=lambda i: i['lastSeen'], reverse=True)
+        return paginate(indicators, request)
+
+    def submit_indicators(self, request):
+        body = request.json()
+        for indicator in body.get('content') or []:
+            self.add_indicator(indicator['value'], indicator.get('indicatorType'),
+                               enclave_ids=body.get('enclaveIds'), last_seen=indicator.get('lastSeen'),
+                               tags=(indicator.get('tags') or []) + (body.get('tags') or []))
+        return ""
+
+    def search_indicators(self, request):
+        term = (request.get('searchTerm') or '').lower()
+        if len(term) < 3:
+            raise ApiError(400, "Search term must be at least 3 characters")
+        with self.lock:
+            indicators = [i for i in self.indicators.values() if term in i['value'].lower()]
+        return paginate(indicators, request)
+
+    def get_indicators_metadata(self, request):
+        values = request.get_list('values')
+        types = request.get_list('types')
+        with self.lock:
+            result = []
+            for i, value in enumerate(values):
+                indicator = self.indicators.get(value)
+                if indicator is None:
+                    continue
+                if i < len(types) and types[i] and types[i] != indicator['indicatorType']:
+                    continue
+                result.append(indicator)
+        return result
+
+    def get_indicator_details(self, request):
+        with self.lock:
+            result = []
+            for value in request.get_list('indicatorValues'):
+                indicator = self.indicators.get(value)
+                if indicator is not None:
+                    result.append(dict(indicator, whitelisted=value in self.whitelist))
+        return result
+
+    def get_related_indicators(self, request):
+        values = set(request.get_list('indicators'))
+        with self.lock:
+            related = OrderedDict()
+            for report in self._correlated_reports(request):
+                for value in self.report_indicators[report['id']]:
+                    if value not in values and value in self.indicators:
+                        related[value] = self.indicators[value]
+        return paginate(list(related.values()), request)
+
+    def get_community_trends(self, request):
+        indicator_type = request.get('type')
+        with self.lock:
+            indicators = [i for i in self.indicators.values()
+                          if (indicator_type is None and i['indicatorType'] not in ('MALWARE', 'CVE')) or
+                          i['indicatorType'] == indicator_type]
+        indicators.sort(key=lambda i: i['sightings'], reverse=True)
+        return indicators[:10]
+
+    def get_all_indicator_tags(self, request):
+        enclave_ids = set(request.get_list('enclaveIds'))
+        with self.lock:
+            tags = OrderedDict()
+            for indicator in self.indicators.values():
+                for tag in indicator['tags']:
+                    if not enclave_ids or tag['enclaveId'] in enclave_ids:
+                        tags[(tag['name'], tag['enclaveId'])] = tag
+        return list(tags.values())
+
+    def add_indicator_tag(self, request):
+        name = request.get('name')
+        enclave_id = request.get('enclaveId')
+        if not name or not enclave_id:
+            raise ApiError(400, "name and enclaveId are required")
+        indicator = self.add_indicator(request.segments[1], sightings=0,
+                                       tags=[{'name': name, 'enclaveId': enclave_id}])
+        with self.lock:
+            for tag in indicator['tags']:
+                if tag['name'] == name and tag['enclaveId'] == enclave_id:
+                    return tag
+
+    def delete_indicator_tag(self, request):
+        with self.lock:
+            indicator = self.indicators.get(request.segments[1])
+            if indicator is None:
+                raise ApiError(404, "Indicator not found")
+            indicator['tags'] = [t for t in indicator['tags'] if t['guid'] != request.segments[3]]
+        return ""
+
+    def get_whitelist(self, request):
+        with self.lock:
+            return paginate(list(self.whitelist.values()), request)
+
+    def add_to_whitelist(self, request):
+        terms = request.json()
+        added = []
+        with self.lock:
+            for term in terms:
+                extracted = extract_indicators(term) or [(self._guess_type(term), term)]
+                for indicator_type, value in extracted:
+                    self.whitelist[value] = {'value': value, 'indicatorType': indicator_type}
+                    added.append(self.whitelist[value])
+        return added
+
+    def delete_from_whitelist(self, request):
+        with self.lock:
+            if self.whitelist.pop(request.get('value'), None) is None:
+                raise ApiError(404, "Indicator not found in whitelist")
+        return ""
+
+
+def paginate(items, request):
+    """
+    Returns the page of ``items`` selected by the ``pageNumber`` and ``pageSize`` params of a request.
+    """
+
+    page_size = min(request.get_int('pageSize', DEFAULT_PAGE_SIZE) or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    page_number = request.get_int('pageNumber', 0) or 0
+    start = page_number * page_size
+    page = items[start:start + page_size]
+    return {
+        'items': page,
+        'pageNumber': page_number,
+        'pageSize': page_size,
+        'totalElements': len(items),
+        'hasNext': start + page_size < len(items)
+    }
+
+
+class Request(object):
+    """
+    The parts of a request that endpoint handlers need.
+    """
+
+    def __init__(self, segments, params, body, api_key=None):
+        self.segments = segments
+        self.params = params
+        self.body = body
+        self.api_key = api_key
+
+    def get(self, name, default=None):
+        values = self.params.get(name)
+        return values[0] if values else default
+
+    def get_int(self, name, default=None):
+        value = self.get(name)
+        if value is None or value == '':
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(400, "Invalid value for %s: %s" % (name, value))
+
+    def get_list(self, name):
+        # requests encodes lists as repeated params, but IDs may also be comma-separated
+        values = []
+        for value in self.params.get(name) or []:
+            if name.endswith('Ids'):
+                values.extend(v for v in value.split(',') if v)
+            else:
+                values.append(value)
+        return values
+
+    def json(self):
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except (ValueError, AttributeError):
+            raise ApiError(400, "Invalid json body")
+
+
+ROUTES = {
+    'GET ping': FakeTruStarServer.ping,
+    'GET version': FakeTruStarServer.version,
+    'GET enclaves': FakeTruStarServer.get_enclaves,
+    'GET request-quotas': FakeTruStarServer.get_request_quotas,
+    'GET reports': FakeTruStarServer.get_reports,
+    'POST reports': FakeTruStarServer.submit_report,
+    'GET reports/{id}': FakeTruStarServer.get_report,
+    'PUT reports/{id}': FakeTruStarServer.update_report,
+    'DELETE reports/{id}': FakeTruStarServer.delete_report,
+    'GET reports/search': FakeTruStarServer.search_reports,
+    'GET reports/correlate': FakeTruStarServer.correlate,
+    'GET reports/correlated': FakeTruStarServer.get_correlated_reports,
+    'GET reports/{id}/indicators': FakeTruStarServer.get_report_indicators,
+    'GET reports/{id}/tags': FakeTruStarServer.get_report_tags,
+    'POST reports/{id}/tags': FakeTruStarServer.add_report_tag,
+    'DELETE reports/{id}/tags/{tag_id}': FakeTruStarServer.delete_report_tag,
+    'GET reports/tags': FakeTruStarServer.get_all_report_tags,
+    'GET indicators': FakeTruStarServer.get_indicators,
+    'POST indicators': FakeTruStarServer.submit_indicators,
+    'GET indicators/search': FakeTruStarServer.search_indicators,
+    'GET indicators/metadata': FakeTruStarServer.get_indicators_metadata,
+    'GET indicators/details': FakeTruStarServer.get_indicator_details,
+    'GET indicators/related': FakeTruStarServer.get_related_indicators,
+    'GET indicators/community-trending': FakeTruStarServer.get_community_trends,
+    'GET indicators/tags': FakeTruStarServer.get_all_indicator_tags,
+    'POST indicators/{id}/tags': FakeTruStarServer.add_indicator_tag,
+    'DELETE indicators/{id}/tags/{tag_id}': FakeTruStarServer.delete_indicator_tag,
+    'GET whitelist': FakeTruStarServer.get_whitelist,
+    'POST whitelist': FakeTruStarServer.add_to_whitelist,
+    'DELETE whitelist': FakeTruStarServer.delete_from_whitelist
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # clients that time out close the connection before the response is written
+        if isinstance(sys.exc_info()[1], socket.error):
+            logger.debug("%s disconnected before the response was written.", client_address[0])
+            return
+        HTTPServer.handle_error(self, request, client_address)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Passes requests to the |FakeTruStarServer| it belongs to.
+    """
+
+    # keep-alive, so that connection reuse by the client can be measured
+    protocol_version = 'HTTP/1.1'
+
+    # the headers and the body are written separately; without this, the body waits for the client's delayed ack of
+    # the headers (about 40ms) on every kept-alive connection
+    disable_nagle_algorithm = True
+
+    fake_server = None
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        status, headers, content = self.fake_server.handle(self.command, self.path, self.headers, body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
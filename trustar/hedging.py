@@ -0,0 +1,242 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError, wait
+
+# package imports
+from .utils import get_endpoint_template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_QUANTILE = 0.95
+
+# the fraction of requests that may be hedged
+DEFAULT_HEDGE_BUDGET = 0.1
+
+# unused budget is kept for bursts of slow responses, up to this many hedges
+MAX_HEDGE_CREDITS = 10
+
+# the number of calls to an endpoint needed before its latency quantile is used as the hedge delay
+MIN_HEDGE_SAMPLES = 20
+
+
+class HedgeBudget(object):
+    """
+    Limits hedged requests to a fraction of all requests: each request earns ``ratio`` of a credit, and each hedge
+    spends one.
+    """
+
+    def __init__(self, ratio=DEFAULT_HEDGE_BUDGET, max_credits=MAX_HEDGE_CREDITS):
+        self.ratio = ratio
+        self.max_credits = max_credits
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._credits = min(self._credits + self.ratio, self.max_credits)
+
+    def spend(self):
+        """
+        :return: Whether there was a credit to spend.
+        """
+
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+    def refund(self):
+        with self._lock:
+            self._credits += 1
+
+
+def _run(func):
+    """
+    Calls a function in a new thread.
+
+    :return: A future of its result.
+    """
+
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def _discard(future):
+    """
+    Releases the connection of a response that lost the race.
+    """
+
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class Hedger(object):
+    """
+    Hedges idempotent GETs to cut tail latency: if a response hasn't arrived after a delay (by default, the endpoint's
+    observed 95th percentile latency), a duplicate request is sent, and whichever response arrives first is used.  The
+    other is discarded: ``requests`` can't abort a request in flight, so its connection is released once it completes,
+    but a duplicate that hasn't been sent yet when the first response arrives never is.
+
+    Hedging at the 95th percentile sends a duplicate for about 5% of requests; the budget caps that fraction, so that a
+    degraded API doesn't double the quota used.  Duplicates also take a token from the client's rate limiter, if it has
+    one, and aren't sent if none is available, or if ``max_hedges`` duplicates are already in flight.
+
+    Each request is sent on a thread of its own, so that the number of requests in flight is only limited by the
+    caller; duplicates are sent on a separate pool of ``max_hedges`` threads, so that they are never queued.
+    """
+
+    def __init__(self, metrics, delay=None, quantile=DEFAULT_HEDGE_QUANTILE, budget=DEFAULT_HEDGE_BUDGET,
+                 templates=None, max_hedges=20):
+        """
+        :param metrics: The |Metrics| whose latencies determine the delay.
+        :param float delay: A fixed delay in seconds, instead of the latency quantile.
+        :param float quantile: The latency quantile of the endpoint to use as the delay.
+        :param float budget: The fraction of requests that may be hedged.
+        :param list templates: The endpoint templates to hedge (i.e. ``"reports/{id}"``); by default, all GETs.
+        :param int max_hedges: The number of duplicates that may be in flight at once.
+        """
+
+        self.metrics = metrics
+        self.delay = delay
+        self.quantile = quantile
+        self.budget = HedgeBudget(ratio=budget)
+        self.templates = set(templates) if templates else None
+
+        self._executor = ThreadPoolExecutor(max_workers=max_hedges)
+        self._hedge_slots = threading.Semaphore(max_hedges)
+        self._closed = False
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.over_budget = 0
+        self.saturated = 0
+
+    def is_hedgeable(self, method, path, stream=False):
+        """
+        :return: Whether a request can be hedged: only non-streamed GETs, to the configured endpoints.
+        """
+
+        if method != "GET" or stream:
+            return False
+        return self.templates is None or get_endpoint_template(path) in self.templates
+
+    def get_delay(self, endpoint):
+        """
+        :return: How long to wait for a response before hedging, in seconds; ``None`` if there aren't enough
+            latencies observed yet.
+        """
+
+        if self.delay is not None:
+            return self.delay
+        return self.metrics.get_latency_quantile(endpoint, self.quantile, min_count=MIN_HEDGE_SAMPLES)
+
+    def send(self, endpoint, send, can_hedge=None, cancellation=None):
+        """
+        Sends a request, hedging it if it is slow.
+
+        :param str endpoint: The endpoint of the request, i.e. ``"GET reports/{id}"``.
+        :param send: A function that sends the request and returns the response.
+        :param can_hedge: A function returning whether a duplicate may be sent now, i.e. by taking a rate limit token.
+        :param cancellation: The caller's |CancellationToken|, if any; no duplicate is sent after its deadline.
+        :return: The first response.
+        """
+
+        self.budget.earn()
+        with self._lock:
+            self.requests += 1
+
+        delay = self.get_delay(endpoint)
+        # a duplicate sent after the deadline couldn't be used
+        if delay is None or self._closed or (cancellation is not None and cancellation.remaining() <= delay):
+            return send()
+
+        primary = _run(send)
+        try:
+            return primary.result(timeout=delay)
+        except TimeoutError:
+            pass
+
+        if not self.budget.spend():
+            with self._lock:
+                self.over_budget += 1
+            return primary.result()
+        if not self._hedge_slots.acquire(False):
+            self.budget.refund()
+            with self._lock:
+                self.saturated += 1
+            return primary.result()
+        if can_hedge is not None and not can_hedge():
+            self._hedge_slots.release()
+            self.budget.refund()
+            return primary.result()
+
+        logger.debug("No response from %s after %.3fs; hedging.", endpoint, delay)
+        try:
+            hedge = self._executor.submit(send)
+        except RuntimeError:
+            # closed in the meantime
+            self._hedge_slots.release()
+            return primary.result()
+        hedge.add_done_callback(lambda _: self._hedge_slots.release())
+        with self._lock:
+            self.hedged += 1
+
+        futures = [primary, hedge]
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in [f for f in futures if f in done]:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    if not loser.cancel():
+                        loser.add_done_callback(_discard)
+                if future is hedge:
+                    with self._lock:
+                        self.won += 1
+                elif hedge in done:
+                    _discard(hedge)
+                return future.result()
+
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'won': self.won,
+                'over_budget': self.over_budget,
+                'saturated': self.saturated
+            }
+
+    def close(self):
+        """
+        Stops sending duplicates; requests are still sent, without hedging.
+        """
+
+        self._closed = True
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,157 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PRE_REQUEST = 'pre_request'
+POST_RESPONSE = 'post_response'
+RETRY = 'retry'
+ERROR = 'error'
+
+HOOK_TYPES = (PRE_REQUEST, POST_RESPONSE, RETRY, ERROR)
+
+DEFAULT_SLOW_REQUEST_THRESHOLD = 5
+
+
+class RequestEvent(object):
+    """
+    Describes a single HTTP request made by |ApiClient|, as passed to hooks.  Each attempt (including retries) is a
+    separate event; attributes that are not yet known when a hook is called are ``None``.
+
+    :ivar method: The method of the request, i.e. ``"GET"``.
+    :ivar path: The path of the request, i.e. ``"reports/1234"``.
+    :ivar endpoint: The method and endpoint template, i.e. ``"GET reports/{id}"``.
+    :ivar url: The full URL of the request.
+    :ivar params: The query parameters of the request.
+    :ivar attempt: The number of the attempt, starting at 1.
+    :ivar request_size: The size of the request body before compression, in bytes.
+    :ivar sent_size: The size of the request body that was sent, in bytes.
+    :ivar start: The time the request was sent, in seconds since epoch.
+    :ivar elapsed: The time until the response headers were received, in seconds.
+    :ivar status_code: The status code of the response.
+    :ivar trace_id: The ``Trace-Id`` header of the response, which identifies the request to TruSTAR support.
+    :ivar response_size: The size of the response body, in bytes (``None`` for streamed responses).
+    :ivar response: The ``requests`` response object.
+    :ivar reason: For retry events, why the request is being retried, i.e. ``"rate_limited"``.
+    :ivar wait_time: For retry events, how long the client waits before retrying, in seconds.
+    :ivar error: For error events, the exception.
+    """
+
+    def __init__(self, method, path, endpoint, url=None, params=None, attempt=1, request_size=None, sent_size=None,
+                 start=None):
+
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.url = url
+        self.params = params
+        self.attempt = attempt
+        self.request_size = request_size
+        self.sent_size = sent_size
+        self.start = start
+        self.elapsed = None
+        self.status_code = None
+        self.trace_id = None
+        self.response_size = None
+        self.response = None
+        self.reason = None
+        self.wait_time = None
+        self.error = None
+
+    def set_response(self, response, elapsed):
+        """
+        Fills in the attributes describing the response.
+        """
+
+        self.response = response
+        self.elapsed = elapsed
+        self.status_code = response.status_code
+        self.trace_id = response.headers.get('Trace-Id')
+        # a streamed body has not been read yet, and reading it here would defeat streaming
+        if getattr(response, '_content', None) is not False:
+            self.response_size = len(response.content or b'')
+
+
+class Hooks(object):
+    """
+    Functions called at each stage of the requests made by an |ApiClient|, i.e. to attach tracer spans, profile, or log
+    slow calls.  Each function is called with a |RequestEvent|:
+
+    - ``pre_request``: before each attempt is sent.
+    - ``post_response``: after the response headers of each attempt are received.
+    - ``retry``: before waiting to retry an attempt (after a 429 or an expired token).
+    - ``error``: when a request fails, either with an HTTP error status or without a response at all.
+
+    Since pagination generators make their requests through the same client, hooks are called for each page.
+    Exceptions raised by hooks are logged, never propagated, so a broken hook can't fail a request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = dict((hook_type, []) for hook_type in HOOK_TYPES)
+
+    def register(self, hook_type, func):
+        """
+        :param str hook_type: One of ``pre_request``, ``post_response``, ``retry`` or ``error``.
+        :param func: A function taking a |RequestEvent|.
+        :return: ``func``.
+        """
+
+        if hook_type not in self._hooks:
+            raise ValueError("Unknown hook type '%s'; must be one of %s." % (hook_type, ', '.join(HOOK_TYPES)))
+        with self._lock:
+            # copy on write, so dispatching never needs the lock
+            self._hooks[hook_type] = self._hooks[hook_type] + [func]
+        return func
+
+    def unregister(self, hook_type, func):
+        with self._lock:
+            self._hooks[hook_type] = [f for f in self._hooks[hook_type] if f is not func]
+
+    def dispatch(self, hook_type, event):
+        """
+        Calls every function registered for a hook type.
+
+        :param str hook_type: The hook type.
+        :param event: The |RequestEvent|.
+        """
+
+        for func in self._hooks[hook_type]:
+            try:
+                func(event)
+            except Exception:
+                logger.exception("Error in %s hook %r.", hook_type, func)
+
+    def __contains__(self, hook_type):
+        return bool(self._hooks.get(hook_type))
+
+
+class SlowRequestLogger(object):
+    """
+    A ``post_response`` hook that logs a warning for every request that took longer than a threshold.  Register it
+    with ``client.hooks.register('post_response', SlowRequestLogger(threshold=2))``, or set the
+    ``slow_request_threshold`` config key.
+    """
+
+    def __init__(self, threshold=DEFAULT_SLOW_REQUEST_THRESHOLD, log=logger, level=logging.WARNING):
+        """
+        :param float threshold: The latency above which requests are logged, in seconds.
+        :param log: The logger to log to.
+        :param int level: The level to log at.
+        """
+
+        self.threshold = threshold
+        self.log = log
+        self.level = level
+
+    def __call__(self, event):
+        if event.elapsed is not None and event.elapsed >= self.threshold:
+            self.log.log(self.level, "Slow request: %s %s took %.3fs (status %s, attempt %d, %s bytes sent, "
+                                     "%s bytes received). Trace-Id: %s",
+                         event.method, event.path, event.elapsed, event.status_code, event.attempt, event.sent_size,
+                         event.response_size, event.trace_id)
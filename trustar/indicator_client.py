@@ -1,26 +1,25 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, str
-from future import standard_library
 from six import string_types
 
 # external imports
 import functools
-import json
 import logging
 
 # package imports
+from .batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_DELAY, IndicatorMetadataBatcher
+from .codec import loads
 from .models import Indicator, Page, Tag
-
-# python 2 backwards compatibility
-standard_library.install_aliases()
+from .utils import get_current_time_millis
+from .whitelist import WhitelistMatcher
 
 logger = logging.getLogger(__name__)
 
 
 class IndicatorClient(object):
 
-    def submit_indicators(self, indicators, enclave_ids=None, tags=None):
+    def submit_indicators(self, indicators, enclave_ids=None, tags=None, whitelist=None):
         """
         Submit indicators directly.  The indicator field ``value`` is required; all other metadata fields are optional:
         ``firstSeen``, ``lastSeen``, ``sightings``, ``notes``, and ``source``. The submission must specify enclaves for
@@ -39,8 +38,15 @@ class IndicatorClient(object):
             can be modified in TruSTAR by using this function.
         :param list(string) enclave_ids: a list of enclave IDs.
         :param list(string) tags: a list of |Tag| objects that will be applied to ALL indicators in the submission.
+        :param whitelist: A |WhitelistMatcher|.  Whitelisted indicators are dropped rather than submitted, and nothing is
+            submitted if all of them are.
         """
 
+        if whitelist is not None:
+            indicators = whitelist.filter(indicators)
+            if not indicators:
+                return
+
         if enclave_ids is None:
             enclave_ids = self.enclave_ids
 
@@ -52,11 +58,14 @@ class IndicatorClient(object):
             "content": [indicator.to_dict() for indicator in indicators],
             "tags": tags
         }
-        self._client.post("indicators", data=json.dumps(body))
+        self._client.post("indicators", json=body)
+
+        # the metadata of the submitted indicators has changed
+        self._client.invalidate_cache(template="indicators/metadata")
 
     def get_indicators(self, from_time=None, to_time=None, enclave_ids=None,
                        included_tag_ids=None, excluded_tag_ids=None,
-                       start_page=0, page_size=None):
+                       start_page=0, page_size=None, deadline=None):
         """
         Creates a generator from the |get_indicators_page| method that returns each successive indicator as an
         |Indicator| object containing values for the 'value' and 'type' attributes only; all
@@ -71,6 +80,7 @@ class IndicatorClient(object):
         :param int page_size: Passing the integer 1000 as the argument to this parameter should result in your script 
         making fewer API calls because it returns the largest quantity of indicators with each API call.  An API call 
         has to be made to fetch each |Page|.   
+        :param deadline: The number of seconds to retrieve all the indicators in, or a |CancellationToken|.
         :return: A generator of |Indicator| objects containing values for the "value" and "type" attributes only.
         All other attributes of the |Indicator| object will contain Null values. 
         
@@ -87,7 +97,7 @@ class IndicatorClient(object):
 
         indicators_generator = Page.get_generator(page_generator=indicators_page_generator)
 
-        return indicators_generator
+        return self._client.iterate(indicators_generator, deadline)
 
     def _get_indicators_page_generator(self, from_time=None, to_time=None, page_number=0, page_size=None,
                                        enclave_ids=None, included_tag_ids=None, excluded_tag_ids=None):
@@ -112,12 +122,13 @@ class IndicatorClient(object):
             page_size=page_size,
             enclave_ids=enclave_ids,
             included_tag_ids=included_tag_ids,
-            excluded_tag_ids=excluded_tag_ids
+            excluded_tag_ids=excluded_tag_ids,
+            stream=True
         )
         return Page.get_page_generator(get_page, page_number, page_size)
 
     def get_indicators_page(self, from_time=None, to_time=None, page_number=None, page_size=None,
-                            enclave_ids=None, included_tag_ids=None, excluded_tag_ids=None):
+                            enclave_ids=None, included_tag_ids=None, excluded_tag_ids=None, stream=False):
         """
         Get a page of indicators matching the provided filters.
 
@@ -128,6 +139,8 @@ class IndicatorClient(object):
         :param list(string) enclave_ids: a list of enclave IDs to filter by
         :param list(string) included_tag_ids: only indicators containing ALL of these tags will be returned
         :param list(string) excluded_tag_ids: only indicators containing NONE of these tags will be returned
+        :param boolean stream: whether to decode the indicators incrementally from the response as the page is
+            iterated over, rather than parsing the entire response up front (see |Page.from_stream|)
         :return: a |Page| of indicators
         """
 
@@ -141,23 +154,25 @@ class IndicatorClient(object):
             'excludedTagIds': excluded_tag_ids
         }
 
-        resp = self._client.get("indicators", params=params)
+        resp = self._client.get("indicators", params=params, stream=stream)
 
-        page_of_indicators = Page.from_dict(resp.json(), content_type=Indicator)
+        page_of_indicators = Page.from_response(resp, content_type=Indicator, stream=stream)
 
         return page_of_indicators
 
-    def search_indicators(self, search_term, enclave_ids=None):
+    def search_indicators(self, search_term, enclave_ids=None, deadline=None):
         """
         Uses the |search_indicators_page| method to create a generator that returns each successive indicator.
 
         :param str search_term: The term to search for.
         :param list(str) enclave_ids: list of enclave ids used to restrict indicators to specific enclaves (optional - by
             default indicators from all of user's enclaves are returned)
+        :param deadline: The number of seconds to retrieve all the results in, or a |CancellationToken|.
         :return: The generator.
         """
 
-        return Page.get_generator(page_generator=self._search_indicators_page_generator(search_term, enclave_ids))
+        indicators = Page.get_generator(page_generator=self._search_indicators_page_generator(search_term, enclave_ids))
+        return self._client.iterate(indicators, deadline)
 
     def _search_indicators_page_generator(self, search_term, enclave_ids=None, start_page=0, page_size=None):
         """
@@ -171,10 +186,10 @@ class IndicatorClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.search_indicators_page, search_term, enclave_ids)
+        get_page = functools.partial(self.search_indicators_page, search_term, enclave_ids, stream=True)
         return Page.get_page_generator(get_page, start_page, page_size)
 
-    def search_indicators_page(self, search_term, enclave_ids=None, page_size=None, page_number=None):
+    def search_indicators_page(self, search_term, enclave_ids=None, page_size=None, page_number=None, stream=False):
         """
         Search for indicators containing a search term.
 
@@ -183,6 +198,7 @@ class IndicatorClient(object):
             enclaves (optional - by default reports from all of the user's enclaves are used)
         :param int page_number: the page number to get.
         :param int page_size: the size of the page to be returned.
+        :param boolean stream: whether to decode the indicators incrementally as the page is iterated over.
         :return: a |Page| of |Indicator| objects.
         """
 
@@ -193,30 +209,34 @@ class IndicatorClient(object):
             'pageNumber': page_number
         }
 
-        resp = self._client.get("indicators/search", params=params)
+        resp = self._client.get("indicators/search", params=params, stream=stream)
 
-        return Page.from_dict(resp.json(), content_type=Indicator)
+        return Page.from_response(resp, content_type=Indicator, stream=stream)
 
-    def get_related_indicators(self, indicators=None, enclave_ids=None):
+    def get_related_indicators(self, indicators=None, enclave_ids=None, deadline=None):
         """
         Uses the |get_related_indicators_page| method to create a generator that returns each successive report.
 
         :param list(string) indicators: list of indicator values to search for
         :param list(string) enclave_ids: list of GUIDs of enclaves to search in
+        :param deadline: The number of seconds to retrieve all the indicators in, or a |CancellationToken|.
         :return: The generator.
         """
 
-        return Page.get_generator(page_generator=self._get_related_indicators_page_generator(indicators, enclave_ids))
+        related = Page.get_generator(page_generator=self._get_related_indicators_page_generator(indicators, enclave_ids))
+        return self._client.iterate(related, deadline)
 
-    def get_indicators_for_report(self, report_id):
+    def get_indicators_for_report(self, report_id, deadline=None):
         """
         Creates a generator that returns each successive indicator for a given report.
 
         :param str report_id: The ID of the report to get indicators for.
+        :param deadline: The number of seconds to retrieve all the indicators in, or a |CancellationToken|.
         :return: The generator.
         """
 
-        return Page.get_generator(page_generator=self._get_indicators_for_report_page_generator(report_id))
+        indicators = Page.get_generator(page_generator=self._get_indicators_for_report_page_generator(report_id))
+        return self._client.iterate(indicators, deadline)
 
     def get_indicator_metadata(self, value):
         """
@@ -242,7 +262,7 @@ class IndicatorClient(object):
         else:
             return None
 
-    def get_indicators_metadata(self, indicators):
+    def get_indicators_metadata(self, indicators, prefilter=None):
         """
         Provide metadata associated with an list of indicators, including value, indicatorType, noteCount, sightings,
         lastSeen, enclaveIds, and tags. The metadata is determined based on the enclaves the user making the request has
@@ -251,11 +271,20 @@ class IndicatorClient(object):
         :param indicators: a list of |Indicator| objects to query.  Values are required, types are optional.  Types
             might be required to distinguish in a case where one indicator value has been associated with multiple types
             based on different contexts.
+        :param prefilter: An |IndicatorFilter| of the known indicators.  Indicators it rules out are not requested.
         :return: A list of |Indicator| objects.  The following attributes of the objects will be returned:  
             correlation_count, last_seen, sightings, notes, tags, enclave_ids.  All other attributes of the Indicator
             objects will have Null values.  
+
+        Long lists of indicators are split across several requests (see ``max_url_length``), which are sent
+        concurrently; the results are in the order of the indicators.
         """
 
+        if prefilter is not None:
+            indicators = prefilter.filter(indicators)
+            if not indicators:
+                return []
+
         params = {
             'values': [i.value for i in indicators],
             'types': [i.type for i in indicators]
@@ -264,9 +293,33 @@ class IndicatorClient(object):
         if len(params.get('types')) == 0:
             params['types'] = None
 
-        resp = self._client.get("indicators/metadata", params=params)
+        def get_chunk(chunk_params):
+            resp = self._client.get("indicators/metadata", params=chunk_params)
+            return [Indicator.from_dict(x) for x in loads(resp.content)]
+
+        return self._map_chunks(get_chunk, self._client.split_params("indicators/metadata", params,
+                                                                     ['values', 'types']))
+
+    def get_metadata_batcher(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY, prefilter=None):
+        """
+        Creates an |IndicatorMetadataBatcher|, which combines lookups of single indicators, i.e. from many threads,
+        into batched calls to |get_indicators_metadata|.
+
+        Example:
+
+        >>> batcher = ts.get_metadata_batcher()
+        >>> futures = [batcher.submit(value) for value in values]
+        >>> indicators = [future.result() for future in futures]
+        >>> batcher.close()
 
-        return [Indicator.from_dict(x) for x in resp.json()]
+        :param int max_batch_size: The most indicators in a request.
+        :param float max_delay: The most seconds a lookup waits for others to join its request.
+        :param prefilter: An |IndicatorFilter| of the known indicators.  Lookups it rules out resolve to ``None`` right
+            away.
+        :return: The |IndicatorMetadataBatcher|.  Close it when done with it.
+        """
+
+        return IndicatorMetadataBatcher(self, max_batch_size=max_batch_size, max_delay=max_delay, prefilter=prefilter)
 
     def get_indicator_details(self, indicators, enclave_ids=None):
         """
@@ -281,6 +334,9 @@ class IndicatorClient(object):
         :param enclave_ids: Only find details for indicators in these enclaves.
 
         :return: a list of |Indicator| objects with all fields (except possibly ``reason``) filled out
+
+        Long lists of indicators are split across several requests (see ``max_url_length``), which are sent
+        concurrently; the results are in the order of the indicators.
         """
 
         # if the indicators parameter is a string, make it a singleton
@@ -291,18 +347,49 @@ class IndicatorClient(object):
             'enclaveIds': enclave_ids,
             'indicatorValues': indicators
         }
-        resp = self._client.get("indicators/details", params=params)
 
-        return [Indicator.from_dict(indicator) for indicator in resp.json()]
+        def get_chunk(chunk_params):
+            resp = self._client.get("indicators/details", params=chunk_params)
+            return [Indicator.from_dict(indicator) for indicator in loads(resp.content)]
 
-    def get_whitelist(self):
+        return self._map_chunks(get_chunk, self._client.split_params("indicators/details", params,
+                                                                     ['indicatorValues']))
+
+    def get_whitelist(self, deadline=None):
         """
         Uses the |get_whitelist_page| method to create a generator that returns each successive whitelisted indicator.
 
+        :param deadline: The number of seconds to retrieve all the indicators in, or a |CancellationToken|.
         :return: The generator.
         """
 
-        return Page.get_generator(page_generator=self._get_whitelist_page_generator())
+        indicators = Page.get_generator(page_generator=self._get_whitelist_page_generator())
+        return self._client.iterate(indicators, deadline)
+
+    def get_whitelist_matcher(self, path=None, max_age=None, deadline=None):
+        """
+        Creates a |WhitelistMatcher| of the company's whitelist, to drop whitelisted values locally.
+
+        Example:
+
+        >>> whitelist = ts.get_whitelist_matcher("whitelist.json", max_age=3600)
+        >>> ts.submit_indicators(indicators, whitelist=whitelist)
+
+        :param str path: A file to keep a snapshot of the whitelist in.  If it exists, the matcher starts from it, and
+            is synced and saved again unless the snapshot is recent enough.
+        :param int max_age: The most seconds since the last sync for a snapshot to be used as is; by default, it is
+            always synced.
+        :param deadline: The number of seconds to sync the whitelist in, or a |CancellationToken|.
+        :return: The |WhitelistMatcher|.
+        """
+
+        matcher = WhitelistMatcher.open(path) if path is not None else WhitelistMatcher()
+        if matcher.synced_at is None or max_age is None \
+                or get_current_time_millis() - matcher.synced_at > max_age * 1000:
+            matcher.sync(self, deadline=deadline)
+            if path is not None:
+                matcher.save()
+        return matcher
 
     def add_terms_to_whitelist(self, terms):
         """
@@ -313,7 +400,7 @@ class IndicatorClient(object):
         """
 
         resp = self._client.post("whitelist", json=terms)
-        return [Indicator.from_dict(indicator) for indicator in resp.json()]
+        return [Indicator.from_dict(indicator) for indicator in loads(resp.content)]
 
     def delete_indicator_from_whitelist(self, indicator):
         """
@@ -341,17 +428,18 @@ class IndicatorClient(object):
         }
 
         resp = self._client.get("indicators/community-trending", params=params)
-        body = resp.json()
+        body = loads(resp.content)
 
         # parse items in response as indicators
         return [Indicator.from_dict(indicator) for indicator in body]
 
-    def get_whitelist_page(self, page_number=None, page_size=None):
+    def get_whitelist_page(self, page_number=None, page_size=None, stream=False):
         """
         Gets a paginated list of indicators that the user's company has whitelisted.
 
         :param int page_number: the page number to get.
         :param int page_size: the size of the page to be returned.
+        :param boolean stream: whether to decode the indicators incrementally as the page is iterated over.
         :return: A |Page| of |Indicator| objects.
         """
 
@@ -359,16 +447,17 @@ class IndicatorClient(object):
             'pageNumber': page_number,
             'pageSize': page_size
         }
-        resp = self._client.get("whitelist", params=params)
-        return Page.from_dict(resp.json(), content_type=Indicator)
+        resp = self._client.get("whitelist", params=params, stream=stream)
+        return Page.from_response(resp, content_type=Indicator, stream=stream)
     
-    def get_indicators_for_report_page(self, report_id, page_number=None, page_size=None):
+    def get_indicators_for_report_page(self, report_id, page_number=None, page_size=None, stream=False):
         """
         Get a page of the indicators that were extracted from a report.
 
         :param str report_id: the ID of the report to get the indicators for
         :param int page_number: the page number to get.
         :param int page_size: the size of the page to be returned.
+        :param boolean stream: whether to decode the indicators incrementally as the page is iterated over.
         :return: A |Page| of |Indicator| objects.
         """
 
@@ -376,10 +465,11 @@ class IndicatorClient(object):
             'pageNumber': page_number,
             'pageSize': page_size
         }
-        resp = self._client.get("reports/%s/indicators" % report_id, params=params)
-        return Page.from_dict(resp.json(), content_type=Indicator)
+        resp = self._client.get("reports/%s/indicators" % report_id, params=params, stream=stream)
+        return Page.from_response(resp, content_type=Indicator, stream=stream)
 
-    def get_related_indicators_page(self, indicators=None, enclave_ids=None, page_size=None, page_number=None):
+    def get_related_indicators_page(self, indicators=None, enclave_ids=None, page_size=None, page_number=None,
+                                    stream=False):
         """
         Finds all reports that contain any of the given indicators and returns correlated indicators from those reports.
 
@@ -387,6 +477,7 @@ class IndicatorClient(object):
         :param enclave_ids: list of IDs of enclaves to search in
         :param page_size: number of results per page
         :param page_number: page to start returning results on
+        :param stream: whether to decode the indicators incrementally as the page is iterated over
         :return: A |Page| of |Report| objects.
         """
 
@@ -397,9 +488,9 @@ class IndicatorClient(object):
             'pageSize': page_size
         }
 
-        resp = self._client.get("indicators/related", params=params)
+        resp = self._client.get("indicators/related", params=params, stream=stream)
 
-        return Page.from_dict(resp.json(), content_type=Indicator)
+        return Page.from_response(resp, content_type=Indicator, stream=stream)
 
     def _get_indicators_for_report_page_generator(self, report_id, start_page=0, page_size=None):
         """
@@ -411,7 +502,7 @@ class IndicatorClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.get_indicators_for_report_page, report_id=report_id)
+        get_page = functools.partial(self.get_indicators_for_report_page, report_id=report_id, stream=True)
         return Page.get_page_generator(get_page, start_page, page_size)
 
     def _get_related_indicators_page_generator(self, indicators=None, enclave_ids=None, start_page=0, page_size=None):
@@ -426,7 +517,7 @@ class IndicatorClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.get_related_indicators_page, indicators, enclave_ids)
+        get_page = functools.partial(self.get_related_indicators_page, indicators, enclave_ids, stream=True)
         return Page.get_page_generator(get_page, start_page, page_size)
 
     def _get_whitelist_page_generator(self, start_page=0, page_size=None):
@@ -438,4 +529,5 @@ class IndicatorClient(object):
         :return: The generator.
         """
 
-        return Page.get_page_generator(self.get_whitelist_page, start_page, page_size)
+        get_page = functools.partial(self.get_whitelist_page, stream=True)
+        return Page.get_page_generator(get_page, start_page, page_size)
@@ -1,14 +1,16 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, str, super
-from future import standard_library
 from six import string_types
 
 import logging
-from logging.config import dictConfig
 from .utils import parse_boolean
 import os
 import sys
+import threading
+
+_lock = threading.Lock()
+_configured = False
 
 
 class InfoFilter(logging.Filter):
@@ -73,12 +75,20 @@ DEFAULT_LOGGING_CONFIG = {
 def configure_logging():
     """
     Initialize logging configuration to defaults.  If the environment variable DISABLE_TRUSTAR_LOGGING is set to true,
-    this will be ignored.
+    this will be ignored.  This is called when the first |TruStar| client is created (not on import), and only has an
+    effect the first time.
     """
 
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+
     if not parse_boolean(os.environ.get('DISABLE_TRUSTAR_LOGGING')):
 
         # configure
+        from logging.config import dictConfig
         dictConfig(DEFAULT_LOGGING_CONFIG)
 
         # construct error logger
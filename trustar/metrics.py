@@ -0,0 +1,385 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str
+
+# external imports
+from collections import defaultdict
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# upper bounds of the size histogram buckets, in bytes
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+DEFAULT_LOG_INTERVAL = 60
+
+
+class Histogram(object):
+    """
+    A histogram with fixed buckets, in the style of Prometheus.  Not thread-safe on its own; |Metrics| guards it with
+    a lock.
+    """
+
+    def __init__(self, buckets):
+        """
+        :param buckets: The upper bounds of the buckets, in increasing order.  A final bucket for values larger than
+            the last bound is added implicitly.
+        """
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating linearly within the bucket it falls in.
+
+        :param float q: The quantile, between 0 and 1.
+        :return: The estimate, or ``None`` if nothing has been observed.
+        """
+
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    # no upper bound for the overflow bucket
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """
+        :return: A dictionary with the ``count``, ``sum``, cumulative ``buckets`` (keyed by upper bound), and
+            estimated ``p50``, ``p95`` and ``p99``.
+        """
+
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': buckets,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class EndpointMetrics(object):
+    """
+    The metrics recorded for a single endpoint.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.status_codes = defaultdict(int)
+        self.errors = 0
+        self.retries = defaultdict(int)
+        self.rate_limit_waits = 0
+        self.rate_limit_wait_seconds = 0.0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'status_codes': dict(self.status_codes),
+            'errors': self.errors,
+            'retries': dict(self.retries),
+            'rate_limit_waits': self.rate_limit_waits,
+            'rate_limit_wait_seconds': self.rate_limit_wait_seconds,
+            'latency': self.latency.snapshot(),
+            'request_size': self.request_size.snapshot(),
+            'response_size': self.response_size.snapshot()
+        }
+
+
+class Metrics(object):
+    """
+    Records, per endpoint template (i.e. ``GET reports/{id}/tags``): call counts, status codes, latency, request and
+    response sizes, retries, and time spent waiting on rate limits; as well as token refreshes and arbitrary gauges.
+    Other components can register a ``stats()`` function as a source, so that their statistics are included in
+    snapshots.  All methods are thread-safe.
+
+    The metrics can be exported as a dictionary (|snapshot|), in the Prometheus text format (|to_prometheus|), or
+    periodically logged (see |MetricsLogger|).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointMetrics)
+        self._gauges = {}
+        self._sources = {}
+        self.token_refreshes = 0
+
+    @staticmethod
+    def _split(endpoint):
+        """
+        :param str endpoint: i.e. ``"GET reports/{id}"``
+        :return: The method and the endpoint template.
+        """
+
+        method, _, template = endpoint.partition(' ')
+        return method, template
+
+    def record_call(self, endpoint, status_code, latency, request_size=None):
+        """
+        Records a single HTTP request (each retry is recorded separately).
+
+        :param str endpoint: The method and endpoint template, i.e. ``"GET reports/{id}"``.
+        :param int status_code: The status code of the response, or ``None`` if no response was received.
+        :param float latency: The time until the response headers were received, in seconds.
+        :param int request_size: The size of the request body that was sent, in bytes.
+        """
+
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics.calls += 1
+            metrics.status_codes[status_code] += 1
+            if status_code is None or status_code >= 400:
+                metrics.errors += 1
+            metrics.latency.observe(latency)
+            if request_size is not None:
+                metrics.request_size.observe(request_size)
+
+    def record_response_size(self, endpoint, size):
+        """
+        :param str endpoint: The method and endpoint template.
+        :param int size: The size of the response body that was received, in bytes.
+        """
+
+        with self._lock:
+            self._endpoints[endpoint].response_size.observe(size)
+
+    def record_retry(self, endpoint, reason):
+        """
+        :param str endpoint: The method and endpoint template.
+        :param str reason: Why the request was retried, i.e. ``"rate_limited"`` or ``"token_expired"``.
+        """
+
+        with self._lock:
+            self._endpoints[endpoint].retries[reason] += 1
+
+    def record_rate_limit_wait(self, endpoint, seconds):
+        """
+        :param str endpoint: The method and endpoint template.
+        :param float seconds: The time spent waiting after a 429 response.
+        """
+
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics.rate_limit_waits += 1
+            metrics.rate_limit_wait_seconds += seconds
+
+    def record_token_refresh(self):
+        with self._lock:
+            self.token_refreshes += 1
+
+    def set_gauge(self, name, value):
+        """
+        Sets a gauge, i.e. the current concurrency limit.
+
+        :param str name: The name of the gauge.
+        :param float value: Its current value.
+        """
+
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_source(self, name, stats):
+        """
+        Includes the statistics of another component in snapshots.
+
+        :param str name: The key under which the statistics are included.
+        :param stats: A function taking no arguments and returning a dictionary.
+        """
+
+        with self._lock:
+            self._sources[name] = stats
+
+    def get_latency_quantile(self, endpoint, q, min_count=1):
+        """
+        :param int min_count: The number of calls needed for an estimate.
+        :return: The estimated latency quantile of an endpoint in seconds, or ``None`` if it has been called fewer
+            than ``min_count`` times.
+        """
+
+        with self._lock:
+            endpoint_metrics = self._endpoints.get(endpoint)
+            if endpoint_metrics is None or endpoint_metrics.latency.count < max(min_count, 1):
+                return None
+            return endpoint_metrics.latency.quantile(q)
+
+    def snapshot(self):
+        """
+        :return: A dictionary of all metrics.
+        """
+
+        with self._lock:
+            result = {
+                'endpoints': dict((endpoint, metrics.snapshot()) for endpoint, metrics in self._endpoints.items()),
+                'token_refreshes': self.token_refreshes,
+                'gauges': dict(self._gauges)
+            }
+            sources = dict(self._sources)
+
+        for name, stats in sources.items():
+            result[name] = stats()
+
+        return result
+
+    def reset(self):
+        """
+        Clears all per-endpoint metrics and counters.  Gauges and sources are kept.
+        """
+
+        with self._lock:
+            self._endpoints.clear()
+            self.token_refreshes = 0
+
+    def to_prometheus(self, prefix='trustar'):
+        """
+        Exports the metrics in the Prometheus text exposition format.
+
+        :param str prefix: The prefix of each metric name.
+        :return: The text.
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def labels(**kwargs):
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                     for k, v in sorted(kwargs.items()))
+
+        def header(name, kind, description):
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        endpoints = sorted(snapshot['endpoints'].items())
+
+        header('requests_total', 'counter', 'HTTP requests made, by status code.')
+        for endpoint, metrics in endpoints:
+            method, template = self._split(endpoint)
+            for status, count in sorted(metrics['status_codes'].items(), key=lambda x: str(x[0])):
+                lines.append('%s_requests_total%s %d' % (prefix, labels(method=method, endpoint=template,
+                                                                         status=status), count))
+
+        header('retries_total', 'counter', 'Requests retried, by reason.')
+        for endpoint, metrics in endpoints:
+            method, template = self._split(endpoint)
+            for reason, count in sorted(metrics['retries'].items()):
+                lines.append('%s_retries_total%s %d' % (prefix, labels(method=method, endpoint=template,
+                                                                        reason=reason), count))
+
+        header('rate_limit_wait_seconds_total', 'counter', 'Time spent waiting after 429 responses.')
+        for endpoint, metrics in endpoints:
+            method, template = self._split(endpoint)
+            lines.append('%s_rate_limit_wait_seconds_total%s %s' % (prefix, labels(method=method, endpoint=template),
+                                                                    metrics['rate_limit_wait_seconds']))
+
+        for name, key, description in [('request_duration_seconds', 'latency', 'Time until response headers.'),
+                                       ('request_size_bytes', 'request_size', 'Size of request bodies sent.'),
+                                       ('response_size_bytes', 'response_size', 'Size of response bodies received.')]:
+            header(name, 'histogram', description)
+            for endpoint, metrics in endpoints:
+                method, template = self._split(endpoint)
+                histogram = metrics[key]
+                for bound, count in sorted(histogram['buckets'].items()):
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_%s_bucket%s %d' % (prefix, name, labels(method=method, endpoint=template, le=le),
+                                                        count))
+                lines.append('%s_%s_sum%s %s' % (prefix, name, labels(method=method, endpoint=template),
+                                                 histogram['sum']))
+                lines.append('%s_%s_count%s %d' % (prefix, name, labels(method=method, endpoint=template),
+                                                   histogram['count']))
+
+        header('token_refreshes_total', 'counter', 'OAuth2 tokens obtained.')
+        lines.append('%s_token_refreshes_total %d' % (prefix, snapshot['token_refreshes']))
+
+        for name, value in sorted(snapshot['gauges'].items()):
+            header(name, 'gauge', name.replace('_', ' ').capitalize() + '.')
+            lines.append('%s_%s %s' % (prefix, name, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def format_summary(self):
+        """
+        :return: A human-readable summary of the metrics, with one line per endpoint.
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+        for endpoint, metrics in sorted(snapshot['endpoints'].items()):
+            latency = metrics['latency']
+            lines.append("%s: %d calls, %d errors, %d retries, p50 %.3fs, p95 %.3fs, %.1fs rate limited, "
+                         "%d bytes received"
+                         % (endpoint, metrics['calls'], metrics['errors'], sum(metrics['retries'].values()),
+                            latency['p50'] or 0, latency['p95'] or 0, metrics['rate_limit_wait_seconds'],
+                            metrics['response_size']['sum']))
+        if not lines:
+            lines.append("no requests")
+        return '\n'.join(lines)
+
+
+class MetricsLogger(object):
+    """
+    Periodically logs a summary of a |Metrics| object from a daemon thread.
+    """
+
+    def __init__(self, metrics, interval=DEFAULT_LOG_INTERVAL, log=logger, level=logging.INFO):
+        """
+        :param metrics: The |Metrics| object.
+        :param float interval: The number of seconds between summaries.
+        :param log: The logger to log to.
+        :param int level: The level to log at.
+        """
+
+        self.metrics = metrics
+        self.interval = interval
+        self.log = log
+        self.level = level
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trustar-metrics-logger')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def log_summary(self):
+        self.log.log(self.level, "TruSTAR API metrics:\n%s", self.metrics.format_summary())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.log_summary()
+            except Exception:
+                self.log.exception("Failed to log metrics.")
@@ -1,11 +1,10 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object
-from future import standard_library
 from six import string_types
 
-# external imports
-import json
+# package imports
+from ..codec import get_codec
 
 
 class ModelBase(object):
@@ -39,7 +38,7 @@ class ModelBase(object):
         :return: A json representation of the object.
         """
 
-        return json.dumps(self.to_dict(remove_nones=True), indent=2)
+        return get_codec().dumps_pretty(self.to_dict(remove_nones=True))
 
     def __repr__(self):
         """
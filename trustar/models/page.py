@@ -1,11 +1,12 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, super
-from future import standard_library
 
 # package imports
 from .base import ModelBase
 from ..utils import get_time_based_page_generator
+from ..codec import get_codec
+from ..streaming import stream_json_items
 
 # external imports
 import math
@@ -88,6 +89,49 @@ class Page(ModelBase):
 
         return result
 
+    @staticmethod
+    def from_response(response, content_type=None, stream=False):
+        """
+        Create a |Page| object from the body of a response from a paginated endpoint.  This method is intended for
+        internal use.
+
+        :param response: The response object.
+        :param content_type: The class that the contents should be deserialized into.
+        :param boolean stream: Whether to decode the items incrementally as they are iterated over (see
+            |from_stream|) rather than parsing the entire body up front.
+        :return: The resulting |Page| object.
+        """
+
+        if stream:
+            return Page.from_stream(response, content_type=content_type)
+        return Page.from_dict(get_codec().loads(response.content), content_type=content_type)
+
+    @staticmethod
+    def from_stream(response, content_type=None):
+        """
+        Create a |Page| object whose items are decoded incrementally from the body of a response as they are iterated
+        over, rather than parsing the entire body up front.  This method is intended for internal use; the response
+        should have been requested with ``stream=True``.
+
+        :param response: The response object.
+        :param content_type: The class that the contents should be deserialized into.
+        :return: The resulting |StreamedPage| object.
+        """
+
+        if content_type is not None and not issubclass(content_type, ModelBase):
+            raise ValueError("'content_type' must be a subclass of ModelBase.")
+
+        return StreamedPage(decoder=stream_json_items(response), content_type=content_type, response=response)
+
+    def get_last_item(self):
+        """
+        :return: The last item of the page, or ``None`` if the page is empty.
+        """
+
+        if len(self.items) > 0:
+            return self.items[-1]
+        return None
+
     def to_dict(self, remove_nones=False):
         """
         Creates a dictionary representation of the page.
@@ -161,11 +205,112 @@ class Page(ModelBase):
         # yield each item in the page one by one;
         # once it is out, generate the next page
         for page in page_generator:
-            for item in page.items:
-                yield item
+            try:
+                for item in page:
+                    yield item
+            except BaseException:
+                # i.e. the caller stopped iterating early; release the connection of a page that wasn't read to the end
+                page.close()
+                raise
+
+    def close(self):
+        """
+        Releases the resources held by the page, if any.  This method is intended for internal use.
+        """
+
+        pass
 
     def __iter__(self):
         return self.items.__iter__()
 
     def __getitem__(self, item):
         return self.items[item]
+
+
+class StreamedPage(Page):
+    """
+    A |Page| whose items are decoded from the response body one at a time, as they are iterated over.  Iterating over
+    the page directly (as the generator methods do) never holds more than one item in memory.  Accessing ``items``,
+    ``len()`` or indexing first drains the rest of the stream into a list, and so behaves exactly like a regular
+    |Page|.  The page metadata (``page_number``, ``has_next``, etc.) may appear after the items in the response body,
+    so reading it before iteration has finished will also drain the stream.
+    """
+
+    def __init__(self, decoder, content_type=None, response=None):
+        self._decoder = decoder
+        self._response = response
+        self._content_type = content_type
+        self._stream = iter(decoder)
+        self._buffered = None
+        self._consumed = False
+        self._last_item = None
+
+    def _next_items(self):
+        """
+        Yields each remaining item from the stream, deserialized into ``content_type``.
+        """
+
+        for item in self._stream:
+            if self._content_type is not None:
+                item = self._content_type.from_dict(item)
+            self._last_item = item
+            yield item
+
+    def _drain(self):
+        """
+        Reads the remainder of the stream, buffering any unread items.
+        """
+
+        if self._buffered is None and not self._consumed:
+            self._buffered = list(self._next_items())
+
+    def close(self):
+        """
+        Stops reading the response body, if it hasn't been read to the end, and closes the response.
+        """
+
+        if not self._decoder.finished:
+            self._decoder.close()
+        if self._response is not None:
+            self._response.close()
+
+    def _field(self, key):
+        if not self._decoder.finished:
+            self._drain()
+        return self._decoder.fields.get(key)
+
+    @property
+    def items(self):
+        if self._consumed:
+            raise ValueError("The items of this streamed page have already been iterated over.")
+        self._drain()
+        return self._buffered
+
+    @property
+    def page_number(self):
+        return self._field('pageNumber')
+
+    @property
+    def page_size(self):
+        return self._field('pageSize')
+
+    @property
+    def total_elements(self):
+        return self._field('totalElements')
+
+    @property
+    def has_next(self):
+        return self._field('hasNext')
+
+    def get_last_item(self):
+        if self._consumed:
+            return self._last_item
+        return super().get_last_item()
+
+    def __iter__(self):
+        if self._buffered is not None:
+            return iter(self._buffered)
+        if self._consumed:
+            raise ValueError("The items of this streamed page have already been iterated over.")
+        self._consumed = True
+        return self._next_items()
@@ -0,0 +1,288 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, range
+from six import string_types
+
+# external imports
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# package imports
+from .api_client import ApiClient, create_session
+from .rate_limit import TokenBucket
+from .trustar import TruStar
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 10
+
+
+class _Tenant(object):
+    """
+    A set of credentials in a |TruStarPool|: its client, quota and queue of pending calls.  Also serves as the rate
+    limiter of the tenant's |ApiClient|, so that every request it sends takes a token from the tenant's bucket.
+    """
+
+    def __init__(self, name, client, bucket):
+        self.name = name
+        self.client = client
+        self.bucket = bucket
+        self.queue = deque()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._local = threading.local()
+
+    def acquire(self, timeout=None):
+        # the scheduler already took a token when it dispatched the call this thread is running
+        if getattr(self._local, 'prepaid', False):
+            self._local.prepaid = False
+            return True
+        if self.bucket is not None:
+            return self.bucket.acquire(timeout=timeout)
+        return True
+
+    def try_acquire(self):
+        return self.bucket is None or self.bucket.try_acquire()
+
+    def set_prepaid(self, prepaid):
+        self._local.prepaid = prepaid
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rate': None if self.bucket is None else self.bucket.rate,
+            'tokens': None if self.bucket is None else self.bucket.tokens
+        }
+
+
+class TruStarPool(object):
+    """
+    Makes API calls on behalf of many sets of credentials ("tenants") over one shared connection pool.  Each tenant
+    has its own token and its own quota, enforced by a |TokenBucket| matching the tenant's |RequestQuota| (or a
+    given rate).  Calls are submitted per tenant and run by a fixed number of worker threads, which take turns between
+    the tenants whose quota allows another request; so a tenant with a large backlog can't starve the others, and a
+    tenant that is out of quota doesn't hold up a worker.  With enough workers, the total throughput is the sum of the
+    tenants' quotas.
+
+    Example:
+
+    >>> with TruStarPool(max_workers=20) as pool:
+    >>>     pool.add_tenant('acme', config=acme_config)
+    >>>     pool.add_tenant('initech', config=initech_config)
+    >>>     future = pool.submit('acme', 'get_report_details', report_id)
+    >>>     report = future.result()
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_connections=None):
+        """
+        :param int max_workers: The number of calls that can run at once, across all tenants.
+        :param int max_connections: The size of the shared connection pool.  Defaults to ``max_workers``.
+        """
+
+        self.max_workers = max_workers
+        self.session = create_session(max_connections or max_workers)
+
+        self._tenants = OrderedDict()
+        self._next = 0
+        self._condition = threading.Condition()
+        self._shutdown = False
+
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._work, name="TruStarPool-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def add_tenant(self, name, config_file=None, config_role=None, config=None, rate=None, capacity=None):
+        """
+        Adds a set of credentials to the pool.  Unless ``rate`` is given, the tenant's quota is fetched with
+        |get_request_quota|.
+
+        :param name: The name to submit calls for this tenant with.
+        :param str config_file: See |TruStar|.
+        :param str config_role: See |TruStar|.
+        :param dict config: See |TruStar|.
+        :param float rate: The maximum number of requests per second for this tenant.
+        :param float capacity: The maximum burst of requests, if ``rate`` is given.
+        :return: The tenant's |TruStar| client.  Calls made with it directly share the tenant's quota, but are not
+            scheduled by the pool.
+        """
+
+        config = TruStar.load_config(config_file=config_file, config_role=config_role, config=config)
+        api_client = ApiClient(config=config, session=self.session)
+        client = TruStar(config=config, api_client=api_client)
+
+        if rate is not None:
+            bucket = TokenBucket(rate=rate, capacity=capacity)
+        else:
+            # the kind of bucket can be set with the ``rate_limit`` config, i.e. to share it with other processes
+            if not api_client.rate_limit:
+                api_client.rate_limit = 'memory'
+            api_client._load_rate_limiter()
+            bucket = api_client.rate_limiter
+
+        tenant = _Tenant(name, client, bucket)
+        api_client.rate_limiter = tenant
+
+        with self._condition:
+            if name in self._tenants:
+                raise ValueError("Tenant %s already exists" % name)
+            self._tenants[name] = tenant
+
+        return client
+
+    def remove_tenant(self, name):
+        """
+        Removes a tenant, cancelling its queued calls.  Calls that are already running are allowed to finish.
+        """
+
+        with self._condition:
+            tenant = self._tenants.pop(name)
+            queued = list(tenant.queue)
+            tenant.queue.clear()
+        for future, _, _, _ in queued:
+            future.cancel()
+
+    def get_client(self, name):
+        """
+        :return: The |TruStar| client of a tenant.
+        """
+
+        with self._condition:
+            return self._tenants[name].client
+
+    @property
+    def tenants(self):
+        """
+        The names of the tenants, in the order they were added.
+        """
+
+        with self._condition:
+            return list(self._tenants)
+
+    def submit(self, tenant, func, *args, **kwargs):
+        """
+        Queues a call for a tenant.
+
+        :param tenant: The name of the tenant.
+        :param func: Either the name of a |TruStar| method, i.e. ``"get_report_details"``, or a function whose first
+            argument is the tenant's |TruStar| client.  Each request the call makes takes a token from the tenant's
+            quota, so calls that page through results are throttled as well.  Generators are consumed lazily, so
+            wrap methods returning them, i.e. ``lambda ts: list(ts.get_reports())``.
+        :param args: Positional arguments for the call.
+        :param kwargs: Keyword arguments for the call.
+        :return: A ``concurrent.futures.Future`` for the result of the call.
+        """
+
+        if isinstance(func, string_types):
+            func = getattr(TruStar, func)
+
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit calls after shutdown")
+            entry = self._tenants[tenant]
+            entry.queue.append((future, func, args, kwargs))
+            entry.submitted += 1
+            self._condition.notify()
+        return future
+
+    def get_stats(self):
+        """
+        :return: A dictionary mapping each tenant to its number of queued, submitted, completed and failed calls, its
+            rate, and its available tokens.
+        """
+
+        with self._condition:
+            return dict((name, tenant.stats()) for name, tenant in self._tenants.items())
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stops the workers once all queued calls have run, and closes the shared connection pool.
+
+        :param boolean wait: Whether to wait for the workers to stop.
+        :param boolean cancel_pending: Whether to cancel the queued calls rather than run them.
+        """
+
+        cancelled = []
+        with self._condition:
+            self._shutdown = True
+            if cancel_pending:
+                for tenant in self._tenants.values():
+                    cancelled.extend(tenant.queue)
+                    tenant.queue.clear()
+            self._condition.notify_all()
+
+        for future, _, _, _ in cancelled:
+            future.cancel()
+
+        if wait:
+            for worker in self._workers:
+                worker.join()
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _next_call(self):
+        """
+        Picks the next call to run: the first queued call of the next tenant, in round-robin order, whose quota allows
+        a request now.  Must be called while holding the condition.
+
+        :return: A tuple of the tenant, the call, and (if there is no call to run now) the number of seconds until a
+            tenant's quota allows a request, which is ``None`` if no calls are queued.
+        """
+
+        names = list(self._tenants)
+        wait_time = None
+        for i in range(len(names)):
+            index = (self._next + i) % len(names)
+            tenant = self._tenants[names[index]]
+            if not tenant.queue:
+                continue
+            if tenant.bucket is None or tenant.bucket.try_acquire():
+                self._next = index + 1
+                return tenant, tenant.queue.popleft(), 0
+            tenant_wait_time = tenant.bucket.get_wait_time()
+            wait_time = tenant_wait_time if wait_time is None else min(wait_time, tenant_wait_time)
+        return None, None, wait_time
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    tenant, call, wait_time = self._next_call()
+                    if call is not None:
+                        break
+                    if self._shutdown and wait_time is None:
+                        return
+                    self._condition.wait(wait_time)
+
+            future, func, args, kwargs = call
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            tenant.set_prepaid(tenant.bucket is not None)
+            try:
+                result = func(tenant.client, *args, **kwargs)
+            except BaseException as e:
+                with self._condition:
+                    tenant.failed += 1
+                future.set_exception(e)
+            else:
+                with self._condition:
+                    tenant.completed += 1
+                future.set_result(result)
+            finally:
+                # the call might not have sent a request, i.e. if it was served from the cache
+                tenant.set_prepaid(False)
@@ -0,0 +1,573 @@
+# python 2 backwards compatibility
+from __future__ import division, print_function
+from builtins import object
+
+# external imports
+import errno
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+logger = logging.getLogger(__name__)
+
+# directory holding the state of file-based buckets, one file per API key
+DEFAULT_RATE_LIMIT_DIR = os.path.join(os.path.expanduser('~'), '.trustar', 'rate_limits')
+
+# priority classes: interactive requests go first, and can use quota that bulk requests leave in reserve
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = [INTERACTIVE, BULK]
+
+# the default fraction of a quota that bulk requests leave for interactive ones
+DEFAULT_RESERVED_QUOTA = 0.2
+
+# the state of a file-based bucket: the number of tokens, and the time they were counted at
+STATE_FORMAT = '<dd'
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+
+
+class TokenBucket(object):
+    """
+    A token bucket: holds up to ``capacity`` tokens, refilled continuously at ``rate`` tokens per second.  Each
+    request takes a token, so that requests are spread out at the rate while allowing bursts of up to ``capacity``.
+    All methods are thread-safe.
+
+    :ivar rate: Tokens added per second.
+    :ivar capacity: The maximum number of tokens.
+    """
+
+    def __init__(self, rate, capacity=None, tokens=None, clock=time.time):
+        """
+        :param float rate: Tokens added per second.
+        :param float capacity: The maximum number of tokens.  Defaults to one second's worth (but at least 1).
+        :param float tokens: The number of tokens initially available.  Defaults to ``capacity``.
+        :param clock: A function returning the current time in seconds.
+        """
+
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity if tokens is None else min(float(tokens), self.capacity)
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_quota_params(cls, quota):
+        """
+        :param quota: A |RequestQuota|.
+        :return: A dictionary of the ``rate``, ``capacity`` and initial ``tokens`` of a bucket matching the quota:
+            ``max_requests`` per ``time_window``, starting with the requests that are left in the current window.
+        """
+
+        window = quota.time_window / 1000
+        tokens = None
+        if quota.used_requests is not None:
+            tokens = max(quota.max_requests - quota.used_requests, 0)
+        return {'rate': quota.max_requests / window, 'capacity': quota.max_requests, 'tokens': tokens}
+
+    @classmethod
+    def from_quota(cls, quota):
+        """
+        Creates a bucket matching a |RequestQuota|; see |get_quota_params|.
+
+        :param quota: The |RequestQuota|.
+        :return: The |TokenBucket|.
+        """
+
+        return cls(**cls.get_quota_params(quota))
+
+    @contextmanager
+    def _state(self):
+        """
+        Holds the lock on the bucket's state while it is read and updated.  Subclasses that keep the state elsewhere
+        load it before yielding, and store it after.
+        """
+
+        with self._lock:
+            yield
+
+    def _refill(self):
+        now = self._clock()
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens, take=True, reserve=0):
+        """
+        :param boolean take: Whether to take the tokens if they are available, or only check.
+        :param float reserve: The number of tokens that must be left after taking them.
+        :return: The number of seconds until ``tokens`` tokens will be available; 0 if they are available now.
+        """
+
+        with self._state():
+            self._refill()
+            if self._tokens >= tokens + reserve:
+                if take:
+                    self._tokens -= tokens
+                return 0
+            return (tokens + reserve - self._tokens) / self.rate
+
+    def get_wait_time(self, tokens=1):
+        """
+        :return: The number of seconds until ``tokens`` tokens will be available; 0 if they are available now.
+        """
+
+        return self._take(tokens, take=False)
+
+    def try_acquire(self, tokens=1):
+        """
+        Takes tokens if they are available, without waiting.
+
+        :return: Whether the tokens were taken.
+        """
+
+        return self._take(tokens) == 0
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Takes tokens, waiting until they are available.
+
+        :param float timeout: The maximum number of seconds to wait; waits indefinitely if ``None``.
+        :return: Whether the tokens were taken before the timeout.
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait_time = self._take(tokens)
+            if wait_time == 0:
+                return True
+            if deadline is not None and deadline - time.time() < wait_time:
+                return False
+            time.sleep(wait_time)
+
+    @property
+    def tokens(self):
+        """
+        The number of tokens currently available.
+        """
+
+        with self._state():
+            self._refill()
+            return self._tokens
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    A |TokenBucket| whose state is kept in a file, locked while it is updated, so that every process on the host using
+    the same file shares the bucket.  This keeps processes sharing an API key within its quota together, rather than
+    each using all of it.  Requires ``fcntl``, so it is not available on Windows.
+    """
+
+    def __init__(self, path, rate, capacity=None, tokens=None):
+        """
+        :param str path: The path of the state file; created if it doesn't exist.
+        :param float rate: See |TokenBucket|.
+        :param float capacity: See |TokenBucket|.
+        :param float tokens: The number of tokens initially available, if the file is new.
+        """
+
+        if fcntl is None:
+            raise RuntimeError("File-based rate limiting requires fcntl, which is not available on this platform")
+
+        super(FileTokenBucket, self).__init__(rate=rate, capacity=capacity, tokens=tokens)
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @contextmanager
+    def _state(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                data = os.read(self._fd, STATE_SIZE)
+                # a new file starts with the initial tokens
+                if len(data) == STATE_SIZE:
+                    self._tokens, self._updated = struct.unpack(STATE_FORMAT, data)
+                yield
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, struct.pack(STATE_FORMAT, self._tokens, self._updated))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def parse_address(address):
+    """
+    :param address: Either ``"host:port"`` for TCP, or the path of a Unix socket (optionally prefixed by ``unix:``).
+    :return: A tuple of the socket family and address.
+    """
+
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.coordinator.handle_command(line.decode('utf-8').split())
+            except Exception as e:
+                response = "ERROR %s" % e
+            self.wfile.write((response + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+class RateLimitCoordinator(object):
+    """
+    Serves token buckets over a socket, for processes that can't share a file: i.e. a small cluster of hosts, or
+    containers on one host.  Each bucket is named (by convention, after the API key it limits) and is created by the
+    first client to use it, with the rate and capacity that client asks for.  Clients are |RemoteTokenBucket|
+    objects.
+
+    Run one with ``python -m trustar.rate_limit <address>``, or start one within a process:
+
+    >>> coordinator = RateLimitCoordinator('127.0.0.1:7777').start()
+
+    The protocol is line-based: ``TAKE <name> <rate> <capacity> <tokens> [<reserve>]`` (or ``PEEK``, which only
+    checks) is answered with the number of seconds until the tokens are available (leaving ``reserve`` tokens), 0 if
+    they were taken, followed by the number of tokens available.
+    """
+
+    def __init__(self, address):
+        """
+        :param address: The address to listen on; see |parse_address|.  With port 0, any free port is used.
+        """
+
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX:
+            if _UnixServer is None:
+                raise RuntimeError("Unix sockets are not available on this platform")
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = _UnixServer(address, _CoordinatorHandler)
+        else:
+            self._server = _TCPServer(address, _CoordinatorHandler)
+        self._server.coordinator = self
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        The address clients should connect to.
+        """
+
+        address = self._server.server_address
+        if isinstance(address, tuple):
+            return "%s:%d" % address[:2]
+        return address
+
+    def get_bucket(self, name, rate, capacity):
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None or bucket.rate != rate or bucket.capacity != capacity:
+                # the quota changed; keep the tokens that are left
+                tokens = None if bucket is None else bucket.tokens
+                bucket = TokenBucket(rate=rate, capacity=capacity, tokens=tokens)
+                self._buckets[name] = bucket
+            return bucket
+
+    def handle_command(self, args):
+        command, name, rate, capacity, tokens = args[:5]
+        reserve = float(args[5]) if len(args) > 5 else 0
+        if command not in ['TAKE', 'PEEK']:
+            raise ValueError("Unknown command %s" % command)
+        bucket = self.get_bucket(name, float(rate), float(capacity))
+        wait_time = bucket._take(float(tokens), take=command == 'TAKE', reserve=reserve)
+        return "%r %r" % (wait_time, bucket.tokens)
+
+    def start(self):
+        """
+        Serves clients on a background thread.
+
+        :return: This coordinator.
+        """
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="RateLimitCoordinator")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if isinstance(self._server.server_address, str) and os.path.exists(self._server.server_address):
+            os.remove(self._server.server_address)
+
+
+class RemoteTokenBucket(TokenBucket):
+    """
+    A |TokenBucket| kept by a |RateLimitCoordinator|, shared by every client that uses the same coordinator and name.
+    Waiting happens in the client; the coordinator only counts tokens.
+    """
+
+    def __init__(self, address, name, rate, capacity=None, timeout=5):
+        """
+        :param address: The coordinator's address; see |parse_address|.
+        :param str name: The name of the bucket, i.e. the API key it limits.
+        :param float rate: See |TokenBucket|.
+        :param float capacity: See |TokenBucket|.
+        :param float timeout: Seconds to wait for the coordinator to respond.
+        """
+
+        super(RemoteTokenBucket, self).__init__(rate=rate, capacity=capacity)
+        self.family, self.address = parse_address(address)
+        self.name = name
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+
+    def _connect(self):
+        self._socket = socket.socket(self.family, socket.SOCK_STREAM)
+        self._socket.settimeout(self.timeout)
+        self._socket.connect(self.address)
+        self._file = self._socket.makefile('rwb')
+
+    def _disconnect(self):
+        for closeable in [self._file, self._socket]:
+            if closeable is not None:
+                try:
+                    closeable.close()
+                except (IOError, OSError):
+                    pass
+        self._socket = None
+        self._file = None
+
+    def _call(self, command, tokens, reserve=0):
+        """
+        Sends a command to the coordinator, reconnecting once if the connection was lost.
+
+        :return: A tuple of the wait time and the number of tokens available.
+        """
+
+        line = "%s %s %r %r %r %r\n" % (command, self.name, self.rate, self.capacity, float(tokens), float(reserve))
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    self._file.write(line.encode('utf-8'))
+                    self._file.flush()
+                    response = self._file.readline().decode('utf-8').split()
+                    break
+                except (IOError, OSError):
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+        if not response or response[0] == 'ERROR':
+            raise IOError("Rate limit coordinator error: %s" % ' '.join(response))
+        return float(response[0]), float(response[1])
+
+    def _take(self, tokens, take=True, reserve=0):
+        return self._call('TAKE' if take else 'PEEK', tokens, reserve)[0]
+
+    @property
+    def tokens(self):
+        return self._call('PEEK', 0)[1]
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class PriorityScheduler(object):
+    """
+    Schedules requests from two priority classes through a |TokenBucket| (or a subclass, so that the scheduling also
+    works for buckets shared with other processes).  Interactive requests are let through first: while any are
+    waiting, bulk requests wait too.  And bulk requests can't use the last ``reserved`` fraction of the bucket, so that
+    a crawl running at full speed still leaves room for interactive requests to go through without waiting.
+
+    It takes the place of the bucket as an |ApiClient|'s rate limiter; the priority of each request is read from the
+    client (see |TruStar.priority|).
+    """
+
+    def __init__(self, bucket, reserved=DEFAULT_RESERVED_QUOTA, get_priority=None):
+        """
+        :param bucket: The |TokenBucket|.
+        :param float reserved: The fraction of the bucket's capacity that only interactive requests can use.
+        :param get_priority: A function returning the priority of the current request; by default, all requests are
+            interactive.
+        """
+
+        self.bucket = bucket
+        self.reserved = reserved
+        self.get_priority = get_priority or (lambda: INTERACTIVE)
+
+        self._condition = threading.Condition()
+        self._waiting = dict((priority, 0) for priority in PRIORITIES)
+        self.granted = dict((priority, 0) for priority in PRIORITIES)
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    @property
+    def capacity(self):
+        return self.bucket.capacity
+
+    @property
+    def tokens(self):
+        return self.bucket.tokens
+
+    def _get_reserve(self, priority, tokens=1):
+        if priority != BULK:
+            return 0
+        # a bucket too small to hold the reserve on top of the request must still let bulk requests through
+        return max(min(self.bucket.capacity * self.reserved, self.bucket.capacity - tokens), 0)
+
+    def get_wait_time(self, tokens=1, priority=None):
+        """
+        :return: The number of seconds until a request of the given priority (by default, the current one) could take
+            ``tokens`` tokens.
+        """
+
+        priority = priority or self.get_priority()
+        return self.bucket._take(tokens, take=False, reserve=self._get_reserve(priority, tokens))
+
+    def try_acquire(self, tokens=1, priority=None):
+        """
+        Takes tokens, if a request of the given priority (by default, the current one) could take them now.
+
+        :return: Whether the tokens were taken.
+        """
+
+        priority = priority or self.get_priority()
+        with self._condition:
+            if priority == BULK and self._waiting[INTERACTIVE]:
+                return False
+            if self.bucket._take(tokens, reserve=self._get_reserve(priority, tokens)) == 0:
+                self.granted[priority] += 1
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None, priority=None):
+        """
+        Takes tokens, waiting until a request of the given priority (by default, the current one) can take them.
+
+        :param float timeout: The maximum number of seconds to wait; waits indefinitely if ``None``.
+        :return: Whether the tokens were taken before the timeout.
+        """
+
+        priority = priority or self.get_priority()
+        reserve = self._get_reserve(priority, tokens)
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    if priority == BULK and self._waiting[INTERACTIVE]:
+                        # woken when the interactive requests are through
+                        wait_time = None
+                    else:
+                        wait_time = self.bucket._take(tokens, reserve=reserve)
+                        if wait_time == 0:
+                            self.granted[priority] += 1
+                            return True
+
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0 or (wait_time is not None and remaining < wait_time):
+                            return False
+                        wait_time = remaining if wait_time is None else wait_time
+                    self._condition.wait(wait_time)
+            finally:
+                self._waiting[priority] -= 1
+                if priority == INTERACTIVE:
+                    self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'waiting': dict(self._waiting),
+                'granted': dict(self.granted),
+                'tokens': self.bucket.tokens
+            }
+
+
+def create_rate_limiter(kind, quota, name, path=None, address=None):
+    """
+    Creates the rate limiter for an API key from its quota.
+
+    :param str kind: ``"memory"`` for a bucket in this process, ``"file"`` for a |FileTokenBucket| shared by the
+        processes on this host, or ``"coordinator"`` for a |RemoteTokenBucket|.
+    :param quota: The key's |RequestQuota|.
+    :param str name: A name for the key's bucket; used as the file name and the coordinator's bucket name.
+    :param str path: The directory of the file-based buckets; defaults to ``~/.trustar/rate_limits``.
+    :param address: The coordinator's address.
+    :return: The |TokenBucket|.
+    """
+
+    params = TokenBucket.get_quota_params(quota)
+    if kind == 'memory':
+        return TokenBucket(**params)
+    if kind == 'file':
+        return FileTokenBucket(os.path.join(path or DEFAULT_RATE_LIMIT_DIR, name), **params)
+    if kind == 'coordinator':
+        if address is None:
+            raise ValueError("A coordinator address is required")
+        return RemoteTokenBucket(address, name, rate=params['rate'], capacity=params['capacity'])
+    raise ValueError("Unknown rate limiter: %s" % kind)
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    coordinator = RateLimitCoordinator(sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:7777')
+    logger.info("Serving rate limits on %s", coordinator.address)
+    try:
+        coordinator.serve_forever()
+    except KeyboardInterrupt:
+        coordinator.stop()
@@ -0,0 +1,117 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+
+# external imports
+import hashlib
+import json
+import logging
+import threading
+
+# package imports
+from .sharding import create_api_client
+from .trustar import TruStar
+
+logger = logging.getLogger(__name__)
+
+# config keys that only affect the |TruStar| instance, not the |ApiClient| it makes requests with
+INSTANCE_KEYS = ['enclave_ids']
+
+
+class ClientRegistry(object):
+    """
+    A registry of |ApiClient| objects, keyed by credentials, endpoint and the rest of the config, so that |TruStar|
+    instances created with the same config share one token, connection pool, cache, rate limit handling and metrics
+    instead of each paying for their own.  This matters for short-lived instances, i.e. one per alert or per request
+    in a web service; the first instance warms the client, and later ones reuse it.
+
+    The registry is safe to use from multiple threads.  Most code should use the process-wide registry through
+    |get_client| rather than creating its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    @staticmethod
+    def get_key(config):
+        """
+        :param dict config: A complete configuration, as returned by |load_config|.
+        :return: The key identifying clients that can be shared by instances with this config.
+        """
+
+        shared = dict((k, v) for k, v in config.items() if k not in INSTANCE_KEYS)
+        dump = json.dumps(shared, sort_keys=True, default=str)
+        return hashlib.sha256(dump.encode('utf-8')).hexdigest()
+
+    def get_api_client(self, config):
+        """
+        Gets the |ApiClient| for a config, creating it if it doesn't exist yet.
+
+        :param dict config: A complete configuration, as returned by |load_config|.
+        :return: The shared |ApiClient|.
+        """
+
+        key = self.get_key(config)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                logger.debug("Creating shared API client for %s.", config.get('base'))
+                client = create_api_client(config)
+                self._clients[key] = client
+        return client
+
+    def get_client(self, config_file=None, config_role=None, config=None):
+        """
+        Creates a |TruStar| instance that shares its |ApiClient| with every other instance created by this registry
+        with the same config.  Takes the same parameters as |TruStar|.
+
+        Example:
+
+        >>> ts = get_client(config_role='trustar')
+        >>> ts.get_enclaves()
+
+        :return: The |TruStar| instance.
+        """
+
+        config = TruStar.load_config(config_file=config_file, config_role=config_role, config=config)
+        return TruStar(config=config, api_client=self.get_api_client(config))
+
+    def clear(self):
+        """
+        Closes and removes all clients.  Instances that still hold one can keep using it.
+        """
+
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+# the process-wide registry
+_registry = ClientRegistry()
+
+
+def get_registry():
+    """
+    :return: The process-wide |ClientRegistry|.
+    """
+
+    return _registry
+
+
+def get_client(config_file=None, config_role=None, config=None):
+    """
+    Creates a |TruStar| instance using the process-wide |ClientRegistry|, so that it shares its token, connection
+    pool and rate limit handling with other instances created with the same config.  Takes the same parameters as
+    |TruStar|.
+
+    :return: The |TruStar| instance.
+    """
+
+    return _registry.get_client(config_file=config_file, config_role=config_role, config=config)
@@ -1,22 +1,19 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, str
-from future import standard_library
 from six import string_types
 
 # external imports
-import json
+from collections import OrderedDict
 from datetime import datetime
 import functools
 import logging
 
 # package imports
+from .codec import loads
 from .models import Page, Report, DistributionType, IdType
 from .utils import get_time_based_page_generator
 
-# python 2 backwards compatibility
-standard_library.install_aliases()
-
 logger = logging.getLogger(__name__)
 
 
@@ -52,10 +49,24 @@ class ReportClient(object):
 
         params = {'idType': id_type}
         resp = self._client.get("reports/%s" % report_id, params=params)
-        return Report.from_dict(resp.json())
+        return Report.from_dict(loads(resp.content))
+
+    def get_reports_details(self, report_ids, id_type=None, max_workers=None, deadline=None):
+        """
+        Retrieves many reports by their IDs, concurrently.  See |get_report_details| and |map_concurrently|.
+
+        :param list(str) report_ids: The IDs of the reports.
+        :param str id_type: Indicates whether the IDs are internal or external.
+        :param int max_workers: The number of threads.
+        :param deadline: The number of seconds to retrieve all the reports in, or a |CancellationToken|.
+        :return: A list of |Report| objects, in the order of the IDs.
+        """
+
+        return self.map_concurrently(functools.partial(self.get_report_details, id_type=id_type), report_ids,
+                                     max_workers=max_workers, deadline=deadline)
 
     def get_reports_page(self, is_enclave=None, enclave_ids=None, tag=None, excluded_tags=None,
-                         from_time=None, to_time=None):
+                         from_time=None, to_time=None, stream=False):
         """
         Retrieves a page of reports, filtering by time window, distribution type, enclave association, and tag.
         The results are sorted by updated time.
@@ -75,6 +86,8 @@ class ReportClient(object):
         :param list(str) excluded_tags: Reports containing ANY of these tags will be excluded from the results.
         :param int from_time: start of time window in milliseconds since epoch (optional)
         :param int to_time: end of time window in milliseconds since epoch (optional)
+        :param boolean stream: whether to decode the reports incrementally from the response as the page is iterated
+            over, rather than parsing the entire response up front (see |Page.from_stream|)
 
         :return: A |Page| of |Report| objects.
 
@@ -99,8 +112,8 @@ class ReportClient(object):
             'tags': tag,
             'excludedTags': excluded_tags
         }
-        resp = self._client.get("reports", params=params)
-        result = Page.from_dict(resp.json(), content_type=Report)
+        resp = self._client.get("reports", params=params, stream=stream)
+        result = Page.from_response(resp, content_type=Report, stream=stream)
 
         # create a Page object from the dict
         return result
@@ -148,8 +161,7 @@ class ReportClient(object):
         if report.time_began is None:
             report.time_began = datetime.now()
 
-        data = json.dumps(report.to_dict())
-        resp = self._client.post("reports", data=data, timeout=60)
+        resp = self._client.post("reports", json=report.to_dict())
 
         # get report id from response body
         report_id = resp.content
@@ -161,6 +173,19 @@ class ReportClient(object):
 
         return report
 
+    def submit_reports(self, reports, max_workers=None, deadline=None):
+        """
+        Submits many reports, concurrently.  See |submit_report| and |map_concurrently|.
+
+        :param list(Report) reports: The |Report| objects to submit.
+        :param int max_workers: The number of threads.
+        :param deadline: The number of seconds to submit all the reports in, or a |CancellationToken|.  Reports that
+            weren't submitted by then are skipped.
+        :return: The submitted |Report| objects, in the same order, with their ``id`` fields set.
+        """
+
+        return self.map_concurrently(self.submit_report, reports, max_workers=max_workers, deadline=deadline)
+
     def update_report(self, report):
         """
         Updates the report identified by the ``report.id`` field; if this field does not exist, then
@@ -199,8 +224,10 @@ class ReportClient(object):
 
         params = {'idType': id_type}
 
-        data = json.dumps(report.to_dict())
-        self._client.put("reports/%s" % report_id, data=data, params=params)
+        self._client.put("reports/%s" % report_id, json=report.to_dict(), params=params)
+
+        # the report might be cached under either of its IDs
+        self._client.invalidate_cache(template="reports/{id}")
 
         return report
 
@@ -220,6 +247,9 @@ class ReportClient(object):
         params = {'idType': id_type}
         self._client.delete("reports/%s" % report_id, params=params)
 
+        # the report might be cached under either of its IDs
+        self._client.invalidate_cache(template="reports/{id}")
+
     def get_correlated_report_ids(self, indicators):
         """
         DEPRECATED!
@@ -233,14 +263,25 @@ class ReportClient(object):
         >>> report_ids = ts.get_correlated_report_ids(["wannacry", "www.evil.com"])
         >>> print(report_ids)
         ["e3bc6921-e2c8-42eb-829e-eea8da2d3f36", "4d04804f-ff82-4a0b-8586-c42aef2f6f73"]
+
+        Long lists of indicators are split across several requests (see ``max_url_length``), which are sent
+        concurrently.
         """
 
         params = {'indicators': indicators}
-        resp = self._client.get("reports/correlate", params=params)
-        return resp.json()
+
+        def get_chunk(chunk_params):
+            resp = self._client.get("reports/correlate", params=chunk_params)
+            return loads(resp.content)
+
+        chunks = self._client.split_params("reports/correlate", params, ['indicators'])
+        report_ids = self._map_chunks(get_chunk, chunks)
+
+        # a report can correlate with indicators in several chunks
+        return list(OrderedDict.fromkeys(report_ids)) if len(chunks) > 1 else report_ids
 
     def get_correlated_reports_page(self, indicators, enclave_ids=None, is_enclave=True,
-                                    page_size=None, page_number=None):
+                                    page_size=None, page_number=None, stream=False):
         """
         Retrieves a page of all TruSTAR reports that contain the searched indicators.
 
@@ -249,6 +290,7 @@ class ReportClient(object):
         :param is_enclave: Whether to search enclave reports or community reports.
         :param int page_number: the page number to get.
         :param int page_size: the size of the page to be returned.
+        :param boolean stream: whether to decode the reports incrementally as the page is iterated over.
         :return: The list of IDs of reports that correlated.
 
         Example:
@@ -270,11 +312,11 @@ class ReportClient(object):
             'pageNumber': page_number,
             'pageSize': page_size
         }
-        resp = self._client.get("reports/correlated", params=params)
+        resp = self._client.get("reports/correlated", params=params, stream=stream)
 
-        return Page.from_dict(resp.json(), content_type=Report)
+        return Page.from_response(resp, content_type=Report, stream=stream)
 
-    def search_reports_page(self, search_term, enclave_ids=None, page_size=None, page_number=None):
+    def search_reports_page(self, search_term, enclave_ids=None, page_size=None, page_number=None, stream=False):
         """
         Search for reports containing a search term.
 
@@ -283,6 +325,7 @@ class ReportClient(object):
             default reports from all of user's enclaves are returned)
         :param int page_number: the page number to get.
         :param int page_size: the size of the page to be returned.
+        :param boolean stream: whether to decode the reports incrementally as the page is iterated over.
         :return: a |Page| of |Report| objects.  *NOTE*:  The bodies of these reports will be ``None``.
         """
 
@@ -293,8 +336,8 @@ class ReportClient(object):
             'pageNumber': page_number
         }
 
-        resp = self._client.get("reports/search", params=params)
-        page = Page.from_dict(resp.json(), content_type=Report)
+        resp = self._client.get("reports/search", params=params, stream=stream)
+        page = Page.from_response(resp, content_type=Report, stream=stream)
 
         return page
 
@@ -315,15 +358,16 @@ class ReportClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.get_reports_page, is_enclave, enclave_ids, tag, excluded_tags)
+        get_page = functools.partial(self.get_reports_page, is_enclave, enclave_ids, tag, excluded_tags, stream=True)
         return get_time_based_page_generator(
             get_page=get_page,
-            get_next_to_time=lambda x: x.items[-1].updated if len(x.items) > 0 else None,
+            get_next_to_time=lambda x: x.get_last_item().updated if x.get_last_item() is not None else None,
             from_time=from_time,
             to_time=to_time
         )
 
-    def get_reports(self, is_enclave=None, enclave_ids=None, tag=None, excluded_tags=None, from_time=None, to_time=None):
+    def get_reports(self, is_enclave=None, enclave_ids=None, tag=None, excluded_tags=None, from_time=None, to_time=None,
+                    deadline=None):
         """
         Uses the |get_reports_page| method to create a generator that returns each successive report as a trustar
         report object.
@@ -339,6 +383,7 @@ class ReportClient(object):
         :param list(str) excluded_tags: a list of tags; reports containing ANY of these tags will not be returned. 
         :param int from_time: start of time window in milliseconds since epoch (optional)
         :param int to_time: end of time window in milliseconds since epoch (optional)
+        :param deadline: The number of seconds to retrieve all the reports in, or a |CancellationToken|.
         :return: A generator of Report objects.
 
         Note:  If a report contains all of the tags in the list passed as argument to the 'tag' parameter and also 
@@ -357,8 +402,9 @@ class ReportClient(object):
 
         """
 
-        return Page.get_generator(page_generator=self._get_reports_page_generator(is_enclave, enclave_ids, tag,
-                                                                                  excluded_tags, from_time, to_time))
+        reports = Page.get_generator(page_generator=self._get_reports_page_generator(is_enclave, enclave_ids, tag,
+                                                                                     excluded_tags, from_time, to_time))
+        return self._client.iterate(reports, deadline)
     
     def _get_correlated_reports_page_generator(self, indicators, enclave_ids=None, is_enclave=True,
                                                start_page=0, page_size=None):
@@ -372,22 +418,25 @@ class ReportClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.get_correlated_reports_page, indicators, enclave_ids, is_enclave)
+        get_page = functools.partial(self.get_correlated_reports_page, indicators, enclave_ids, is_enclave,
+                                     stream=True)
         return Page.get_page_generator(get_page, start_page, page_size)
 
-    def get_correlated_reports(self, indicators, enclave_ids=None, is_enclave=True):
+    def get_correlated_reports(self, indicators, enclave_ids=None, is_enclave=True, deadline=None):
         """
         Uses the |get_correlated_reports_page| method to create a generator that returns each successive report.
 
         :param indicators: A list of indicator values to retrieve correlated reports for.
         :param enclave_ids: The enclaves to search in.
         :param is_enclave: Whether to search enclave reports or community reports.
+        :param deadline: The number of seconds to retrieve all the reports in, or a |CancellationToken|.
         :return: The generator.
         """
 
-        return Page.get_generator(page_generator=self._get_correlated_reports_page_generator(indicators,
-                                                                                             enclave_ids,
-                                                                                             is_enclave))
+        reports = Page.get_generator(page_generator=self._get_correlated_reports_page_generator(indicators,
+                                                                                                enclave_ids,
+                                                                                                is_enclave))
+        return self._client.iterate(reports, deadline)
     
     def _search_reports_page_generator(self, search_term, enclave_ids=None, start_page=0, page_size=None):
         """
@@ -401,17 +450,19 @@ class ReportClient(object):
         :return: The generator.
         """
 
-        get_page = functools.partial(self.search_reports_page, search_term, enclave_ids)
+        get_page = functools.partial(self.search_reports_page, search_term, enclave_ids, stream=True)
         return Page.get_page_generator(get_page, start_page, page_size)
 
-    def search_reports(self, search_term, enclave_ids=None):
+    def search_reports(self, search_term, enclave_ids=None, deadline=None):
         """
         Uses the |search_reports_page| method to create a generator that returns each successive report.
 
         :param str search_term: The term to search for.  This string must be at least 3 characters in length.
         :param list(str) enclave_ids: list of enclave ids used to restrict reports to specific enclaves (optional - by
             default reports from all of user's enclaves are returned)
+        :param deadline: The number of seconds to retrieve all the results in, or a |CancellationToken|.
         :return: The generator of Report objects.  Note that the body attributes of these reports will be ``None``.
         """
 
-        return Page.get_generator(page_generator=self._search_reports_page_generator(search_term, enclave_ids))
+        reports = Page.get_generator(page_generator=self._search_reports_page_generator(search_term, enclave_ids))
+        return self._client.iterate(reports, deadline)
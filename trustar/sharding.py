@@ -0,0 +1,251 @@
+# python 2 backwards compatibility
+from __future__ import division, print_function
+from builtins import object
+from six import string_types
+
+# external imports
+import logging
+import threading
+import time
+from math import ceil
+
+# package imports
+from .api_client import ApiClient
+from .codec import get_codec
+from .hooks import RETRY, RequestEvent
+from .utils import get_endpoint_template
+
+logger = logging.getLogger(__name__)
+
+
+def parse_credentials(credentials):
+    """
+    Normalizes the ``credentials`` config value: a list of API key and secret pairs, each either a dictionary (with
+    ``user_api_key`` and ``user_api_secret``, or ``api_key`` and ``api_secret``) or a ``"key:secret"`` string.  A
+    single string may also hold several comma-separated pairs, as in a ``.conf`` file.
+
+    :return: A list of dictionaries with ``api_key`` and ``api_secret``.
+    """
+
+    if credentials is None:
+        return []
+
+    if isinstance(credentials, string_types):
+        credentials = [pair for pair in credentials.split(',') if pair.strip()]
+
+    result = []
+    for credential in credentials:
+        if isinstance(credential, string_types):
+            if ':' not in credential:
+                raise ValueError("Credentials must be in the form 'key:secret'")
+            api_key, api_secret = credential.strip().split(':', 1)
+        else:
+            api_key = credential.get('user_api_key', credential.get('api_key'))
+            api_secret = credential.get('user_api_secret', credential.get('api_secret'))
+        if not api_key or not api_secret:
+            raise ValueError("Each set of credentials needs an API key and secret")
+        result.append({'api_key': api_key, 'api_secret': api_secret})
+    return result
+
+
+def create_api_client(config, session=None):
+    """
+    Creates the client for a config: a |ShardedApiClient| if it has more than one set of ``credentials``, otherwise an
+    |ApiClient|.
+
+    :param dict config: A complete configuration, as returned by |load_config|.
+    :param session: See |ApiClient|.
+    """
+
+    if len(config.get('credentials') or []) > 1:
+        return ShardedApiClient(config=config, session=session)
+    return ApiClient(config=config, session=session)
+
+
+class _Shard(object):
+    """
+    One set of credentials in a |ShardedApiClient|.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.bucket = None
+        self.cooldown_until = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def name(self):
+        # enough of the key to tell shards apart in metrics, without logging the whole key
+        return self.client.api_key[:8]
+
+    def get_tokens(self):
+        """
+        :return: The number of requests left in the key's quota; infinite if it isn't known.  Reading a bucket shared
+            with other processes can take a file lock or a round trip, so this is never called while holding a lock.
+        """
+
+        return float('inf') if self.bucket is None else self.bucket.tokens
+
+    def stats(self, now, tokens):
+        return {
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'rate_limited': self.rate_limited,
+            'cooldown': max(self.cooldown_until - now, 0),
+            'tokens': None if self.bucket is None else tokens
+        }
+
+
+class ShardedApiClient(ApiClient):
+    """
+    An |ApiClient| that spreads requests across several API keys of the same company, so that throughput isn't capped
+    by a single key's |RequestQuota|.  Each key has its own token and its own quota: before the first request, each
+    key's quota is fetched with ``GET request-quotas`` and tracked with a |TokenBucket| (of the kind set by the
+    ``rate_limit`` config, so keys can be shared with other processes), and every request is sent
+    with the key that has the most requests left.  A key that is rate limited (429) is set aside until its wait time
+    has passed, and the request is retried with another key; only if every key is rate limited does the client wait.
+
+    Caching, conditional requests, coalescing, hedging, deadlines, circuit breakers, metrics and hooks are shared by all
+    keys.  Enable sharding by passing a list of ``credentials`` in the config; see |TruStar|.
+    """
+
+    def __init__(self, config=None, session=None):
+        super(ShardedApiClient, self).__init__(config=config, session=session)
+
+        self._lock = threading.Lock()
+        self._quotas_loaded = False
+
+        self.shards = []
+        for credential in parse_credentials(config.get('credentials')):
+            shard_config = dict(config,
+                                api_key=credential['api_key'],
+                                api_secret=credential['api_secret'],
+                                cache=False,
+                                conditional_requests=False,
+                                coalesce_requests=False,
+                                metrics_log_interval=None,
+                                slow_request_threshold=None,
+                                rate_limit=config.get('rate_limit') or 'memory',
+                                adaptive_concurrency=False,
+                                hedge_requests=False,
+                                circuit_breaker=False)
+            client = ApiClient(config=shard_config, session=self.session)
+            # the shards report to this client's metrics and hooks, share its concurrency limit, and leave 429s to it
+            client.metrics = self.metrics
+            client.hooks = self.hooks
+            client.concurrency_limiter = self.concurrency_limiter
+            client.hedger = self.hedger
+            client.circuit_breakers = self.circuit_breakers
+            client.get_priority = self.get_priority
+            client.get_cancellation_token = self.get_cancellation_token
+            client.wait_on_rate_limit = False
+            self.shards.append(_Shard(client))
+
+        self.metrics.register_source('shards', self.get_shard_stats)
+
+    def get_shard_stats(self):
+        """
+        :return: A dictionary mapping the first characters of each API key to its number of requests, requests in
+            flight, times it was rate limited, remaining cooldown in seconds, and available tokens.
+        """
+
+        tokens = [shard.get_tokens() for shard in self.shards]
+        now = time.time()
+        with self._lock:
+            return dict((shard.name, shard.stats(now, shard_tokens))
+                        for shard, shard_tokens in zip(self.shards, tokens))
+
+    def _load_quotas(self):
+        """
+        Creates the rate limiter of each key from its quota, the first time a request is sent.  Keys whose quota can't
+        be fetched are used without one.
+        """
+
+        with self._lock:
+            if self._quotas_loaded:
+                return
+            self._quotas_loaded = True
+
+        for shard in self.shards:
+            shard.client._load_rate_limiter()
+            shard.bucket = shard.client.rate_limiter
+
+    def _choose_shard(self, ignore_cooldown=False):
+        """
+        Picks the key with the most requests left, among those that aren't rate limited, and marks a request in flight
+        on it.  Keys without a known quota count as having unlimited requests, and ties go to the key with the fewest
+        requests in flight.
+
+        :param boolean ignore_cooldown: Whether to consider keys that are rate limited as well.
+        :return: A tuple of the shard (or ``None`` if every key is rate limited) and the number of seconds until a
+            key's cooldown ends.
+        """
+
+        now = time.time()
+        with self._lock:
+            available = [shard for shard in self.shards if ignore_cooldown or shard.cooldown_until <= now]
+            if not available:
+                return None, min(shard.cooldown_until for shard in self.shards) - now
+
+        # read outside the lock, so that requests don't queue behind each other's reads of shared buckets
+        tokens = [shard.get_tokens() for shard in available]
+
+        with self._lock:
+            shard = max(zip(available, tokens), key=lambda choice: (choice[1], -choice[0].in_flight))[0]
+            shard.in_flight += 1
+            shard.requests += 1
+            return shard, 0
+
+    def _send(self, method, path, headers=None, params=None, data=None, **kwargs):
+        """
+        Sends a request with the key that has the most requests left, retrying with another key if it is rate
+        limited.  See |ApiClient._send|.
+        """
+
+        self._load_quotas()
+
+        endpoint = "%s %s" % (method, get_endpoint_template(path))
+        response = None
+        while True:
+            shard, wait_time = self._choose_shard()
+            if shard is None:
+                if self.retry and wait_time <= self.max_wait_time:
+                    self.logger.debug("All API keys are rate limited; waiting %.1f seconds.", wait_time)
+                    self.metrics.record_rate_limit_wait(endpoint, wait_time)
+                    self._sleep(wait_time)
+                    continue
+                if response is not None:
+                    return response
+                # not allowed to wait, so let the API respond
+                shard, _ = self._choose_shard(ignore_cooldown=True)
+
+            try:
+                response = shard.client._send(method, path, headers=headers, params=params, data=data, **kwargs)
+            finally:
+                with self._lock:
+                    shard.in_flight -= 1
+
+            if response.status_code != 429 or not self.retry:
+                return response
+
+            wait_time = ceil(get_codec().loads(response.content).get('waitTime') / 1000)
+            self.logger.debug("API key %s... is rate limited for %d seconds.", shard.name, wait_time)
+            with self._lock:
+                shard.cooldown_until = time.time() + wait_time
+                shard.rate_limited += 1
+
+            event = RequestEvent(method, path, endpoint, params=params)
+            event.set_response(response, None)
+            event.reason = 'rate_limited'
+            event.wait_time = wait_time
+            self.metrics.record_retry(endpoint, event.reason)
+            self.hooks.dispatch(RETRY, event)
+
+    def close(self):
+        super(ShardedApiClient, self).close()
+        for shard in self.shards:
+            # the hedger is this client's, and already closed
+            shard.client.hedger = None
+            shard.client.close()
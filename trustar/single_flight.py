@@ -0,0 +1,113 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+
+# external imports
+import logging
+import threading
+
+# package imports
+from .concurrency import CANCELLATION_POLL_INTERVAL
+from .deadline import Cancelled
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """
+    An in-flight call, shared by every caller with the same key.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: while a call is in flight, any other caller with the same key waits
+    for it and receives the same result (or exception) instead of making the call again.  Once a call completes, the
+    next caller with that key starts a new one; results are never cached.
+
+    :ivar hits: The number of calls that were served by joining an in-flight call.
+    :ivar misses: The number of calls that were actually made.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+
+    def do(self, key, func, cancellation=None):
+        """
+        Calls ``func``, unless a call with the same key is already in flight, in which case its outcome is shared.
+
+        Deadlines and cancellation are not shared: a caller waiting for another's call stops waiting when its own
+        |CancellationToken| says so, and if the call it waited for was cancelled (i.e. by its caller's deadline), it
+        makes the call itself.
+
+        :param key: A hashable key identifying the call.
+        :param func: A function taking no arguments.
+        :param cancellation: The caller's |CancellationToken|, if any.
+        :return: The return value of ``func``.
+        """
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+            if leader:
+                break
+
+            self._wait(call, cancellation)
+            if isinstance(call.error, Cancelled):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @staticmethod
+    def _wait(call, cancellation):
+        if cancellation is None:
+            call.done.wait()
+            return
+
+        # wake up by the deadline, and now and then to notice the token being cancelled
+        while True:
+            cancellation.check()
+            remaining = cancellation.remaining()
+            interval = CANCELLATION_POLL_INTERVAL if remaining is None else min(remaining, CANCELLATION_POLL_INTERVAL)
+            if call.done.wait(interval):
+                return
+
+    def stats(self):
+        """
+        :return: A dictionary of the ``hits``, ``misses`` and ``in_flight`` counts.
+        """
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'in_flight': len(self._calls)
+            }
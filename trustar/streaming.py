@@ -0,0 +1,250 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object, str
+from six import string_types
+
+# external imports
+import codecs
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# default number of bytes read from the response stream at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamDecoder(object):
+    """
+    Incrementally decodes a json document of the form ``{"items": [...], ...}`` (or a top-level json array) from an
+    iterable of byte chunks, yielding each element of the items array as soon as it has been parsed.  Only about one
+    item's worth of text (at most twice its size, while a large item is being read) is held in memory at a time.
+
+    Any other top-level fields of the document (i.e. ``pageNumber``, ``hasNext``) are collected into the ``fields``
+    dictionary.  Since fields might appear after the items array, ``fields`` is only guaranteed to be complete once
+    iteration has finished.
+
+    :ivar fields: The top-level fields of the document, other than the items array.
+    :ivar finished: Whether the entire document has been decoded.
+    """
+
+    def __init__(self, chunks, items_key='items', encoding='utf-8'):
+        """
+        :param chunks: An iterable of ``bytes`` (or ``str``) chunks, i.e. from ``response.iter_content()``.
+        :param items_key: The key of the top-level array whose elements should be yielded.
+        :param encoding: The encoding of the byte chunks.
+        """
+
+        self.items_key = items_key
+        self.fields = {}
+        self.finished = False
+
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='strict')
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._started = False
+
+    def __iter__(self):
+        if self._started:
+            raise ValueError("A JsonStreamDecoder can only be iterated once.")
+        self._started = True
+        return self._decode()
+
+    def close(self):
+        """
+        Stops reading the stream before the end of the document, i.e. because the caller stopped iterating.
+        """
+
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        self._eof = True
+
+    def _read(self, size=1):
+        """
+        Reads at least ``size`` more characters from the stream into the buffer (fewer if the stream ends first),
+        discarding any text that has already been parsed.
+
+        :return: ``False`` if the stream is exhausted.
+        """
+
+        if self._eof:
+            return False
+
+        # join the chunks once, rather than copying the buffer for each
+        parts = [self._buffer[self._pos:]]
+        read = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._text_decoder.decode(chunk)
+            if chunk:
+                parts.append(chunk)
+                read += len(chunk)
+                if read >= size:
+                    break
+        else:
+            self._eof = True
+            tail = self._text_decoder.decode(b'', final=True)
+            if tail:
+                parts.append(tail)
+                read += len(tail)
+
+        if not read:
+            return False
+        self._buffer = ''.join(parts)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skips whitespace and returns the next significant character without consuming it.
+
+        :return: The next character, or ``None`` if the stream is exhausted.
+        """
+
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return None
+
+    def _expect(self, characters):
+        """
+        Consumes the next significant character, which must be one of ``characters``.
+
+        :return: The consumed character.
+        """
+
+        char = self._peek()
+        if char is None or char not in characters:
+            raise ValueError("Malformed json stream: expected one of %r but found %r at offset %d."
+                             % (characters, char, self._pos))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """
+        Parses the next complete json value, reading more of the stream as needed.
+
+        :return: The parsed value.
+        """
+
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # the value is incomplete; read at least as much again as is buffered before trying again, so that a
+                # large value is parsed a few times, rather than once per chunk
+                if not self._read(len(self._buffer) - self._pos):
+                    raise
+                continue
+
+            # a number ending exactly at the end of the buffer might continue in the next chunk
+            if end == len(self._buffer) and not self._eof and self._read():
+                continue
+
+            self._pos = end
+            return value
+
+    def _items(self):
+        """
+        Yields each element of the array starting at the current position.
+        """
+
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def _decode(self):
+
+        if self._peek() == '[':
+            for item in self._items():
+                yield item
+            self._finish()
+            return
+
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            self._finish()
+            return
+
+        while True:
+            key = self._value()
+            if not isinstance(key, string_types):
+                raise ValueError("Malformed json stream: object keys must be strings.")
+            self._expect(':')
+
+            if key == self.items_key and self._peek() == '[':
+                for item in self._items():
+                    yield item
+            else:
+                self.fields[key] = self._value()
+
+            if self._expect(',}') == '}':
+                break
+
+        self._finish()
+
+    def _finish(self):
+        """
+        Reads the remainder of the stream, so that the underlying connection can be released.
+        """
+
+        if self._peek() is not None:
+            raise ValueError("Malformed json stream: unexpected data after the end of the document.")
+        self.finished = True
+
+
+def iter_response_chunks(response, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterates over the body of a response.  Compressed bodies are decompressed chunk by chunk as they arrive.  If the
+    response was not requested with ``stream=True``, the already-loaded body is returned in chunks.
+
+    If the response has an ``on_body_consumed`` attribute (set by |ApiClient| on streamed responses), it is called with
+    the total number of decompressed bytes once the body has been read completely, or with the number read so far if
+    the generator is closed first.
+
+    :param response: The ``requests`` response object.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A generator of byte chunks.
+    """
+
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            size += len(chunk)
+            yield chunk
+    finally:
+        on_body_consumed = getattr(response, 'on_body_consumed', None)
+        if on_body_consumed is not None:
+            on_body_consumed(size)
+
+
+def stream_json_items(response, items_key='items', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Creates a |JsonStreamDecoder| over the body of a response.
+
+    :param response: The ``requests`` response object, ideally requested with ``stream=True``.
+    :param items_key: The key of the top-level array whose elements should be yielded.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: The decoder.
+    """
+
+    return JsonStreamDecoder(iter_response_chunks(response, chunk_size=chunk_size),
+                             items_key=items_key,
+                             encoding=response.encoding or 'utf-8')
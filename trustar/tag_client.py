@@ -1,16 +1,13 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, str
-from future import standard_library
 from six import string_types
 import logging
 
 # package imports
+from .codec import loads
 from .models import Tag
 
-# python 2 backwards compatibility
-standard_library.install_aliases()
-
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +24,7 @@ class TagClient(object):
 
         params = {'idType': id_type}
         resp = self._client.get("reports/%s/tags" % report_id, params=params)
-        return [Tag.from_dict(indicator) for indicator in resp.json()]
+        return [Tag.from_dict(indicator) for indicator in loads(resp.content)]
 
     def add_enclave_tag(self, report_id, name, enclave_id, id_type=None):
         """
@@ -46,6 +43,7 @@ class TagClient(object):
             'enclaveId': enclave_id
         }
         resp = self._client.post("reports/%s/tags" % report_id, params=params)
+        self._invalidate_enclave_tags(report_id)
         return str(resp.content)
 
     def delete_enclave_tag(self, report_id, tag_id, id_type=None):
@@ -62,6 +60,7 @@ class TagClient(object):
             'idType': id_type
         }
         self._client.delete("reports/%s/tags/%s" % (report_id, tag_id), params=params)
+        self._invalidate_enclave_tags(report_id)
 
     def get_all_enclave_tags(self, enclave_ids=None):
         """
@@ -74,7 +73,7 @@ class TagClient(object):
 
         params = {'enclaveIds': enclave_ids}
         resp = self._client.get("reports/tags", params=params)
-        return [Tag.from_dict(indicator) for indicator in resp.json()]
+        return [Tag.from_dict(indicator) for indicator in loads(resp.content)]
 
     def get_all_indicator_tags(self, enclave_ids=None):
         """
@@ -89,7 +88,7 @@ class TagClient(object):
 
         params = {'enclaveIds': enclave_ids}
         resp = self._client.get("indicators/tags", params=params)
-        return [Tag.from_dict(indicator) for indicator in resp.json()]
+        return [Tag.from_dict(indicator) for indicator in loads(resp.content)]
 
     def add_indicator_tag(self, indicator_value, name, enclave_id):
         """
@@ -106,7 +105,8 @@ class TagClient(object):
             'enclaveId': enclave_id
         }
         resp = self._client.post("indicators/%s/tags" % indicator_value, params=params)
-        return Tag.from_dict(resp.json())
+        self._invalidate_indicator_tags()
+        return Tag.from_dict(loads(resp.content))
 
     def delete_indicator_tag(self, indicator_value, tag_id):
         """
@@ -117,3 +117,22 @@ class TagClient(object):
         """
 
         self._client.delete("indicators/%s/tags/%s" % (indicator_value, tag_id))
+        self._invalidate_indicator_tags()
+
+    def _invalidate_enclave_tags(self, report_id):
+        """
+        Removes cached responses that might include the enclave tags of a report.
+
+        :param report_id: the ID of the report whose tags changed
+        """
+
+        self._client.invalidate_cache(path="reports/%s/tags" % report_id)
+        self._client.invalidate_cache(template="reports/tags")
+
+    def _invalidate_indicator_tags(self):
+        """
+        Removes cached responses that might include indicator tags.
+        """
+
+        self._client.invalidate_cache(template="indicators/tags")
+        self._client.invalidate_cache(template="indicators/metadata")
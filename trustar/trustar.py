@@ -1,18 +1,27 @@
 # python 2 backwards compatibility
 from __future__ import print_function
 from builtins import object, str
-from future import standard_library
 from six import string_types
 
 # external imports
-import configparser
 import os
-import yaml
 import logging
+import threading
 
 # package imports
-from .api_client import ApiClient
+from .api_client import DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_URL_LENGTH, DEFAULT_READ_TIMEOUT
+from .cache import DEFAULT_CACHE_SIZE, DEFAULT_NEGATIVE_TTL, DEFAULT_VALIDATOR_CACHE_SIZE
+from .codec import loads
+from .deadline import CancellationToken
+from .disk_cache import DEFAULT_CACHE_PATH
+from .concurrency import DEFAULT_BULK_WORKERS, DEFAULT_MAX_CONCURRENCY, map_concurrently
+from .circuit_breaker import DEFAULT_FAILURE_RATE, DEFAULT_MIN_REQUESTS, DEFAULT_RESET_TIMEOUT
+from .compression import DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_THRESHOLD
+from .hedging import DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_QUANTILE
+from .logger import configure_logging
+from .rate_limit import DEFAULT_RESERVED_QUOTA
 from .report_client import ReportClient
+from .sharding import create_api_client, parse_credentials
 from .indicator_client import IndicatorClient
 from .tag_client import TagClient
 from .models import EnclavePermissions, RequestQuota
@@ -20,14 +29,15 @@ from .utils import normalize_timestamp
 
 from .version import __version__, __api_version__
 
-# python 2 backwards compatibility
-standard_library.install_aliases()
-
 
 class TruStar(ReportClient, IndicatorClient, TagClient):
 
     logger = logging.getLogger(__name__)
 
+    # parsed config file sections, keyed by path and role, along with the modification time of the file
+    _config_file_cache = {}
+    _config_file_lock = threading.Lock()
+
     # raise exception if any of these config keys are missing
     REQUIRED_KEYS = ['api_key', 'api_secret']
 
@@ -50,10 +60,45 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
         'retry': True,
         'max_wait_time': 60,
         'http_proxy': None,
-        'https_proxy': None
+        'https_proxy': None,
+        'compress_requests': False,
+        'compression_threshold': DEFAULT_COMPRESSION_THRESHOLD,
+        'compression_level': DEFAULT_COMPRESSION_LEVEL,
+        'coalesce_requests': False,
+        'cache': False,
+        'cache_size': DEFAULT_CACHE_SIZE,
+        'cache_path': DEFAULT_CACHE_PATH,
+        'cache_max_bytes': None,
+        'cache_ttls': None,
+        'negative_cache_ttl': DEFAULT_NEGATIVE_TTL,
+        'conditional_requests': False,
+        'conditional_cache_size': DEFAULT_VALIDATOR_CACHE_SIZE,
+        'metrics_log_interval': None,
+        'slow_request_threshold': None,
+        'max_connections': DEFAULT_MAX_CONNECTIONS,
+        'max_url_length': DEFAULT_MAX_URL_LENGTH,
+        'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+        'read_timeout': DEFAULT_READ_TIMEOUT,
+        'timeouts': None,
+        'rate_limit': None,
+        'rate_limit_path': None,
+        'rate_limit_address': None,
+        'default_priority': 'interactive',
+        'reserved_quota': DEFAULT_RESERVED_QUOTA,
+        'adaptive_concurrency': False,
+        'max_concurrency': DEFAULT_MAX_CONCURRENCY,
+        'circuit_breaker': False,
+        'circuit_failure_rate': DEFAULT_FAILURE_RATE,
+        'circuit_min_requests': DEFAULT_MIN_REQUESTS,
+        'circuit_reset_timeout': DEFAULT_RESET_TIMEOUT,
+        'hedge_requests': False,
+        'hedge_delay': None,
+        'hedge_quantile': DEFAULT_HEDGE_QUANTILE,
+        'hedge_budget': DEFAULT_HEDGE_BUDGET,
+        'hedge_endpoints': None
     }
 
-    def __init__(self, config_file=None, config_role=None, config=None):
+    def __init__(self, config_file=None, config_role=None, config=None, api_client=None):
 
         """
         Constructs and configures the instance.  Initially attempts to use ``config``; if it is ``None``,
@@ -71,6 +116,12 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
         +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
         | ``user_api_secret``     | Yes       | ``True``                                         | API secret                                             |
         +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``credentials``         | No        | ``None``                                         | several API keys of the same company, to spread        |
+        |                         |           |                                                  | requests across (see |ShardedApiClient|); a list of    |
+        |                         |           |                                                  | ``"key:secret"`` strings or of dictionaries with       |
+        |                         |           |                                                  | ``user_api_key`` and ``user_api_secret``.  If given,   |
+        |                         |           |                                                  | ``user_api_key`` and ``user_api_secret`` are optional  |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
         | ``enclave_ids``         | No        | ``[]``                                           | a list (or comma-separated list) of enclave ids        |
         +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
         | ``auth_endpoint``       | No        | ``"https://api.trustar.co/oauth/token"``         | the URL used to obtain OAuth2 tokens                   |
@@ -93,6 +144,101 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
         +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
         | ``https_proxy``         | No        | ``None``                                         | https proxy being used - http(s)://user:pwd@{ip}:{port}|
         +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``compress_requests``   | No        | ``False``                                        | whether to gzip request bodies above the threshold     |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``compression_threshold`` | No      | ``16384``                                        | minimum request body size to compress, in bytes        |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``compression_level``   | No        | ``6``                                            | gzip compression level for request bodies (1-9)        |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``coalesce_requests``   | No        | ``False``                                        | whether identical concurrent GETs share one request    |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``cache``               | No        | ``False``                                        | whether to cache responses from read endpoints; either |
+        |                         |           |                                                  | ``"memory"`` (or ``True``) or ``"disk"``               |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``cache_size``          | No        | ``1000``                                         | maximum number of cached responses                     |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``cache_path``          | No        | ``"~/.trustar/cache.sqlite"``                    | path of the SQLite database used by the disk cache     |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``cache_max_bytes``     | No        | ``None``                                         | maximum total size of responses in the disk cache      |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``cache_ttls``          | No        | see ``trustar.cache.DEFAULT_CACHE_TTLS``         | TTLs in seconds per endpoint template                  |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``negative_cache_ttl``  | No        | ``30``                                           | how long to cache 404 responses, in seconds            |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``conditional_requests``| No        | ``False``                                        | whether to revalidate repeated GETs using the ETag or  |
+        |                         |           |                                                  | Last-Modified of the previous response                 |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``conditional_cache_size`` | No     | ``100``                                          | number of responses remembered for revalidation        |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``metrics_log_interval``| No        | ``None``                                         | seconds between metrics summaries logged at INFO;      |
+        |                         |           |                                                  | disabled if ``None``                                   |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``slow_request_threshold`` | No     | ``None``                                         | log a warning for requests slower than this, in        |
+        |                         |           |                                                  | seconds; disabled if ``None``                          |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``max_connections``     | No        | ``10``                                           | number of connections kept open to each host           |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``max_url_length``      | No        | ``6000``                                         | longest URL to send; longer lists of values (i.e. of   |
+        |                         |           |                                                  | |get_indicators_metadata|) are split across several    |
+        |                         |           |                                                  | requests, sent concurrently                            |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``connect_timeout``     | No        | ``10``                                           | seconds to wait for a connection                       |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``read_timeout``        | No        | ``60``                                           | seconds to wait between bytes of a response            |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``timeouts``            | No        | ``None``                                         | read timeouts in seconds, or ``[connect, read]`` pairs,|
+        |                         |           |                                                  | per endpoint (``"POST reports"``), endpoint template   |
+        |                         |           |                                                  | (``"reports/{id}"``) or endpoint class (``"search"``,  |
+        |                         |           |                                                  | ``"read"`` or ``"write"``)                             |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``rate_limit``          | No        | ``None``                                         | throttle requests to the key's quota: ``"memory"``,    |
+        |                         |           |                                                  | ``"file"`` (shared by the processes on the host) or    |
+        |                         |           |                                                  | ``"coordinator"`` (see |RateLimitCoordinator|)         |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``rate_limit_path``     | No        | ``"~/.trustar/rate_limits"``                     | directory of the ``"file"`` rate limiter's state       |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``rate_limit_address``  | No        | ``None``                                         | address of the coordinator, i.e. ``"host:port"`` or    |
+        |                         |           |                                                  | the path of a Unix socket                              |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``default_priority``    | No        | ``"interactive"``                                | priority of requests outside of a |priority| block:    |
+        |                         |           |                                                  | ``"interactive"`` or ``"bulk"``                        |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``reserved_quota``      | No        | ``0.2``                                          | fraction of the ``rate_limit`` quota that bulk         |
+        |                         |           |                                                  | requests leave for interactive ones                    |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``adaptive_concurrency``| No        | ``False``                                        | whether to limit the requests in flight, raising the   |
+        |                         |           |                                                  | limit while responses are healthy and cutting it on    |
+        |                         |           |                                                  | 429s, errors and latency spikes (see                   |
+        |                         |           |                                                  | |AdaptiveConcurrencyLimiter|)                          |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``max_concurrency``     | No        | ``32``                                           | the most requests the adaptive limit allows in flight  |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``circuit_breaker``     | No        | ``False``                                        | whether to fail requests to an endpoint right away     |
+        |                         |           |                                                  | while most of its recent requests fail (see            |
+        |                         |           |                                                  | |CircuitBreakers|), until a trial request succeeds     |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``circuit_failure_rate``| No        | ``0.5``                                          | fraction of recent requests to an endpoint that must   |
+        |                         |           |                                                  | fail (5xx or no response) to open its circuit          |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``circuit_min_requests``| No        | ``10``                                           | recent requests needed before a circuit can open       |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``circuit_reset_timeout`` | No      | ``30``                                           | seconds an open circuit waits before a trial request   |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``hedge_requests``      | No        | ``False``                                        | whether to send a duplicate of GETs that are slow to   |
+        |                         |           |                                                  | respond, and use whichever response arrives first (see |
+        |                         |           |                                                  | |Hedger|)                                              |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``hedge_delay``         | No        | ``None``                                         | seconds to wait before hedging; by default, the        |
+        |                         |           |                                                  | endpoint's ``hedge_quantile`` latency                  |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``hedge_quantile``      | No        | ``0.95``                                         | latency quantile used as the default ``hedge_delay``   |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``hedge_budget``        | No        | ``0.1``                                          | the most requests that may be hedged, as a fraction of |
+        |                         |           |                                                  | all requests                                           |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
+        | ``hedge_endpoints``     | No        | ``None``                                         | endpoint templates to hedge, i.e. ``"reports/{id}"``;  |
+        |                         |           |                                                  | all GETs if unset                                      |
+        +-------------------------+-----------+--------------------------------------------------+--------------------------------------------------------+
 
         :param str config_file: Path to configuration file (conf, json, or yaml).  If no value is passed, the environment
             variable TRUSTAR_PYTHON_CONFIG_FILE will be used.  If that is not defined, defaults to "trustar.conf".
@@ -100,6 +246,148 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
             variable TRUSTAR_PYTHON_CONFIG_ROLE will be used.  If that is not defined, defaults to "trustar".
         :param dict config: A dictionary of configuration options.  This will override the config file path passed in
             the ``config_file`` parameter.
+        :param api_client: An existing |ApiClient| to make requests with, i.e. one shared with other instances (see
+            |ClientRegistry|).  By default, a new one is created from the config.
+        """
+
+        # set up the SDK's default logging the first time a client is created, rather than on import
+        configure_logging()
+
+        config = self.load_config(config_file=config_file, config_role=config_role, config=config)
+
+        self.enclave_ids = config.get('enclave_ids')
+
+        if isinstance(self.enclave_ids, str):
+            self.enclave_ids = [self.enclave_ids]
+
+        # initialize api client
+        self._client = api_client if api_client is not None else create_api_client(config)
+
+        # get API version and strip "beta" tag
+        # This comes from base url passed in config
+        # e.g. https://api.trustar.co/api/1.3-beta will give 1.3
+        api_version = self._client.base.strip("/").split("/")[-1]
+
+        # strip beta tag
+        BETA_TAG = "-beta"
+        api_version = api_version.strip(BETA_TAG)
+
+        # /api resolves to version 1.2
+        if api_version.lower() == "api":
+            api_version = "1.2"
+
+        # if API version does not match expected version, log a warning
+        if api_version.strip(BETA_TAG) != __api_version__.strip(BETA_TAG):
+            self.logger.warning("This version (%s) of the TruStar Python SDK is only compatible with version %s of"
+                                " the TruStar Rest API, but is attempting to contact version %s of the Rest API."
+                                % (__version__, __api_version__, api_version))
+
+        # initialize token property
+        self.token = None
+
+    @property
+    def metrics(self):
+        """
+        The |Metrics| recorded for the API calls made by this client, i.e. ``ts.metrics.snapshot()`` or
+        ``ts.metrics.to_prometheus()``.
+        """
+
+        return self._client.metrics
+
+    @property
+    def hooks(self):
+        """
+        The |Hooks| called for the API calls made by this client, i.e.
+        ``ts.hooks.register('post_response', SlowRequestLogger(threshold=2))``.
+        """
+
+        return self._client.hooks
+
+    def priority(self, priority):
+        """
+        Sets the priority of the requests made by the current thread within a ``with`` block.  Interactive requests
+        are sent before bulk ones that are waiting for the rate limit or for a slot (see ``rate_limit`` and
+        ``adaptive_concurrency``), and bulk requests leave a ``reserved_quota`` of the rate limit for them.
+
+        Example:
+
+        >>> with ts.priority('bulk'):
+        >>>     for report in ts.get_reports(from_time=from_time, to_time=to_time):
+        >>>         ...
+
+        :param str priority: ``"interactive"`` or ``"bulk"``.
+        """
+
+        return self._client.priority(priority)
+
+    def deadline(self, deadline):
+        """
+        Stops the requests made by the current thread within a ``with`` block once a deadline has passed, or a
+        |CancellationToken| is cancelled (i.e. by another thread), raising |DeadlineExceeded| or |Cancelled|.  Requests
+        in flight time out by the deadline, and waits for the rate limit that would outlast it fail right away.
+
+        Example:
+
+        >>> with ts.deadline(30):
+        >>>     report = ts.get_report_details(report_id)
+        >>>     tags = ts.get_enclave_tags(report_id)
+
+        :param deadline: A number of seconds, or a |CancellationToken|.
+        """
+
+        return self._client.deadline(deadline)
+
+    def map_concurrently(self, func, items, max_workers=None, deadline=None):
+        """
+        Calls a function on each item with a pool of threads, i.e. to make many independent API calls.  If the client
+        has ``adaptive_concurrency`` enabled, it decides how many requests are in flight at once (up to
+        ``max_concurrency``), and shares that limit with every other call made by the client.
+
+        Example:
+
+        >>> tags = ts.map_concurrently(ts.get_enclave_tags, report_ids)
+
+        :param func: A function taking one item.
+        :param items: The items.
+        :param int max_workers: The number of threads.  Defaults to ``max_concurrency`` if concurrency is adaptive,
+            otherwise 8.
+        :param deadline: The number of seconds to make all the calls in, or a |CancellationToken|.  Once it passes (or
+            is cancelled), calls that haven't started are skipped and |DeadlineExceeded| (or |Cancelled|) is raised.
+        :return: A list of the results, in the order of the items.
+        """
+
+        if max_workers is None:
+            limiter = self._client.concurrency_limiter
+            max_workers = limiter.max_limit if limiter is not None else DEFAULT_BULK_WORKERS
+
+        # the calls run with the priority and deadline of the calling thread
+        priority = self._client.get_priority()
+        cancellation = CancellationToken.create(deadline, parent=self._client.get_cancellation_token())
+
+        def call(item):
+            with self._client.priority(priority), self._client.deadline(cancellation):
+                return func(item)
+
+        return map_concurrently(call, items, max_workers=max_workers, cancellation=cancellation)
+
+    def _map_chunks(self, func, chunks):
+        """
+        Calls a function on each set of query parameters from |split_params|, concurrently if there are several.
+
+        :return: The concatenated results, in the order of the chunks.
+        """
+
+        if len(chunks) == 1:
+            return func(chunks[0])
+        return [x for result in self.map_concurrently(func, chunks) for x in result]
+
+    @classmethod
+    def load_config(cls, config_file=None, config_role=None, config=None):
+        """
+        Builds the complete configuration for a client: reads the config file (if ``config`` is not given), then
+        remaps key names, coerces values to their types, and fills in defaults.  See |TruStar| for the parameters.
+
+        :return: The configuration dictionary.
         """
 
         # attempt to use configuration file if one exists
@@ -121,69 +409,83 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
             if config_role is None:
                 config_role = 'trustar'
 
-            config = self.config_from_file(config_file, config_role)
+            config = cls.config_from_file(config_file, config_role)
 
         else:
             # copy so that the dictionary that was passed is not mutated
             config = config.copy()
 
         # remap config keys names
-        for k, v in self.REMAPPED_KEYS.items():
+        for k, v in cls.REMAPPED_KEYS.items():
             if k in config and v not in config:
                 config[v] = config[k]
 
         # coerce value to boolean
         verify = config.get('verify')
-        config['verify'] = self.parse_boolean(verify)
+        config['verify'] = cls.parse_boolean(verify)
 
         # coerce value to boolean
         retry = config.get('retry')
-        config['retry'] = self.parse_boolean(retry)
+        config['retry'] = cls.parse_boolean(retry)
 
         max_wait_time = config.get('max_wait_time')
         if max_wait_time is not None:
             config['max_wait_time'] = int(max_wait_time)
 
+        # coerce values to boolean
+        for key in ['compress_requests', 'coalesce_requests', 'conditional_requests', 'adaptive_concurrency',
+                    'hedge_requests', 'circuit_breaker']:
+            config[key] = cls.parse_boolean(config.get(key))
+
+        # the cache is either a boolean or the name of a storage backend
+        cache = config.get('cache')
+        if isinstance(cache, string_types) and cache.lower() in ['memory', 'disk']:
+            config['cache'] = cache.lower()
+        else:
+            config['cache'] = cls.parse_boolean(cache)
+
+        for key in ['compression_threshold', 'compression_level', 'cache_size', 'cache_max_bytes',
+                    'conditional_cache_size', 'max_connections', 'max_concurrency', 'circuit_min_requests',
+                    'max_url_length']:
+            if config.get(key) is not None:
+                config[key] = int(config[key])
+
+        for key in ['negative_cache_ttl', 'metrics_log_interval', 'slow_request_threshold', 'reserved_quota',
+                    'connect_timeout', 'read_timeout', 'hedge_delay', 'hedge_quantile', 'hedge_budget',
+                    'circuit_failure_rate', 'circuit_reset_timeout']:
+            if config.get(key) is not None:
+                config[key] = float(config[key])
+
+        # i.e. "reports/{id}, indicators/metadata" in a .conf file
+        hedge_endpoints = config.get('hedge_endpoints')
+        if isinstance(hedge_endpoints, string_types):
+            config['hedge_endpoints'] = [e.strip() for e in hedge_endpoints.split(',') if e.strip()]
+
+        rate_limit = config.get('rate_limit')
+        if rate_limit is not None:
+            if isinstance(rate_limit, string_types) and rate_limit.lower() in ['memory', 'file', 'coordinator']:
+                config['rate_limit'] = rate_limit.lower()
+            else:
+                config['rate_limit'] = 'memory' if cls.parse_boolean(rate_limit) else None
+
+        # several sets of credentials; the first is the default
+        credentials = parse_credentials(config.get('credentials'))
+        config['credentials'] = credentials or None
+        if credentials and config.get('api_key') is None and config.get('api_secret') is None:
+            config['api_key'] = credentials[0]['api_key']
+            config['api_secret'] = credentials[0]['api_secret']
+
         # override Nones with default values if they exist
-        for key, val in self.DEFAULTS.items():
+        for key, val in cls.DEFAULTS.items():
             if config.get(key) is None:
                 config[key] = val
 
         # ensure required properties are present
-        for key in self.REQUIRED_KEYS:
+        for key in cls.REQUIRED_KEYS:
             if config.get(key) is None:
                 raise Exception("Missing config value for %s" % key)
 
-        self.enclave_ids = config.get('enclave_ids')
-
-        if isinstance(self.enclave_ids, str):
-            self.enclave_ids = [self.enclave_ids]
-
-        # initialize api client
-        self._client = ApiClient(config=config)
-
-        # get API version and strip "beta" tag
-        # This comes from base url passed in config
-        # e.g. https://api.trustar.co/api/1.3-beta will give 1.3
-        api_version = self._client.base.strip("/").split("/")[-1]
-
-        # strip beta tag
-        BETA_TAG = "-beta"
-        api_version = api_version.strip(BETA_TAG)
-
-        # /api resolves to version 1.2
-        if api_version.lower() == "api":
-            api_version = "1.2"
-
-        # if API version does not match expected version, log a warning
-        if api_version.strip(BETA_TAG) != __api_version__.strip(BETA_TAG):
-            self.logger.warning("This version (%s) of the TruStar Python SDK is only compatible with version %s of"
-                                " the TruStar Rest API, but is attempting to contact version %s of the Rest API."
-                                % (__version__, __api_version__, api_version))
-
-        # initialize token property
-        self.token = None
-
+        return config
 
     @staticmethod
     def parse_boolean(value):
@@ -209,24 +511,57 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
 
         raise ValueError("Could not convert value to boolean: {}".format(value))
 
-    @staticmethod
-    def config_from_file(config_file_path, config_role):
+    @classmethod
+    def config_from_file(cls, config_file_path, config_role):
         """
         Create a configuration dictionary from a config file section.  This dictionary is what the TruStar
-        class constructor ultimately requires.
+        class constructor ultimately requires.  Parsed sections are cached until the file is modified, so creating
+        many clients from the same file only reads it once.
 
         :param config_file_path: The path to the config file.
         :param config_role: The section within the file to use.
         :return: The configuration dictionary.
         """
 
+        try:
+            path = os.path.abspath(config_file_path)
+            mtime = os.path.getmtime(path)
+        except OSError:
+            # let the parser report the missing file
+            return cls._read_config_file(config_file_path, config_role)
+
+        key = (path, config_role)
+        with cls._config_file_lock:
+            cached = cls._config_file_cache.get(key)
+
+        if cached is not None and cached[0] == mtime:
+            config = cached[1]
+        else:
+            config = cls._read_config_file(config_file_path, config_role)
+            with cls._config_file_lock:
+                cls._config_file_cache[key] = (mtime, config)
+
+        # copy, so that callers can't modify the cached config
+        config = dict(config)
+        config['enclave_ids'] = list(config['enclave_ids'])
+        return config
+
+    @staticmethod
+    def _read_config_file(config_file_path, config_role):
+        """
+        Reads and parses a config file section.  See |config_from_file|.
+        """
+
         # read config file depending on filetype, parse into dictionary
         ext = os.path.splitext(config_file_path)[-1]
+        # parsers are imported here, rather than up front, to keep ``import trustar`` fast
         if ext in ['.conf', '.ini']:
+            import configparser
             config_parser = configparser.RawConfigParser()
             config_parser.read(config_file_path)
             roles = dict(config_parser)
         elif ext in ['.json', '.yml', '.yaml']:
+            import yaml
             with open(config_file_path, 'r') as f:
                 roles = yaml.safe_load(f)
         else:
@@ -307,7 +642,7 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
         """
 
         resp = self._client.get("enclaves")
-        return [EnclavePermissions.from_dict(enclave) for enclave in resp.json()]
+        return [EnclavePermissions.from_dict(enclave) for enclave in loads(resp.content)]
 
     def get_request_quotas(self):
         """
@@ -317,4 +652,4 @@ class TruStar(ReportClient, IndicatorClient, TagClient):
         """
 
         resp = self._client.get("request-quotas")
-        return [RequestQuota.from_dict(quota) for quota in resp.json()]
+        return [RequestQuota.from_dict(quota) for quota in loads(resp.content)]
@@ -4,11 +4,10 @@ from six import string_types
 
 # external imports
 import logging
+import os
+import tempfile
 import time
 from datetime import datetime
-import dateutil.parser
-import pytz
-from tzlocal import get_localzone
 
 
 DAY = 24 * 60 * 60 * 1000
@@ -44,6 +43,7 @@ def normalize_timestamp(date_time):
             return date_time
 
         if isinstance(date_time, str):
+            import dateutil.parser
             datetime_dt = dateutil.parser.parse(date_time)
         elif isinstance(date_time, datetime):
             datetime_dt = date_time
@@ -57,6 +57,10 @@ def normalize_timestamp(date_time):
 
     # if timestamp is timezone naive, add timezone
     if not datetime_dt.tzinfo:
+        # timezone libraries are slow to import, so only load them when needed
+        import pytz
+        from tzlocal import get_localzone
+
         # add system timezone and convert to UTC
         datetime_dt = get_localzone().localize(datetime_dt).astimezone(pytz.utc)
 
@@ -108,6 +112,67 @@ def get_time_based_page_generator(get_page, get_next_to_time, from_time=None, to
         to_time = new_to_time
 
 
+# path segments that are part of an endpoint's route, rather than an ID or indicator value
+ENDPOINT_SEGMENTS = {
+    'reports', 'indicators', 'enclaves', 'whitelist', 'request-quotas', 'ping', 'version', 'tags', 'search',
+    'correlate', 'correlated', 'metadata', 'details', 'related', 'community-trending', 'summaries', 'copy',
+    'oauth', 'token'
+}
+
+
+def get_endpoint_template(path):
+    """
+    Convert a request path into the template of the endpoint it belongs to, by replacing IDs and indicator values
+    with placeholders.  This allows requests to be grouped by endpoint, i.e. for metrics.
+
+    Example:
+
+    >>> get_endpoint_template("reports/1a09f14b-ef8c-443f-b082-9643071c522a/tags/abc")
+    'reports/{id}/tags/{tag_id}'
+
+    :param str path: the path of the request, i.e. the piece of the URL after the base URL
+    :return: the endpoint template
+    """
+
+    segments = path.strip('/').split('/')
+    template = []
+    for i, segment in enumerate(segments):
+        if segment in ENDPOINT_SEGMENTS and not (i == 1 and segments[0] in ('reports', 'indicators') and
+                                                 len(segments) > 2):
+            template.append(segment)
+        elif i > 0 and segments[i - 1] == 'tags':
+            template.append('{tag_id}')
+        else:
+            template.append('{id}')
+    return '/'.join(template)
+
+
+def get_request_key(method, path, params=None, headers=None):
+    """
+    Build a hashable key that identifies a request, such that two requests with the same key would be sent
+    identically.  ``None`` params are dropped (since they are never sent) and params are sorted by name, but the order
+    of values within a multi-valued param is preserved.
+
+    :param str method: the method of the request
+    :param str path: the path of the request
+    :param dict params: the query parameters of the request
+    :param dict headers: any extra headers of the request
+    :return: the key
+    """
+
+    def freeze(value):
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        return value
+
+    def canonicalize(d):
+        if not d:
+            return ()
+        return tuple(sorted((k, freeze(v)) for k, v in d.items() if v is not None))
+
+    return method.upper(), path.strip('/'), canonicalize(params), canonicalize(headers)
+
+
 def parse_boolean(value):
     """
     Coerce a value to boolean.
@@ -132,4 +197,28 @@ def parse_boolean(value):
     raise ValueError("Could not convert value to boolean: {}".format(value))
 
 
+def _write_atomically(path, data):
+    """
+    Writes a file by writing a temporary file next to it and renaming it, so that readers never see a partial file
+    (and a file mapped into memory from the old one keeps reading it).
+
+    :param str path: The path of the file.
+    :param bytes data: The contents of the file.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if os.name == 'nt':
+            os.replace(temp_path, path)
+        else:
+            os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 logger = logging.getLogger(__name__)
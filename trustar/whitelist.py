@@ -0,0 +1,329 @@
+# python 2 backwards compatibility
+from __future__ import print_function
+from builtins import object
+from six import text_type
+
+# external imports
+import ipaddress
+import logging
+import os
+import threading
+
+# package imports
+from .codec import dumps, loads
+from .models import Indicator, IndicatorType
+from .utils import _write_atomically, get_current_time_millis
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+# types whose values are matched by the domain they are on, and by the network they are in
+_DOMAIN_TYPES = (None, IndicatorType.URL)
+_NETWORK_TYPES = (None, IndicatorType.IP, IndicatorType.CIDR_BLOCK)
+
+
+def normalize(value):
+    """
+    Normalizes a value for matching.  Values are stripped and lowercased, except for the path of a URL, which can be
+    case-sensitive.
+    """
+
+    if not isinstance(value, text_type):
+        value = value.decode('utf-8') if isinstance(value, bytes) else text_type(value)
+    value = value.strip()
+    if '://' not in value:
+        return value.lower()
+
+    scheme, separator, rest = value.partition('://')
+    for i, c in enumerate(rest):
+        if c in '/?#':
+            return scheme.lower() + separator + rest[:i].lower() + rest[i:]
+    return value.lower()
+
+
+def get_host(value):
+    """
+    :param str value: A normalized domain or URL.
+    :return: Its host name, or ``None`` if it doesn't have one (i.e. it is an email address, or a file path).
+    """
+
+    scheme, separator, rest = value.partition('://')
+    if separator:
+        for c in '/?#':
+            rest = rest.split(c, 1)[0]
+        rest = rest.rpartition('@')[2]
+        if rest.startswith('['):
+            return None
+        rest = rest.split(':', 1)[0]
+    elif '/' in value or '@' in value or '\\' in value or ':' in value:
+        return None
+    else:
+        rest = value
+    return rest.rstrip('.') or None
+
+
+def parse_network(value):
+    """
+    :param str value: A normalized IP address or CIDR block.
+    :return: A ``(version, address, prefix length)`` tuple, with the address as an integer; ``None`` if the value isn't
+        an IP address or a CIDR block.
+    """
+
+    # IPv4 addresses and blocks are by far the most common, and much faster to parse by hand
+    address, separator, prefix_length = value.partition('/')
+    parts = address.split('.')
+    if len(parts) == 4 and all(part.isdigit() and len(part) <= 3 for part in parts):
+        octets = [int(part) for part in parts]
+        if not separator:
+            prefix_length = 32
+        elif prefix_length.isdigit():
+            prefix_length = int(prefix_length)
+        else:
+            return None
+        if max(octets) > 255 or prefix_length > 32:
+            return None
+        address = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+        return 4, address >> (32 - prefix_length) << (32 - prefix_length), prefix_length
+
+    if ':' not in address or address.strip('0123456789abcdef:.'):
+        return None
+    try:
+        network = ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), network.prefixlen
+
+
+class WhitelistMatcher(object):
+    """
+    A local copy of the company's whitelist (see |get_whitelist|), compiled for matching, so that whitelisted values
+    can be dropped before they are submitted instead of sent for the server to discard.  A value is whitelisted if:
+
+    * it is on the whitelist, with the same type (or any type, if the value's type isn't given);
+    * it is a domain or URL on a whitelisted domain, or one of its subdomains;
+    * it is an IP address or CIDR block inside a whitelisted IP address or CIDR block.
+
+    Each check is a few set lookups, so a million values are matched in seconds.
+
+    The matcher can be saved to a snapshot file and opened from it, so that a process starts without downloading the
+    whitelist; |sync| then applies only what changed since.
+
+    Example:
+
+    >>> whitelist = WhitelistMatcher.open("whitelist.json")
+    >>> whitelist.sync(ts)
+    >>> whitelist.save()
+    >>> indicators = whitelist.filter(indicators)
+    """
+
+    def __init__(self, indicators=None, path=None, synced_at=None):
+        """
+        :param indicators: The whitelisted |Indicator| objects.
+        :param str path: The file |save| writes to.
+        :param int synced_at: The time (in milliseconds) the whitelist was last synced.
+        """
+
+        self.path = path
+        self.synced_at = synced_at
+
+        # normalized value -> the types it is whitelisted with
+        self._values = {}
+        # whitelisted domains, matched against the host of each value and its parents
+        self._domains = set()
+        # (version, prefix length) -> the whitelisted networks of that length, as their address shifted by the length
+        self._networks = {}
+        self._lock = threading.Lock()
+
+        self.add(indicators or [])
+
+    @classmethod
+    def open(cls, path):
+        """
+        Loads the snapshot saved at a path, or creates an empty matcher that will be saved there.
+
+        :param str path: The path of the file.
+        :return: The |WhitelistMatcher|.
+        """
+
+        if not os.path.exists(path):
+            return cls(path=path)
+
+        with open(path, 'rb') as f:
+            snapshot = loads(f.read())
+        if not isinstance(snapshot, dict) or snapshot.get('version') != _VERSION:
+            raise ValueError("Not a whitelist snapshot: %s" % path)
+
+        indicators = [Indicator(value=value, type=indicator_type) for value, indicator_type in snapshot['indicators']]
+        return cls(indicators, path=path, synced_at=snapshot.get('syncedAt'))
+
+    def save(self, path=None):
+        """
+        Writes a snapshot of the matcher to a file, replacing it atomically.
+
+        :param str path: The path of the file; by default, the one it was opened from.
+        """
+
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the whitelist to")
+
+        with self._lock:
+            snapshot = {
+                'version': _VERSION,
+                'syncedAt': self.synced_at,
+                'indicators': sorted(([value, indicator_type] for value, types in self._values.items()
+                                      for indicator_type in types), key=lambda entry: (entry[0], entry[1] or ''))
+            }
+        _write_atomically(path, dumps(snapshot))
+        self.path = path
+
+    def sync(self, client, deadline=None):
+        """
+        Brings the matcher up to date with the company's whitelist.  The API can't list what changed since a given
+        time, so the whitelist is read again (streamed, a page at a time); only the entries that were added or removed
+        are applied, and lookups keep working meanwhile.
+
+        :param client: The |TruStar| instance to read the whitelist with.
+        :param deadline: The number of seconds to read the whitelist in, or a |CancellationToken|.
+        :return: A tuple of the number of entries added and the number removed.
+        """
+
+        synced_at = get_current_time_millis()
+        current = set((normalize(indicator.value), indicator.type)
+                      for indicator in client.get_whitelist(deadline=deadline))
+
+        with self._lock:
+            entries = set((value, indicator_type) for value, types in self._values.items() for indicator_type in types)
+        added = current - entries
+        removed = entries - current
+        for value, indicator_type in removed:
+            self._remove(value, indicator_type)
+        for value, indicator_type in added:
+            self._add(value, indicator_type)
+
+        self.synced_at = synced_at
+        logger.debug("Synced whitelist: %d entries added, %d removed.", len(added), len(removed))
+        return len(added), len(removed)
+
+    def add(self, indicators):
+        """
+        Adds entries, i.e. those returned by |add_terms_to_whitelist|, without waiting for the next sync.
+
+        :param indicators: |Indicator| objects, or values (which then match with any type).
+        """
+
+        for indicator in indicators:
+            if isinstance(indicator, Indicator):
+                self._add(normalize(indicator.value), indicator.type)
+            else:
+                self._add(normalize(indicator), None)
+
+    def remove(self, indicators):
+        """
+        Removes entries, i.e. one deleted with |delete_indicator_from_whitelist|, without waiting for the next sync.
+
+        :param indicators: |Indicator| objects, or values.
+        """
+
+        for indicator in indicators:
+            if isinstance(indicator, Indicator):
+                self._remove(normalize(indicator.value), indicator.type)
+            else:
+                self._remove(normalize(indicator), None)
+
+    def _add(self, value, indicator_type):
+        with self._lock:
+            types = self._values.setdefault(value, set())
+            if indicator_type in types:
+                return
+            types.add(indicator_type)
+
+            if indicator_type in _DOMAIN_TYPES and '://' not in value:
+                host = get_host(value)
+                if host is not None and '.' in host and parse_network(host) is None:
+                    self._domains.add(host)
+            if indicator_type in _NETWORK_TYPES:
+                network = parse_network(value)
+                if network is not None:
+                    version, address, prefix_length = network
+                    bits = 32 if version == 4 else 128
+                    self._networks.setdefault((version, prefix_length), set()).add(address >> (bits - prefix_length))
+
+    def _remove(self, value, indicator_type):
+        with self._lock:
+            types = self._values.get(value)
+            if types is None or indicator_type not in types:
+                return
+            types.discard(indicator_type)
+            if not types:
+                del self._values[value]
+
+            # a value may be whitelisted with several types; it keeps matching for as long as one of them does
+            if indicator_type in _DOMAIN_TYPES and not types.intersection(_DOMAIN_TYPES) and '://' not in value:
+                host = get_host(value)
+                if host is not None:
+                    self._domains.discard(host)
+            if indicator_type in _NETWORK_TYPES and not types.intersection(_NETWORK_TYPES):
+                network = parse_network(value)
+                if network is not None:
+                    version, address, prefix_length = network
+                    bits = 32 if version == 4 else 128
+                    networks = self._networks.get((version, prefix_length))
+                    if networks is not None:
+                        networks.discard(address >> (bits - prefix_length))
+                        if not networks:
+                            del self._networks[(version, prefix_length)]
+
+    def matches(self, value, indicator_type=None):
+        """
+        :param value: A value, or an |Indicator| (whose type is then used, if it has one).
+        :param str indicator_type: The |IndicatorType| of the value; if ``None``, entries of any type match.
+        :return: Whether the value is whitelisted.
+        """
+
+        if isinstance(value, Indicator):
+            indicator_type = indicator_type or value.type
+            value = value.value
+        value = normalize(value)
+
+        types = self._values.get(value)
+        if types is not None and (indicator_type is None or indicator_type in types or None in types):
+            return True
+
+        if self._domains and indicator_type in _DOMAIN_TYPES:
+            host = get_host(value)
+            while host:
+                if host in self._domains:
+                    return True
+                host = host.partition('.')[2]
+
+        if self._networks and indicator_type in _NETWORK_TYPES:
+            network = parse_network(value)
+            if network is not None:
+                version, address, prefix_length = network
+                bits = 32 if version == 4 else 128
+                # a copy, since a sync may change the dictionary meanwhile
+                for (network_version, network_length), networks in list(self._networks.items()):
+                    if network_version == version and network_length <= prefix_length \
+                            and address >> (bits - network_length) in networks:
+                        return True
+
+        return False
+
+    __contains__ = matches
+
+    def filter(self, indicators):
+        """
+        :param indicators: Values, or |Indicator| objects.
+        :return: The indicators that aren't whitelisted, in the same order.
+        """
+
+        return [indicator for indicator in indicators if not self.matches(indicator)]
+
+    def __len__(self):
+        """
+        The number of entries, counting a value whitelisted with several types once per type.
+        """
+
+        return sum(len(types) for types in list(self._values.values()))